@@ -0,0 +1,51 @@
+"""Measures `AzureKeyVault.get_secrets` wall-clock time against a fake vault.
+
+Every `get_secret` call sleeps for a fixed latency to emulate an HTTPS
+round-trip. Wall time should scale with secrets / workers rather than with
+the number of secrets alone.
+
+Usage:
+    python -m benchmarks.keyvault_bench
+"""
+
+from types import SimpleNamespace
+
+import time
+
+from cloudforge import keyvault
+from cloudforge.keyvault import AzureKeyVault
+
+LATENCY = 0.005
+VAULT_SIZES = (50, 300)
+WORKERS = (1, 4, 16, 32)
+
+
+class LatencySecretClient:
+    secrets = {}
+
+    def __init__(self, vault_url, credential=None, **kwargs):
+        pass
+
+    def list_properties_of_secrets(self):
+        return [SimpleNamespace(name=name) for name in self.secrets]
+
+    def get_secret(self, name):
+        time.sleep(LATENCY)
+        return SimpleNamespace(name=name, value=self.secrets[name])
+
+
+def main() -> None:
+    keyvault.SecretClient = LatencySecretClient
+
+    print(f"{'secrets':>8} {'workers':>8} {'wall (s)':>10}")
+    for size in VAULT_SIZES:
+        LatencySecretClient.secrets = {f"secret{i}": str(i) for i in range(size)}
+        for workers in WORKERS:
+            akv = AzureKeyVault("bench", credential=None, max_workers=workers)
+            start = time.perf_counter()
+            akv.get_secrets()
+            print(f"{size:>8} {workers:>8} {time.perf_counter() - start:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
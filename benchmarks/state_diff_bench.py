@@ -0,0 +1,70 @@
+"""Measures `Tfstate.diff` between two snapshots of a large state.
+
+Only the resources that changed are compared attribute by attribute, the rest
+are skipped on a hash of their attributes, so diffing should take a few
+seconds even for 50k resources.
+
+Usage:
+    python -m benchmarks.state_diff_bench
+"""
+
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import json
+import time
+
+from cloudforge.terraform_exec import Tfstate
+
+N_RESOURCES = (5000, 50000)
+CHANGED_EVERY = 100
+
+
+def _write_state(fpath: Path, n: int, serial: int) -> None:
+    resources = []
+    for i in range(n):
+        attributes = {
+            "id": f"/subscriptions/0000/resourceGroups/rg/providers/x/r{i}",
+            "name": f"r{i}",
+            "location": "westeurope",
+            "tags": {"env": "dev", "owner": "platform", "serial": str(i)},
+            "network_rules": [{"default_action": "Deny", "ip_rules": ["10.0.0.0/8"]}],
+        }
+        if serial > 1 and i % CHANGED_EVERY == 0:
+            attributes["tags"]["env"] = "stg"
+        resources.append(
+            {
+                "mode": "managed",
+                "type": f"azurerm_type{i % 50}",
+                "name": f"r{i}",
+                "instances": [{"attributes": attributes}],
+            }
+        )
+    fpath.write_text(
+        json.dumps(
+            {"version": 4, "serial": serial, "lineage": "x", "resources": resources}
+        )
+    )
+
+
+def main() -> None:
+    with TemporaryDirectory() as tmpdir:
+        print(f"{'resources':>10} {'load (s)':>10} {'diff (s)':>10} {'changes':>8}")
+        for n in N_RESOURCES:
+            before, after = Path(tmpdir) / "a.tfstate", Path(tmpdir) / "b.tfstate"
+            _write_state(before, n, 1)
+            _write_state(after, n, 2)
+
+            started = time.perf_counter()
+            a, b = Tfstate.load_file(str(before)), Tfstate.load_file(str(after))
+            a.addresses, b.addresses
+            loaded = time.perf_counter()
+            changes = [c.format() for c in a.diff(b)]
+            done = time.perf_counter()
+            print(
+                f"{n:>10} {loaded - started:>10.2f} {done - loaded:>10.2f} {len(changes):>8}"
+            )
+
+
+if __name__ == "__main__":
+    main()
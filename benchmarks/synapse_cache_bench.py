@@ -0,0 +1,52 @@
+"""Measures `cf az syn convert` conversion with a warm `ConversionCache`.
+
+A cold run parses and converts all 5,000 artifacts and fills the cache. A warm
+run only hashes the artifacts and splices their cached fragments into the
+template, and after a change only the changed artifacts are converted again.
+
+Usage:
+    python -m benchmarks.synapse_cache_bench
+"""
+
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Optional
+
+import json
+import time
+
+from benchmarks.synapse_load_bench import _build_workspace, _pipeline
+from cloudforge.azure.cache import ConversionCache
+from cloudforge.azure.synapse import SynManager
+
+N_CHANGED = 10
+
+
+def _convert(root: Path, cache: Optional[ConversionCache]) -> float:
+    started = time.perf_counter()
+    synm = SynManager("ws", root / "workspace", cache=cache)
+    synm.convert_to_arm_objs().to_arm_text()
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    with TemporaryDirectory() as tmpdir:
+        root = Path(tmpdir)
+        (root / "workspace").mkdir()
+        _build_workspace(root / "workspace")
+        cache = ConversionCache(root / "cache")
+
+        print(f"{'run':>22} {'convert (s)':>12}")
+        print(f"{'no cache':>22} {_convert(root, None):>12.2f}")
+        print(f"{'cold':>22} {_convert(root, cache):>12.2f}")
+        print(f"{'warm':>22} {_convert(root, cache):>12.2f}")
+        for i in range(N_CHANGED):
+            jdata = _pipeline(i)
+            jdata["properties"]["description"] = "changed"
+            fpath = root / "workspace" / "pipeline" / f"pipeline{i}.json"
+            fpath.write_text(json.dumps(jdata))
+        print(f"{f'{N_CHANGED} changed':>22} {_convert(root, cache):>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Measures `SynResource.populate_dependencies` on growing pipelines.
+
+References are de-duplicated through a hashed set, so extraction time should
+grow linearly with the number of activities, and therefore of references,
+rather than quadratically.
+
+Usage:
+    python -m benchmarks.synapse_deps_bench
+"""
+
+import timeit
+
+from cloudforge.azure.synapse import SynPipeline
+
+N_ACTIVITIES = (100, 500, 2000, 5000)
+REFS_PER_ACTIVITY = 4
+
+
+def _pipeline(n: int) -> SynPipeline:
+    activities = []
+    for i in range(n):
+        activities.append(
+            {
+                "name": f"copy {i}",
+                "type": "Copy",
+                "dependsOn": [{"activity": f"copy {i - 1}"}] if i else [],
+                "inputs": [
+                    {"referenceName": f"in{i}_{j}", "type": "DatasetReference"}
+                    for j in range(REFS_PER_ACTIVITY - 1)
+                ],
+                "outputs": [
+                    # every activity writes to the same sink: repeated references
+                    {"referenceName": "sink", "type": "DatasetReference"}
+                ],
+                "typeProperties": {
+                    "source": {"type": "ParquetSource", "recursive": True},
+                    "sink": {"type": "ParquetSink", "settings": {"copyBehavior": 1}},
+                },
+            }
+        )
+    return SynPipeline({"name": f"p{n}", "properties": {"activities": activities}})
+
+
+def main() -> None:
+    print(f"{'activities':>10} {'deps':>8} {'extract (ms)':>13} {'us/activity':>12}")
+    for n in N_ACTIVITIES:
+        pipeline = _pipeline(n)
+        elapsed = min(timeit.repeat(pipeline.populate_dependencies, number=5, repeat=3))
+        ms = elapsed / 5 * 1000
+        print(
+            f"{n:>10} {len(pipeline.deptracker):>8} {ms:>13.2f} {ms * 1000 / n:>12.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Measures `SynManager` loading a synthetic 5,000 artifact Synapse workspace.
+
+Artifacts are parsed and built on a worker pool. Parsing holds the GIL, so
+threads barely beat a single worker; processes spread it over the CPUs, but
+the resources they build are pickled back and unpickled by the parent, which
+costs nearly as much as parsing them in the first place.
+Both pools also run with 4 workers, so their overhead shows on small hosts.
+
+Usage:
+    python -m benchmarks.synapse_load_bench
+"""
+
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import json
+import os
+import time
+
+from cloudforge.azure.synapse import SynManager
+
+N_PIPELINES = 3000
+N_NOTEBOOKS = 1500
+N_DATASETS = 500
+ACTIVITIES_PER_PIPELINE = 20
+CELLS_PER_NOTEBOOK = 40
+
+
+def _pipeline(i: int) -> dict:
+    activities = []
+    for j in range(ACTIVITIES_PER_PIPELINE):
+        activities.append(
+            {
+                "name": f"copy {j}",
+                "type": "Copy",
+                "dependsOn": [{"activity": f"copy {j - 1}"}] if j else [],
+                "inputs": [
+                    {
+                        "referenceName": f"dataset{(i + j) % N_DATASETS}",
+                        "type": "DatasetReference",
+                    }
+                ],
+                "typeProperties": {
+                    "source": {"type": "ParquetSource", "recursive": True},
+                    "sink": {"type": "ParquetSink"},
+                },
+            }
+        )
+    return {"name": f"pipeline{i}", "properties": {"activities": activities}}
+
+
+def _notebook(i: int) -> dict:
+    cells = [
+        {"cell_type": "code", "source": [f"df{j} = spark.read.parquet('p{j}')\r\n"]}
+        for j in range(CELLS_PER_NOTEBOOK)
+    ]
+    return {
+        "name": f"notebook{i}",
+        "properties": {
+            "metadata": {"language_info": {"name": "python"}},
+            "cells": cells,
+        },
+    }
+
+
+def _dataset(i: int) -> dict:
+    return {
+        "name": f"dataset{i}",
+        "properties": {
+            "linkedServiceName": {
+                "referenceName": "ws-WorkspaceDefaultStorage",
+                "type": "LinkedServiceReference",
+            },
+            "type": "Parquet",
+        },
+    }
+
+
+def _build_workspace(root: Path) -> None:
+    for rtype, n, build in (
+        ("pipeline", N_PIPELINES, _pipeline),
+        ("notebook", N_NOTEBOOKS, _notebook),
+        ("dataset", N_DATASETS, _dataset),
+    ):
+        (root / rtype).mkdir()
+        for i in range(n):
+            jdata = build(i)
+            (root / rtype / f"{jdata['name']}.json").write_text(json.dumps(jdata))
+
+
+def main() -> None:
+    cpus = os.cpu_count() or 1
+    with TemporaryDirectory() as tmpdir:
+        root = Path(tmpdir)
+        _build_workspace(root)
+
+        print(f"{'pool':>8} {'workers':>8} {'load (s)':>10} {'convert (s)':>12}")
+        runs = [(False, 1)]
+        for workers in sorted({4, cpus} - {1}):
+            runs += [(False, workers), (True, workers)]
+        for processes, workers in runs:
+            started = time.perf_counter()
+            synm = SynManager("ws", root, max_workers=workers, processes=processes)
+            loaded = time.perf_counter()
+            synm.convert_to_arm_objs().to_arm_json()
+            done = time.perf_counter()
+            pool = "process" if processes else "thread"
+            print(
+                f"{pool:>8} {workers:>8} {loaded - started:>10.2f} {done - loaded:>12.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
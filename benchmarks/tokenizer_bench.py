@@ -0,0 +1,51 @@
+"""Measures `Tokenizer.replace_and_validate_tokens` against growing vault sizes.
+
+Render time should stay flat as the number of secrets grows, since every file
+is scanned once regardless of how many tokens are supplied.
+
+Usage:
+    python -m benchmarks.tokenizer_bench
+"""
+
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import timeit
+
+from cloudforge.tokenizer import Tokenizer
+
+N_FILES = 50
+TOKENS_PER_FILE = 20
+VAULT_SIZES = (TOKENS_PER_FILE, 200, 2000, 10000)
+
+
+def _build_tree(root: Path) -> None:
+    for i in range(N_FILES):
+        body = "\n".join(
+            f'resource "x" "r{i}_{j}" {{ value = "{{{{__SECRET{j}__}}}}" }}'
+            for j in range(TOKENS_PER_FILE)
+        )
+        (root / f"main{i}.tf").write_text(body * 10)
+
+
+def main() -> None:
+    with TemporaryDirectory() as tmpdir:
+        root = Path(tmpdir)
+        _build_tree(root)
+        tokenizer = Tokenizer(root_dir=root, ext="tf").read_root()
+
+        print(f"{'secrets':>10} {'render (ms)':>12}")
+        for size in VAULT_SIZES:
+            tokens = {f"SECRET{i}": f"value-{i}" for i in range(size)}
+            elapsed = min(
+                timeit.repeat(
+                    lambda: tokenizer.replace_and_validate_tokens(tokens),
+                    number=5,
+                    repeat=3,
+                )
+            )
+            print(f"{size:>10} {elapsed / 5 * 1000:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 from pathlib import Path
 from datetime import datetime
 import logging
+import os
 import tempfile
 
 __packagename__ = "cloudforge"
@@ -12,6 +13,12 @@ TMP_DIR = Path(tempfile.gettempdir())
 TFPY_DIR_BASE_NAME = ".terraform-py"
 TMP_PATH = TMP_DIR / TFPY_DIR_BASE_NAME
 
+# persistent artifacts (terraform binaries, indexes, ...) shared between runs
+CACHE_DIR = Path(
+    os.getenv("CLOUDFORGE_CACHE_DIR", Path.home() / ".cache" / __packagename__)
+)
+TF_WORKDIRS_PATH = CACHE_DIR / "workdirs"
+
 
 class UnsupportedDevEnvironment(Exception):
     pass
@@ -49,6 +49,9 @@ class AzDependency:
     def __neq__(self, other):
         return not self.__eq__(other)
 
+    def __hash__(self):
+        return hash((self.name, self.type, self.ignore))
+
     def __repr__(self):
         return self.formatARM()
 
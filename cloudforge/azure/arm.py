@@ -1,5 +1,31 @@
-from typing import List
+from typing import Dict, List, Optional
 from . import ARM_SCHEMA, ARM_VERSION, AzDependency, AzResource, logger
+from .graph import DependencyGraph
+
+import json
+import re
+
+# stands in for a pre-serialized JSON fragment while the text around it is serialized
+_FRAGMENT = "__cloudforge_fragment_{}__"
+_INDENT_RE = re.compile(r" *")
+
+
+def _splice(text: str, fragments: Dict[str, str]) -> str:
+    """
+    Replaces the quoted placeholders in indented JSON text with fragments, indented to match.
+    The placeholders are given in the order they appear in the text.
+    """
+    parts = []
+    end = 0
+    for placeholder, fragment in fragments.items():
+        at = text.index('"%s"' % placeholder, end)
+        line_start = text.rindex("\n", 0, at) + 1
+        indent = _INDENT_RE.match(text, line_start).group()
+        parts.append(text[end:at])
+        parts.append(fragment.replace("\n", "\n" + indent))
+        end = at + len(placeholder) + 2
+    parts.append(text[end:])
+    return "".join(parts)
 
 
 class ArmTemplate:
@@ -30,8 +56,50 @@ class ArmResource(AzResource):
         self.depends_on: List[AzDependency] = []
         self.api_version = ARM_VERSION
         self.type = ""
+        self._properties_json: Optional[str] = None
         super().__init__(name, properties)
 
+    @classmethod
+    def from_fragment(
+        cls, name: str, properties_json: str, depends_on: List[AzDependency]
+    ) -> "ArmResource":
+        """
+        Rebuilds a converted resource from its serialized properties, e.g. out of a cache.
+
+        The properties are only parsed when they are read, `to_arm_text` splices the text as is.
+
+        Args:
+            name (str): The name of the resource.
+            properties_json (str): The properties, as serialized by `properties_json`.
+            depends_on (List[AzDependency]): The dependencies of the resource.
+
+        Returns:
+            ArmResource: The resource.
+        """
+        resource = cls(name=name, properties=None)
+        resource._properties_json = properties_json
+        resource.depends_on = list(depends_on)
+        return resource
+
+    @property
+    def properties(self) -> dict:
+        if self._properties is None and self._properties_json is not None:
+            self._properties = json.loads(self._properties_json)
+            # the parsed properties may be changed, so the text no longer holds
+            self._properties_json = None
+        return self._properties
+
+    @properties.setter
+    def properties(self, value: dict) -> None:
+        self._properties = value
+        self._properties_json = None
+
+    def properties_json(self) -> str:
+        """The properties serialized as indented JSON."""
+        if self._properties_json is not None:
+            return self._properties_json
+        return json.dumps(self._properties, indent=2)
+
     def add_dep(self, *deps: AzDependency):
         for dep in deps:
             if not isinstance(dep, AzDependency):
@@ -58,6 +126,20 @@ class ArmResource(AzResource):
             "dependsOn": self.get_dependencies(prefix=prefix),
         }
 
+    def to_arm_text(self, prefix="") -> str:
+        """Serializes `to_arm_json` with an indent of 2, without parsing cached properties."""
+        placeholder = _FRAGMENT.format(0)
+        jdata = {
+            "name": self.workspace_name + "/" + self.name,
+            "type": self.workspace_id,
+            "apiVersion": self.api_version,
+            "properties": placeholder,
+            "dependsOn": self.get_dependencies(prefix=prefix),
+        }
+        return _splice(
+            json.dumps(jdata, indent=2), {placeholder: self.properties_json()}
+        )
+
     def __eq__(self, other) -> bool:
         return (
             self.type == other.type
@@ -163,9 +245,20 @@ class SynArmTemplate(ArmTemplate):
         resource.workspace_name = self.workspace_name
         self._resources.append(resource)
 
+    def dependency_graph(self) -> DependencyGraph:
+        """The dependency graph of the resources added so far."""
+        return DependencyGraph(self._resources)
+
     def to_arm_json(self):
+        """
+        Serializes the template, resources ordered so that each follows its dependencies.
+
+        Raises:
+            DependencyGraphError: If a resource references a missing one, or resources depend
+                on each other in a cycle.
+        """
         depends_on = []
-        for resource in self._resources:
+        for resource in self.dependency_graph().order():
             prefix = self.workspaceId + "/" + self.workspace_name
             depends_on_str = resource.to_arm_json(prefix=prefix)
             depends_on.append(depends_on_str)
@@ -175,3 +268,25 @@ class SynArmTemplate(ArmTemplate):
             "contentVersion": self._content_version,
             "resources": depends_on,
         }
+
+    def to_arm_text(self) -> str:
+        """
+        Serializes the template like `json.dumps(self.to_arm_json(), indent=2)`.
+
+        Resources rebuilt from cached fragments are spliced in as text, so a template
+        assembled from the cache is written without parsing and serializing it again.
+
+        Raises:
+            DependencyGraphError: See `to_arm_json`.
+        """
+        prefix = self.workspaceId + "/" + self.workspace_name
+        fragments = {
+            _FRAGMENT.format(i): resource.to_arm_text(prefix=prefix)
+            for i, resource in enumerate(self.dependency_graph().order())
+        }
+        jdata = {
+            "$schema": self._schema,
+            "contentVersion": self._content_version,
+            "resources": list(fragments),
+        }
+        return _splice(json.dumps(jdata, indent=2), fragments)
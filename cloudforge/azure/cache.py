@@ -0,0 +1,181 @@
+"""
+The cache module keeps converted Synapse artifacts between runs of `cf az syn convert`, so only the
+artifacts that changed are parsed and converted again.
+
+An entry is keyed by the SHA256 of the artifact, i.e. its file content after the deployment actions
+were applied, so a change to either is a miss. The resource type and the cloudforge version are part
+of the key as well. Key Vault tokens are left in the artifact and only substituted once it is read
+back, see `SynManager`, so no secret is written to the cache.
+
+Layout:
+    <cache_dir>/
+        v<CACHE_FORMAT>/
+            <key[:2]>/<key>    a JSON header line, name and dependencies, then the converted
+                               properties as indented JSON
+
+Entries are written to a temporary file and renamed into place, so concurrent runs never read a
+half-written entry. When the entries exceed `max_bytes` the least recently used ones are evicted,
+and the entries of other formats are removed.
+
+Example Usage:
+cache = ConversionCache()
+synm = SynManager(workspace_name, syn_dir, cache=cache)
+text = synm.convert_to_arm_objs().to_arm_text()
+cache.prune()
+"""
+
+from pathlib import Path
+from typing import Optional
+
+import hashlib
+import json
+import os
+import shutil
+
+from . import RESOURCE_MAP, SYN_RESOURCE_TO_OBJ, AzDependency, logger
+from . import arm
+from .. import CACHE_DIR, __version__
+
+# bump when the entry layout or the conversion output changes
+# 2: artifacts are cached before token substitution, 1 held rendered secrets
+CACHE_FORMAT = 2
+DEFAULT_MAX_CONVERSION_CACHE_BYTES = 512 * 1024**2
+
+
+def _arm_class(rtype: str) -> type:
+    return getattr(arm, RESOURCE_MAP[SYN_RESOURCE_TO_OBJ[rtype]])
+
+
+class ConversionCache:
+    """
+    A size-bounded cache of Synapse artifacts converted to ARM resources.
+
+    Args:
+        cache_dir (Path, optional): The root of the cache. Defaults to `<CACHE_DIR>/synapse`.
+        max_bytes (int): The maximum total size of the entries kept by `prune`.
+
+    Attributes:
+        root (Path): The root of the cache.
+        entries_dir (Path): The directory of the entries of the current format.
+        max_bytes (int): The maximum total size of the entries.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Optional[Path] = None,
+        max_bytes: int = DEFAULT_MAX_CONVERSION_CACHE_BYTES,
+    ) -> None:
+        self.root: Path = Path(cache_dir) if cache_dir else CACHE_DIR / "synapse"
+        self.entries_dir: Path = self.root / f"v{CACHE_FORMAT}"
+        self.max_bytes: int = max_bytes
+
+    @staticmethod
+    def key(rtype: str, data: bytes) -> str:
+        """
+        Builds the cache key of a rendered artifact.
+
+        Args:
+            rtype (str): The resource type, a key of `SYN_RESOURCE_TO_OBJ`.
+            data (bytes): The artifact file content.
+
+        Returns:
+            str: The cache key.
+        """
+        digest = hashlib.sha256(f"{CACHE_FORMAT}\0{__version__}\0{rtype}\0".encode())
+        digest.update(data)
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.entries_dir / key[:2] / key
+
+    def get(self, key: str, rtype: str) -> Optional[arm.ArmResource]:
+        """
+        Looks up a converted resource and marks it as recently used.
+
+        Args:
+            key (str): The cache key, see `key`.
+            rtype (str): The resource type.
+
+        Returns:
+            ArmResource: The resource, its properties left unparsed, or `None` on a cache miss.
+        """
+        fpath = self._path(key)
+        try:
+            text = fpath.read_text(encoding="utf-8")
+            os.utime(fpath)
+        except OSError:
+            return None
+        header, _, properties_json = text.partition("\n")
+        try:
+            entry = json.loads(header)
+        except ValueError:
+            return None
+
+        deps = [
+            AzDependency(name, type_, ignore) for name, type_, ignore in entry["deps"]
+        ]
+        return _arm_class(rtype).from_fragment(entry["name"], properties_json, deps)
+
+    def put(self, key: str, resource: arm.ArmResource) -> None:
+        """
+        Stores a converted resource.
+
+        Args:
+            key (str): The cache key, see `key`.
+            resource (ArmResource): The resource.
+        """
+        header = {
+            "name": resource.name,
+            "deps": [[d.name, d.type, d.ignore] for d in resource.depends_on],
+        }
+        fpath = self._path(key)
+        fpath.parent.mkdir(parents=True, exist_ok=True)
+
+        tmp = fpath.with_name(f".{key}.{os.getpid()}.tmp")
+        tmp.write_text(
+            json.dumps(header) + "\n" + resource.properties_json(), encoding="utf-8"
+        )
+        os.replace(tmp, fpath)
+
+    def prune(self) -> int:
+        """
+        Evicts the least recently used entries until the rest fit in `max_bytes`.
+
+        The entries of other formats, which are never read, are removed first.
+
+        Returns:
+            int: The number of entries evicted, other formats not included.
+        """
+        if not self.root.is_dir():
+            return 0
+
+        for stale in self.root.iterdir():
+            if stale.is_dir() and stale != self.entries_dir:
+                logger.debug(f"Removing synapse conversion cache entries: {stale}")
+                shutil.rmtree(stale, ignore_errors=True)
+
+        entries = []
+        for fpath in self.entries_dir.glob("*/*"):
+            if fpath.name.startswith("."):
+                continue
+            try:
+                stat = fpath.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, fpath))
+
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, fpath in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                fpath.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+            evicted += 1
+
+        if evicted:
+            logger.debug(f"Evicted {evicted} synapse conversion cache entries")
+        return evicted
@@ -0,0 +1,139 @@
+import json
+import os
+import pytest
+from pathlib import Path
+
+from .arm import ArmSynPipeline
+from .cache import ConversionCache
+from ..tokenizer import Tokenizer
+from .synapse import SynManager
+from .synapse_test import _pipeline
+
+
+@pytest.fixture
+def workspace(tmpdir):
+    syn_dir = Path(tmpdir) / "ws"
+    (syn_dir / "pipeline").mkdir(parents=True)
+    (syn_dir / "notebook").mkdir()
+    for name, refs in [("extract", []), ("load", ["extract"]), ("report", ["load"])]:
+        jdata = _pipeline(name, refs)
+        jdata["properties"]["description"] = 'multi\nline "text"'
+        (syn_dir / "pipeline" / f"{name}.json").write_text(json.dumps(jdata))
+    notebook = {"name": "explore", "properties": {"cells": [{"source": ["x = 1"]}]}}
+    (syn_dir / "notebook" / "explore.json").write_text(json.dumps(notebook))
+    yield syn_dir, ConversionCache(Path(tmpdir) / "cache")
+
+
+def _convert(syn_dir, cache):
+    synm = SynManager("ws", syn_dir, max_workers=2, cache=cache)
+    return synm, synm.convert_to_arm_objs()
+
+
+def test_unchanged_artifacts_are_not_converted_again(workspace):
+    syn_dir, cache = workspace
+    expected = json.dumps(_convert(syn_dir, None)[1].to_arm_json(), indent=2)
+
+    synm, armt = _convert(syn_dir, cache)
+    assert synm.cached == 0
+    assert armt.to_arm_text() == expected
+
+    synm, armt = _convert(syn_dir, cache)
+    assert synm.cached == 4
+    assert all(not resources for resources in synm.resources.values())
+    assert armt.to_arm_text() == expected
+    assert json.dumps(armt.to_arm_json(), indent=2) == expected
+
+    (syn_dir / "pipeline" / "report.json").write_text(
+        json.dumps(_pipeline("report", ["extract"]))
+    )
+    synm, armt = _convert(syn_dir, cache)
+    assert synm.cached == 3
+    assert [r.name for r in synm.resources["pipeline"]] == ["report"]
+    report = json.loads(armt.to_arm_text())["resources"][-1]
+    assert report["dependsOn"] == ["Microsoft.Synapse/workspaces/ws/pipelines/extract"]
+
+
+def test_fragment_properties_are_parsed_on_read():
+    resource = ArmSynPipeline.from_fragment("p", '{\n  "a": [\n    1\n  ]\n}', [])
+
+    assert resource.properties_json() == '{\n  "a": [\n    1\n  ]\n}'
+    resource.properties["a"].append(2)
+    assert json.loads(resource.properties_json()) == {"a": [1, 2]}
+
+
+def test_prune_evicts_least_recently_used(workspace):
+    syn_dir, cache = workspace
+    _convert(syn_dir, cache)
+    entries = sorted(cache.entries_dir.glob("*/*"))
+    for age, fpath in enumerate(entries):
+        os.utime(fpath, (1000 + age, 1000 + age))
+    cache.max_bytes = sum(f.stat().st_size for f in entries[2:])
+
+    assert cache.prune() == 2
+    assert sorted(cache.entries_dir.glob("*/*")) == entries[2:]
+
+
+@pytest.mark.parametrize("processes", [False, True])
+def test_entries_hold_tokens_not_secrets(workspace, processes):
+    syn_dir, cache = workspace
+    load = _pipeline("load", ["{{__Upstream__}}"])
+    load["properties"]["description"] = "{{__Secret__}}"
+    (syn_dir / "pipeline" / "load.json").write_text(json.dumps(load))
+    # only valid JSON once rendered
+    report = _pipeline("report", ["load"])
+    report["properties"]["retries"] = "{{__Retries__}}"
+    (syn_dir / "pipeline" / "report.json").write_text(
+        json.dumps(report).replace('"{{__Retries__}}"', "{{__Retries__}}")
+    )
+    source_tree = Tokenizer(syn_dir, "json").read_root().tree
+
+    def convert(tokens):
+        synm = SynManager(
+            "ws",
+            syn_dir,
+            max_workers=2,
+            processes=processes,
+            cache=cache,
+            tree=source_tree,
+            tokens=tokens,
+        )
+        return synm, json.loads(synm.convert_to_arm_objs().to_arm_text())
+
+    def rendered(tokens):
+        tree = {
+            fpath: Tokenizer.substitute(content, tokens)
+            for fpath, content in source_tree.items()
+        }
+        synm = SynManager("ws", syn_dir, tree=tree)
+        return json.loads(synm.convert_to_arm_objs().to_arm_text())
+
+    tokens = {"Upstream": "extract", "Secret": "s3cr3t-value", "Retries": "3"}
+    synm, armt = convert(tokens)
+    assert synm.cached == 0
+    assert armt == rendered(tokens)
+    load = [r for r in armt["resources"] if r["name"] == "ws/load"][0]
+    assert load["properties"]["description"] == "s3cr3t-value"
+    assert load["dependsOn"] == ["Microsoft.Synapse/workspaces/ws/pipelines/extract"]
+    for fpath in cache.root.rglob("*"):
+        if fpath.is_file():
+            assert "s3cr3t" not in fpath.read_text()
+
+    # a rotated secret is substituted into the cached resource, the report is never cached
+    tokens["Secret"] = "rotated"
+    synm, armt = convert(tokens)
+    assert synm.cached == 3
+    assert armt == rendered(tokens)
+    load = [r for r in armt["resources"] if r["name"] == "ws/load"][0]
+    assert load["properties"]["description"] == "rotated"
+
+
+def test_prune_removes_other_formats(workspace):
+    syn_dir, cache = workspace
+    legacy = cache.root / "ab" / ("ab" * 32)
+    legacy.parent.mkdir(parents=True)
+    legacy.write_text('{"name": "p", "deps": []}\n{"password": "secret"}')
+    _convert(syn_dir, cache)
+
+    assert cache.prune() == 0
+    assert not legacy.parent.exists()
+    assert len(list(cache.entries_dir.glob("*/*"))) == 4
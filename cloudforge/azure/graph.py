@@ -0,0 +1,213 @@
+"""
+The graph module orders Synapse resources by their dependencies.
+
+A DependencyGraph is built from `SynResource` or `ArmResource` objects. Resources and the references
+between them are keyed the way ARM addresses them, e.g. "/pipelines/load", so a reference matches the
+resource it names. References marked `ignore`, such as those to workspace defaults or pools, are not
+part of the graph, and neither are references to types that are not converted, e.g. sqlScripts or
+dataflows: those stay plain `dependsOn` entries of the template.
+
+Example Usage:
+graph = DependencyGraph(r for resources in synm.resources.values() for r in resources)
+for layer in graph.layers():
+    ...  # resources in a layer do not depend on each other
+resources = graph.order()
+
+graph = armt.dependency_graph()
+"""
+
+from typing import Any, Dict, Iterable, List
+
+from . import RESOURCE_MAP, AzDependency, logger
+
+
+def _key_type(key: str) -> str:
+    """Returns the type of a key, e.g. "pipelines" for "/pipelines/load"."""
+    return key.split("/")[1]
+
+
+# the types of the resources converted to ARM, references to any other are not resolved
+MANAGED_TYPES = frozenset(
+    _key_type(AzDependency("", name[len("Syn") :] + "Reference").formatARM())
+    for name in RESOURCE_MAP
+)
+
+
+class DependencyGraphError(Exception):
+    """
+    Exception raised when resources can not be ordered by their dependencies.
+    """
+
+    pass
+
+
+class CycleError(DependencyGraphError):
+    """
+    Exception raised when resources depend on each other in a cycle.
+
+    Args:
+        cycle (List[str]): The keys of the resources in the cycle, the first one repeated at the end.
+    """
+
+    def __init__(self, cycle: List[str]) -> None:
+        self.cycle = cycle
+        super().__init__(f"Dependency cycle: {' -> '.join(cycle)}")
+
+
+class DanglingReferenceError(DependencyGraphError):
+    """
+    Exception raised when resources depend on resources that do not exist.
+
+    Args:
+        missing (Dict[str, List[str]]): The keys of the missing resources, by the key of the resource referencing them.
+    """
+
+    def __init__(self, missing: Dict[str, List[str]]) -> None:
+        self.missing = missing
+        refs = [f"{key} -> {', '.join(deps)}" for key, deps in missing.items()]
+        super().__init__(f"Missing referenced resources: {'; '.join(refs)}")
+
+
+def resource_key(resource: Any) -> str:
+    """
+    Returns the key of a resource, the path ARM addresses it by within the workspace.
+
+    Args:
+        resource (Union[SynResource, ArmResource]): The resource.
+
+    Returns:
+        str: The key, e.g. "/pipelines/load".
+    """
+    if hasattr(resource, "deptracker"):
+        # e.g. SynLinkedService is referenced as LinkedServiceReference
+        ref_type = type(resource).__name__[len("Syn") :] + "Reference"
+        return AzDependency(resource.name, ref_type).formatARM()
+    return f"/{resource.__resource_type__}/{resource.name}"
+
+
+def _dependencies(resource: Any) -> List[AzDependency]:
+    if hasattr(resource, "deptracker"):
+        return list(resource.deptracker)
+    return list(resource.depends_on)
+
+
+class DependencyGraph:
+    """
+    The dependencies between Synapse resources.
+
+    Args:
+        resources (Iterable[Union[SynResource, ArmResource]]): The resources.
+
+    Attributes:
+        resources (Dict[str, Any]): The resources by key, in the order given.
+        dependencies (Dict[str, List[str]]): The keys each resource depends on, in reference order.
+        external (Dict[str, List[str]]): The references of each resource to types not in
+            `MANAGED_TYPES`, which are not edges of the graph.
+
+    Raises:
+        DependencyGraphError: If two resources have the same key.
+    """
+
+    def __init__(self, resources: Iterable[Any]) -> None:
+        self.resources: Dict[str, Any] = {}
+        self.dependencies: Dict[str, List[str]] = {}
+        self.external: Dict[str, List[str]] = {}
+        for resource in resources:
+            key = resource_key(resource)
+            if key in self.resources:
+                raise DependencyGraphError(f"Duplicate resource: {key}")
+            self.resources[key] = resource
+            deps = dict.fromkeys(
+                dep.formatARM() for dep in _dependencies(resource) if not dep.ignore
+            )
+            self.dependencies[key] = [d for d in deps if _key_type(d) in MANAGED_TYPES]
+            external = [d for d in deps if _key_type(d) not in MANAGED_TYPES]
+            if external:
+                logger.debug(f"Not resolving references of {key}: {external}")
+                self.external[key] = external
+
+    def dangling(self) -> Dict[str, List[str]]:
+        """
+        Lists the references to resources of a managed type that are not in the graph.
+
+        Returns:
+            Dict[str, List[str]]: The missing keys by the key of the resource referencing them.
+        """
+        missing = {}
+        for key, deps in self.dependencies.items():
+            absent = [dep for dep in deps if dep not in self.resources]
+            if absent:
+                missing[key] = absent
+        return missing
+
+    def layer_keys(self) -> List[List[str]]:
+        """
+        Groups the resource keys into layers, each depending only on the layers before it.
+
+        Resources within a layer do not depend on each other, so they could be deployed in
+        parallel. Layers are sorted by key.
+
+        Returns:
+            List[List[str]]: The layers, dependencies first.
+
+        Raises:
+            DanglingReferenceError: If a resource references one that is not in the graph.
+            CycleError: If resources depend on each other in a cycle.
+        """
+        missing = self.dangling()
+        if missing:
+            raise DanglingReferenceError(missing)
+
+        # Kahn's algorithm, one layer per round
+        waiting = {key: len(deps) for key, deps in self.dependencies.items()}
+        dependents: Dict[str, List[str]] = {key: [] for key in self.resources}
+        for key, deps in self.dependencies.items():
+            for dep in deps:
+                dependents[dep].append(key)
+
+        layers: List[List[str]] = []
+        ready = sorted(key for key, n in waiting.items() if n == 0)
+        while ready:
+            layers.append(ready)
+            unblocked = []
+            for key in ready:
+                del waiting[key]
+                for dependent in dependents[key]:
+                    waiting[dependent] -= 1
+                    if waiting[dependent] == 0:
+                        unblocked.append(dependent)
+            ready = sorted(unblocked)
+
+        if waiting:
+            raise CycleError(self._find_cycle(set(waiting)))
+        return layers
+
+    def _find_cycle(self, remaining: set) -> List[str]:
+        # every remaining resource depends on another remaining one, so following
+        # dependencies from any of them must come back around
+        key = min(remaining)
+        seen: Dict[str, int] = {}
+        path: List[str] = []
+        while key not in seen:
+            seen[key] = len(path)
+            path.append(key)
+            key = next(dep for dep in self.dependencies[key] if dep in remaining)
+        return path[seen[key] :] + [key]
+
+    def layers(self) -> List[List[Any]]:
+        """
+        Groups the resources into layers, see `layer_keys`.
+
+        Returns:
+            List[List[Union[SynResource, ArmResource]]]: The layers, dependencies first.
+        """
+        return [[self.resources[key] for key in layer] for layer in self.layer_keys()]
+
+    def order(self) -> List[Any]:
+        """
+        Orders the resources so that every resource comes after the resources it depends on.
+
+        Returns:
+            List[Union[SynResource, ArmResource]]: The resources, layer by layer.
+        """
+        return [resource for layer in self.layers() for resource in layer]
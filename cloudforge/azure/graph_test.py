@@ -0,0 +1,129 @@
+import json
+import pytest
+
+from . import AzDependency
+from .arm import ArmSynNotebook, ArmSynPipeline, SynArmTemplate
+from .graph import CycleError, DanglingReferenceError, DependencyGraph, resource_key
+from .synapse import SynLinkedService
+
+
+def _arm(cls, name, *refs):
+    resource = cls(name=name, properties={})
+    for ref in refs:
+        type_, _, ref_name = ref.partition(":")
+        resource.add_dep(AzDependency(ref_name, type_))
+    return resource
+
+
+def _pipeline(name, *refs):
+    return _arm(ArmSynPipeline, name, *(f"PipelineReference:{r}" for r in refs))
+
+
+def test_layers_and_order():
+    resources = [
+        _pipeline("report", "load", "extract"),
+        _pipeline("load", "extract"),
+        _pipeline("extract"),
+        _arm(ArmSynNotebook, "explore"),
+        _pipeline("audit", "extract", "extract"),
+    ]
+    graph = DependencyGraph(resources)
+
+    assert graph.layer_keys() == [
+        ["/notebooks/explore", "/pipelines/extract"],
+        ["/pipelines/audit", "/pipelines/load"],
+        ["/pipelines/report"],
+    ]
+    assert graph.dependencies["/pipelines/audit"] == ["/pipelines/extract"]
+    assert [r.name for r in graph.order()] == [
+        "explore",
+        "extract",
+        "audit",
+        "load",
+        "report",
+    ]
+
+
+def test_ignored_references_are_left_out():
+    pipeline = _pipeline("load")
+    pipeline.add_dep(AzDependency("pool", "BigDataPoolReference", ignore=True))
+
+    assert DependencyGraph([pipeline]).layer_keys() == [["/pipelines/load"]]
+
+
+def test_dangling_references():
+    graph = DependencyGraph(
+        [
+            _pipeline("load", "extract"),
+            _arm(ArmSynPipeline, "copy", "DatasetReference:sales"),
+        ]
+    )
+
+    with pytest.raises(DanglingReferenceError) as e:
+        graph.layers()
+    assert e.value.missing == {
+        "/pipelines/load": ["/pipelines/extract"],
+        "/pipelines/copy": ["/datasets/sales"],
+    }
+
+
+def test_cycle():
+    graph = DependencyGraph(
+        [
+            _pipeline("a", "b"),
+            _pipeline("b", "c"),
+            _pipeline("c", "b"),
+            _pipeline("d"),
+        ]
+    )
+
+    with pytest.raises(CycleError) as e:
+        graph.order()
+    assert e.value.cycle == ["/pipelines/b", "/pipelines/c", "/pipelines/b"]
+
+
+def test_syn_resources_are_keyed_like_references():
+    linked = SynLinkedService({"name": "lake", "properties": {}})
+
+    assert (
+        resource_key(linked)
+        == AzDependency("lake", "LinkedServiceReference").formatARM()
+    )
+    assert resource_key(linked) == "/linkedServices/lake"
+
+
+def test_template_is_emitted_in_dependency_order():
+    armt = SynArmTemplate(workspace_name="ws")
+    for resource in [_pipeline("b", "a"), _pipeline("c"), _pipeline("a", "c")]:
+        armt.add_resource(resource)
+
+    assert [r["name"] for r in armt.to_arm_json()["resources"]] == [
+        "ws/c",
+        "ws/a",
+        "ws/b",
+    ]
+
+
+def test_references_to_unconverted_types_are_kept():
+    pipeline = _arm(
+        ArmSynPipeline,
+        "p2",
+        "SqlScriptReference:s1",
+        "DataFlowReference:flow",
+        "PipelineReference:p1",
+    )
+    armt = SynArmTemplate(workspace_name="ws")
+    armt.add_resource(pipeline)
+    armt.add_resource(_pipeline("p1"))
+
+    graph = armt.dependency_graph()
+    assert graph.dangling() == {}
+    assert graph.external == {"/pipelines/p2": ["/sqlScripts/s1", "/dataFlows/flow"]}
+
+    resources = json.loads(armt.to_arm_text())["resources"]
+    assert [r["name"] for r in resources] == ["ws/p1", "ws/p2"]
+    assert resources[1]["dependsOn"] == [
+        "Microsoft.Synapse/workspaces/ws/sqlScripts/s1",
+        "Microsoft.Synapse/workspaces/ws/dataFlows/flow",
+        "Microsoft.Synapse/workspaces/ws/pipelines/p1",
+    ]
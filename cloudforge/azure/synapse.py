@@ -1,6 +1,7 @@
 from typing import List, Optional
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple, Union
 from azure.identity import ClientSecretCredential
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
 
 from . import (
@@ -13,16 +14,17 @@ from . import (
     VALID_SYNAPSE_RESOURCES,
     logger,
 )
-from .. import TMP_DIR
 from ..tokenizer import Tokenizer
 from ..utils import EnvConfiguration
 from ..keyvault import AzureKeyVault
 
 from .arm import *
 from .action import ActionTemplate, Action, ActionExecutioner
+from .cache import ConversionCache
 
 import pyjson5 as json5
 import json
+import os
 
 
 class SynapseActionTemplate(ActionTemplate):
@@ -59,57 +61,74 @@ class SynapseActionTemplate(ActionTemplate):
             self._map[rtype].extend(action_objs)
         return self
 
-    def process(self, for_env) -> Dict[Any, Any]:
+    def process(self, for_env, dump_dir: Optional[Path] = None) -> Dict[Any, Any]:
+        """
+        Applies the actions to the workspace and substitutes its tokens, in memory.
+
+        The workspace is read once; actions and token substitution work on the parsed
+        tree, which `SynManager` loads without touching the disk again.
+
+        Args:
+            for_env (str): The environment, whose configuration names the Key Vault.
+            dump_dir (Path, optional): Also write the rendered workspace to a unique
+                directory next to this path, for debugging.
+
+        Returns:
+            Dict[Any, Any]: The changed artifacts by resource type, under "resource_types",
+                the workspace name, the workspace directory and the rendered tree, by file
+                path, under "name", "syn_dir" and "tree", the tree before token substitution
+                and the token values under "source_tree" and "tokens", and with `dump_dir` the
+                directory written, under "tmpdir".
+        """
         changes = {"resource_types": {}}
 
         config = EnvConfiguration.load_env(for_env, self.syn_dir)
 
         # read current synapse workspace into memory
-        tokenizer = Tokenizer(root_dir=self.syn_dir, ext="json").read_root()
-
-        # create a tmp copy for mutation
-        tmpdir = tokenizer.dump_to(
-            tokenizer.tree, dirpath=TMP_DIR / ".synapse-workspace", unique=True
-        )
+        syn_dir = Path(self.syn_dir).absolute()
+        tokenizer = Tokenizer(root_dir=syn_dir, ext="json").read_root()
 
         for rtype, actions in self._map.items():
-            resource_dir = tmpdir / rtype
+            resource_dir = syn_dir / rtype
 
             changes["resource_types"][rtype] = []
 
             for action in actions:
-                filename = resource_dir / (action.name + ".json")
-                with open(filename, "r+") as f:
-                    target = json5.load(f)
-
-                    ae = ActionExecutioner()
-                    ae.execute(action, target)
+                filename = str(resource_dir / (action.name + ".json"))
+                if filename not in tokenizer.tree:
+                    raise FileNotFoundError(f"Action target not found: {filename}")
+                target = json5.loads(tokenizer.tree[filename])
 
-                    changes["resource_types"][rtype].append(ae.target)
+                ae = ActionExecutioner()
+                ae.execute(action, target)
 
-                with open(filename, "w") as f:
-                    modifiedTarget = ae.target
-                    logger.debug(f"Modifying......[{filename}]")
-                    json.dump(modifiedTarget, f, indent=2)
+                changes["resource_types"][rtype].append(ae.target)
 
-        # switch tokenizer root and read into memory
-        tokenizer.root_dir = tmpdir
-        tokenizer.read_root()
+                logger.debug(f"Modifying......[{filename}]")
+                tokenizer.tree[filename] = json.dumps(ae.target, indent=2)
 
         vault_name: str = config.get("KEY_VAULT_NAME")
 
         auth: ClientSecretCredential = ClientSecretCredential(
             **config.get_terraform_creds()
         )
-        tokens: Dict[str, str] = AzureKeyVault(vault_name, auth).get_secrets()
+        # get only the secrets referenced by the workspace from Key Vault
+        tokens: Dict[str, str] = AzureKeyVault(vault_name, auth).get_secrets(
+            names=tokenizer.collect_tokens() | {"SynapseWorkspaceName"}
+        )
 
-        # get secrets from Key Vault
         parsed_tree = tokenizer.replace_and_validate_tokens(tokens)
 
-        tmpdir = tokenizer.dump_to(parsed_tree, dirpath=tmpdir, unique=False)
+        if dump_dir is not None:
+            changes["tmpdir"] = tokenizer.dump_to(
+                parsed_tree, dirpath=Path(dump_dir), unique=True
+            ).absolute()
 
         changes["name"] = tokens["SynapseWorkspaceName"]
-        changes["tmpdir"] = tmpdir.absolute()
+        changes["syn_dir"] = syn_dir
+        changes["tree"] = parsed_tree
+        changes["source_tree"] = tokenizer.tree
+        changes["tokens"] = tokens
         return changes
 
     def __eq__(self, other):
@@ -119,39 +138,219 @@ class SynapseActionTemplate(ActionTemplate):
         return not self.__eq__(other)
 
 
+def _load_resource(
+    rtype: str,
+    source: Union[Path, str],
+    cache: Optional[ConversionCache] = None,
+    tokens: Optional[Dict[str, str]] = None,
+) -> Tuple[Optional[str], Union["SynResource", ArmResource]]:
+    """
+    Parses an artifact, a file or its content, and builds its resource, dependencies included.
+    With a cache, the converted resource is returned instead when the cache holds it, together
+    with the cache key.
+
+    With tokens, the artifact still holds them. A cached artifact is keyed, built and stored as
+    is, so the cache never holds their values: they are substituted once it is converted, see
+    `_render_resource`. An artifact that is only valid JSON once rendered is not cached.
+    """
+    if isinstance(source, Path):
+        with open(source, "rb") as f:
+            data = f.read()
+    else:
+        data = source.encode("utf-8")
+
+    key = None
+    if cache is not None:
+        key = cache.key(rtype, data)
+        armr = cache.get(key, rtype)
+        if armr is not None:
+            return key, armr if tokens is None else _render_resource(armr, tokens)
+
+    if tokens is not None and key is not None:
+        try:
+            jdata = json.loads(data)
+        except ValueError:
+            # e.g. a token standing for a number
+            key = None
+        else:
+            return key, SynManager.build_resource(rtype, jdata)
+
+    if tokens is not None:
+        data = Tokenizer.substitute(data.decode("utf-8"), tokens)
+    return key, SynManager.build_resource(rtype, json.loads(data))
+
+
+def _render_resource(armr: ArmResource, tokens: Dict[str, str]) -> ArmResource:
+    """
+    Substitutes the tokens of a converted resource in its name, properties and dependencies.
+
+    The properties are substituted as text, as the tokens of an artifact file are, so they are
+    not parsed again.
+    """
+    deps = []
+    for dep in armr.depends_on:
+        name = Tokenizer.substitute(dep.name, tokens)
+        ignore = dep.ignore or "WorkspaceDefault" in name
+        deps.append(AzDependency(name, dep.type, ignore=ignore))
+    return type(armr).from_fragment(
+        Tokenizer.substitute(armr.name, tokens),
+        Tokenizer.substitute(armr.properties_json(), tokens),
+        deps,
+    )
+
+
 class SynManager:
-    def __init__(self, workspace_name, syn_dir):
+    """
+    Loads the artifacts of a Synapse workspace directory, or of its files already in memory,
+    as `SynResource` objects.
+
+    Artifact files are parsed, and their resources built, on a pool of `max_workers`
+    workers. Resources keep the order of `VALID_SYNAPSE_RESOURCES` and, within a type,
+    of their file names, however many workers are used.
+
+    Args:
+        workspace_name (str): The name of the Synapse workspace.
+        syn_dir (Path): The workspace directory, one sub directory per resource type.
+        max_workers (int, optional): The number of workers. Defaults to the CPU count;
+            a value of 1 loads sequentially.
+        processes (bool): Use a process pool instead of a thread pool. Parsing is CPU bound,
+            so processes scale better on large workspaces at the cost of starting them.
+        cache (ConversionCache, optional): Artifacts found in the cache are neither parsed
+            nor converted again, the others are stored in it by `convert_to_arm_objs`.
+        tree (Dict[str, str], optional): The content of the workspace files by absolute path,
+            e.g. a rendered `Tokenizer` tree. Artifacts are then loaded from it instead of
+            being read from `syn_dir`.
+        tokens (Dict[str, str], optional): The values of the tokens the artifacts still hold,
+            e.g. a `Tokenizer` tree before substitution. Each artifact is rendered before it
+            is parsed or, with a cache, once it is converted, so the cache never stores them.
+
+    Attributes:
+        resources (Dict[str, List[SynResource]]): The resources parsed, by type. With a cache,
+            only those of the artifacts that missed it, and with tokens as well, before their
+            substitution.
+        cached (int): The number of artifacts found in the cache.
+        defaults (List[str]): The names of the "WorkspaceDefault" artifacts, whose
+            workspace name is replaced on conversion.
+    """
+
+    def __init__(
+        self,
+        workspace_name,
+        syn_dir,
+        max_workers: Optional[int] = None,
+        processes: bool = False,
+        cache: Optional[ConversionCache] = None,
+        tree: Optional[Dict[str, str]] = None,
+        tokens: Optional[Dict[str, str]] = None,
+    ):
         self.workspace_name = workspace_name
         self.resources = {k: [] for k in SYN_RESOURCE_TO_OBJ.keys()}
+        self.defaults: List[str] = []
+        self.cache = cache
+        self.cached = 0
+        self.tokens = tokens
+        # (cache key, parsed or cached resource) of every artifact, in load order
+        self._artifacts: List[Tuple[Optional[str], Any]] = []
 
         syn_dir = Path(syn_dir)
 
-        defaults: List[str] = []
+        in_memory: Dict[Path, List[Path]] = {}
+        if tree is not None:
+            for fpath in map(Path, tree):
+                if fpath.suffix == ".json":
+                    in_memory.setdefault(fpath.parent, []).append(fpath)
+            syn_dir = syn_dir.absolute()
+
+        files: List[Tuple[str, Union[Path, str]]] = []
         for rtype in VALID_SYNAPSE_RESOURCES:
-            for jfile in (syn_dir / rtype).glob("*.json"):
+            if rtype not in SYN_RESOURCE_TO_OBJ:
+                logger.debug(f"Skipping unsupported resource type: {rtype}")
+                continue
+            if tree is None:
+                jfiles = sorted((syn_dir / rtype).glob("*.json"))
+            else:
+                jfiles = sorted(in_memory.get(syn_dir / rtype, []))
+            for jfile in jfiles:
                 if "WorkspaceDefault" in jfile.name:
-                    defaults.append(jfile.name.replace(".json", ""))
+                    self.defaults.append(jfile.stem)
+                files.append((rtype, jfile if tree is None else tree[str(jfile)]))
+
+        if max_workers is not None and max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+        workers = max_workers or os.cpu_count() or 1
+        logger.debug(f"Loading {len(files)} synapse artifacts with {workers} workers")
+
+        rtypes = [rtype for rtype, _ in files]
+        sources = [source for _, source in files]
+        caches = [cache] * len(files)
+        tokens_ = [tokens] * len(files)
+        if workers == 1 or len(files) <= 1:
+            objs = list(map(_load_resource, rtypes, sources, caches, tokens_))
+        else:
+            pool_cls = ProcessPoolExecutor if processes else ThreadPoolExecutor
+            with pool_cls(max_workers=min(workers, len(files))) as pool:
+                # chunks keep the per item overhead of a process pool low
+                chunksize = max(1, len(files) // (workers * 4)) if processes else 1
+                objs = list(
+                    pool.map(
+                        _load_resource,
+                        rtypes,
+                        sources,
+                        caches,
+                        tokens_,
+                        chunksize=chunksize,
+                    )
+                )
+
+        for rtype, (key, obj) in zip(rtypes, objs):
+            if isinstance(obj, ArmResource):
+                self.cached += 1
+            else:
+                self.resources[rtype].append(obj)
+            self._artifacts.append((key, obj))
+        if cache is not None:
+            logger.debug(f"{self.cached}/{len(files)} synapse artifacts were cached")
 
-                with open(jfile, "r") as f:
-                    jdata = json.load(f)
+    @staticmethod
+    def build_resource(rtype: str, jdata: dict) -> "SynResource":
+        """
+        Builds the resource of an artifact and collects its dependencies.
 
-                    self.add_resource(rtype, jdata)
+        Args:
+            rtype (str): The resource type, a key of `SYN_RESOURCE_TO_OBJ`.
+            jdata (dict): The artifact JSON.
 
-    def add_resource(self, rtype: str, jdata: dict):
-        cls = eval(SYN_RESOURCE_TO_OBJ[rtype])
+        Returns:
+            SynResource: The resource.
+        """
+        cls = globals()[SYN_RESOURCE_TO_OBJ[rtype]]
 
         obj = cls(jdata)
         obj.populate_dependencies()
+        return obj
+
+    def add_resource(self, rtype: str, jdata: dict):
+        obj = self.build_resource(rtype, jdata)
         self.resources[rtype].append(obj)
+        self._artifacts.append((None, obj))
 
     def convert_to_arm_objs(self) -> ArmTemplate:
         armt = SynArmTemplate(workspace_name=self.workspace_name)
-        for rtype, res_lst in self.resources.items():
-            logger.debug(f"Converting.......{rtype}")
-            for res in res_lst:
-                res.populate_dependencies()
-                armr = res.convert_to_arm(res)
-                armt.add_resource(armr)
+        for key, res in self._artifacts:
+            if isinstance(res, ArmResource):
+                armt.add_resource(res)
+                continue
+            # dependencies were collected when the resource was built
+            armr = res.convert_to_arm(res)
+            if key is not None and self.cache is not None:
+                # keep the serialized properties, so the template does not serialize them again
+                armr = type(armr).from_fragment(
+                    armr.name, armr.properties_json(), armr.depends_on
+                )
+                self.cache.put(key, armr)
+                if self.tokens is not None:
+                    armr = _render_resource(armr, self.tokens)
+            armt.add_resource(armr)
         return armt
 
 
@@ -249,12 +448,15 @@ class SynResource(AzResource, SyntoArmModule):
     Object class representing Synapse JSON resource
     """
 
+    # keys whose values never hold references, skipped when collecting dependencies
+    __no_reference_keys__: FrozenSet[str] = frozenset()
+
     def __init__(self, jdata: dict):
         name = jdata["name"]
         properties = jdata["properties"]
 
-        # used to track dependencies)
-        self.deptracker: List[AzDependency] = list()
+        # used to track dependencies, an insertion ordered set
+        self.deptracker: Dict[AzDependency, None] = dict()
         super().__init__(name, properties)
 
         self._ctn = 0
@@ -266,37 +468,47 @@ class SynResource(AzResource, SyntoArmModule):
     def _populate_dependencies(self, data):
         """
         Identifies dependencies on on a resource
-        """
-        if isinstance(data, dict):
-            if "type" in data.keys() and "referenceName" in data.keys():
-                type_ = data["type"]
-                name = data["referenceName"]
-
-                ignore = False
-
-                if any([x in type_.lower() for x in ("sqlpool", "bigdatapool")]):
-                    ignore = True
-
-                # ignore WorkSpaceDefault Dependencies
-                if "WorkspaceDefault" in name:
-                    # print("Name AND TYPE: ", name, type)
-                    ignore = True
 
-                dep = AzDependency(name, type_, ignore=ignore)
-
-                # if any dep already exists.. return this recursive step
-                if any([(x == dep) for x in self.deptracker]):
-                    return
-                self.deptracker.append(dep)
-            else:
-                for _, v in data.items():
-                    self._populate_dependencies(v)
+        The properties are walked depth first in document order with an explicit stack,
+        so deeply nested resources do not hit the recursion limit.
+        """
+        skip = self.__no_reference_keys__
+        stack = [data]
+        while stack:
+            data = stack.pop()
+            if isinstance(data, dict):
+                if "type" in data and "referenceName" in data:
+                    type_ = data["type"]
+                    name = data["referenceName"]
+
+                    # a parameterized reference, e.g. {"value": "@pipeline()...", "type":
+                    # "Expression"}, is only resolved at run time
+                    if not isinstance(name, str):
+                        continue
+
+                    ignore = False
+
+                    type_lower = type_.lower()
+                    if "sqlpool" in type_lower or "bigdatapool" in type_lower:
+                        ignore = True
+
+                    # ignore WorkSpaceDefault Dependencies
+                    if "WorkspaceDefault" in name:
+                        ignore = True
+
+                    # a reference is not searched for further references
+                    self.deptracker.setdefault(AzDependency(name, type_, ignore=ignore))
+                else:
+                    children = [
+                        v
+                        for k, v in data.items()
+                        if isinstance(v, (dict, list)) and k not in skip
+                    ]
+                    stack.extend(reversed(children))
 
-        elif isinstance(data, list):
-            for elem in data:
-                self._populate_dependencies(elem)
-        else:
-            return
+            elif isinstance(data, list):
+                children = [v for v in data if isinstance(v, (dict, list))]
+                stack.extend(reversed(children))
 
 
 class SynNotebook(SynResource):
@@ -304,6 +516,9 @@ class SynNotebook(SynResource):
     Object representing a spark notebook resource
     """
 
+    # cell sources and outputs are code and results, often large, never references
+    __no_reference_keys__ = frozenset(["cells"])
+
     def init(self):
         try:
             self.default_language = self.properties["metadata"]["language_info"]["name"]
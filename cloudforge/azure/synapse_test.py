@@ -0,0 +1,260 @@
+import json
+import pytest
+import sys
+from pathlib import Path
+
+from . import AzDependency, synapse
+from .synapse import SynapseActionTemplate, SynManager, SynNotebook, SynPipeline
+
+
+def _pipeline(name, refs):
+    return {
+        "name": name,
+        "properties": {
+            "activities": [
+                {
+                    "name": f"run {ref}",
+                    "type": "ExecutePipeline",
+                    "typeProperties": {
+                        "pipeline": {"referenceName": ref, "type": "PipelineReference"}
+                    },
+                }
+                for ref in refs
+            ]
+        },
+    }
+
+
+@pytest.fixture
+def workspace(tmpdir):
+    syn_dir = Path(tmpdir)
+    artifacts = {
+        "pipeline": [
+            _pipeline("load", ["extract", "extract"]),
+            _pipeline("extract", []),
+            _pipeline("report", ["load"]),
+        ],
+        "linkedService": [
+            {
+                "name": "ws-WorkspaceDefaultStorage",
+                "properties": {"type": "AzureBlobFS"},
+            }
+        ],
+        "dataset": [
+            {
+                "name": "sales",
+                "properties": {
+                    "linkedServiceName": {
+                        "referenceName": "ws-WorkspaceDefaultStorage",
+                        "type": "LinkedServiceReference",
+                    }
+                },
+            }
+        ],
+        # not converted to ARM
+        "sqlscript": [{"name": "query", "properties": {}}],
+    }
+    for rtype, jdatas in artifacts.items():
+        (syn_dir / rtype).mkdir()
+        for jdata in jdatas:
+            (syn_dir / rtype / f"{jdata['name']}.json").write_text(json.dumps(jdata))
+    yield syn_dir
+
+
+@pytest.mark.parametrize("max_workers,processes", [(1, False), (4, False), (2, True)])
+def test_load_is_deterministic(workspace, max_workers, processes):
+    synm = SynManager("ws", workspace, max_workers=max_workers, processes=processes)
+
+    assert [r.name for r in synm.resources["pipeline"]] == [
+        "extract",
+        "load",
+        "report",
+    ]
+    assert [r.name for r in synm.resources["linkedService"]] == [
+        "ws-WorkspaceDefaultStorage"
+    ]
+    assert synm.defaults == ["ws-WorkspaceDefaultStorage"]
+    assert "sqlscript" not in synm.resources
+
+    load = synm.resources["pipeline"][1]
+    assert isinstance(load, SynPipeline)
+    assert [repr(d) for d in load.deptracker] == ["/pipelines/extract"]
+    dataset = synm.resources["dataset"][0]
+    assert [d.ignore for d in dataset.deptracker] == [True]
+
+
+def test_dependencies_are_extracted_once(workspace, monkeypatch):
+    calls = []
+    populate = synapse.SynResource.populate_dependencies
+
+    def counting(self):
+        calls.append(self.name)
+        return populate(self)
+
+    monkeypatch.setattr(synapse.SynResource, "populate_dependencies", counting)
+    synm = SynManager("ws", workspace, max_workers=2)
+    armt = synm.convert_to_arm_objs().to_arm_json()
+
+    assert sorted(calls) == sorted(
+        ["extract", "load", "report", "sales", "ws-WorkspaceDefaultStorage"]
+    )
+    report = [r for r in armt["resources"] if r["name"] == "ws/report"][0]
+    assert report["dependsOn"] == ["Microsoft.Synapse/workspaces/ws/pipelines/load"]
+
+
+def test_invalid_worker_count(workspace):
+    with pytest.raises(ValueError, match="max_workers"):
+        SynManager("ws", workspace, max_workers=0)
+
+
+def test_dependencies_keep_first_seen_order():
+    deps = [
+        {"referenceName": name, "type": "DatasetReference"}
+        for name in ["b", "a", "b", "c", "a"]
+    ]
+    pipeline = SynPipeline(
+        {
+            "name": "p",
+            "properties": {
+                "activities": [{"name": "copy", "type": "Copy", "inputs": deps}]
+            },
+        }
+    )
+    pipeline.populate_dependencies()
+
+    assert list(pipeline.deptracker) == [
+        AzDependency("b", "DatasetReference"),
+        AzDependency("a", "DatasetReference"),
+        AzDependency("c", "DatasetReference"),
+    ]
+    assert AzDependency("a", "X") in {AzDependency("a", "X")}
+    assert AzDependency("a", "X") not in {AzDependency("a", "X", ignore=True)}
+
+
+def test_deeply_nested_dependencies():
+    nested = {"referenceName": "inner", "type": "PipelineReference"}
+    for _ in range(5 * sys.getrecursionlimit()):
+        nested = {"activities": [nested]}
+    pipeline = SynPipeline(
+        {
+            "name": "p",
+            "properties": {"activities": [{"name": "a", "type": "X", **nested}]},
+        }
+    )
+    pipeline.populate_dependencies()
+
+    assert [repr(d) for d in pipeline.deptracker] == ["/pipelines/inner"]
+
+
+def test_notebook_cells_are_not_searched():
+    notebook = SynNotebook(
+        {
+            "name": "nb",
+            "properties": {
+                "bigDataPool": {
+                    "referenceName": "pool",
+                    "type": "BigDataPoolReference",
+                },
+                "cells": [{"outputs": [{"referenceName": "x", "type": "Dataset"}]}],
+            },
+        }
+    )
+    notebook.populate_dependencies()
+
+    assert [(d.name, d.ignore) for d in notebook.deptracker] == [("pool", True)]
+
+
+class FakeKeyVault:
+    def __init__(self, vault_name, credential):
+        pass
+
+    def get_secrets(self, names=None):
+        tokens = {"SynapseWorkspaceName": "ws-dev", "LakeUrl": "https://lake.dev"}
+        return {name: tokens[name] for name in names if name in tokens}
+
+
+def test_process_renders_workspace_in_memory(workspace, tmpdir, monkeypatch):
+    monkeypatch.delenv("ARM_VARS_USE_EXISTING", raising=False)
+    monkeypatch.setattr(synapse, "AzureKeyVault", FakeKeyVault)
+    (workspace / ".env.dev").write_text(
+        "\n".join(
+            [
+                "KEY_VAULT_NAME=kv-dev",
+                "ARM_CLIENT_ID=client",
+                "ARM_CLIENT_SECRET=secret",
+                "ARM_TENANT_ID=tenant",
+                "ARM_SUBSCRIPTION_ID=sub",
+            ]
+        )
+    )
+    linked = workspace / "linkedService" / "ws-WorkspaceDefaultStorage.json"
+    linked.write_text(
+        json.dumps(
+            {
+                "name": "ws-WorkspaceDefaultStorage",
+                "properties": {"type": "AzureBlobFS", "url": "{{__LakeUrl__}}"},
+            }
+        )
+    )
+    before = {p: p.read_text() for p in workspace.rglob("*.json")}
+    config = {
+        "pipeline": [
+            {
+                "name": "report",
+                "path": "$.properties.description",
+                "value": "{{__LakeUrl__}}/reports",
+                "action": "update",
+            }
+        ]
+    }
+
+    template = SynapseActionTemplate(config, syn_dir=workspace).parse()
+    resp = template.process(for_env="dev")
+
+    # the workspace is left as is and nothing is written
+    assert {p: p.read_text() for p in workspace.rglob("*.json")} == before
+    assert "tmpdir" not in resp
+    assert resp["name"] == "ws-dev"
+    assert resp["resource_types"]["pipeline"][0]["name"] == "report"
+
+    synm = SynManager("ws-dev", resp["syn_dir"], tree=resp["tree"])
+    report = synm.resources["pipeline"][2]
+    assert report.properties["description"] == "https://lake.dev/reports"
+    assert synm.resources["linkedService"][0].properties["url"] == "https://lake.dev"
+    assert [r.name for r in synm.resources["pipeline"]] == ["extract", "load", "report"]
+    assert synm.defaults == ["ws-WorkspaceDefaultStorage"]
+
+    # the debug dump holds the same rendered workspace
+    dumped = template.process(for_env="dev", dump_dir=Path(tmpdir) / "rendered")
+    from_disk = SynManager("ws-dev", dumped["tmpdir"])
+    assert (
+        from_disk.convert_to_arm_objs().to_arm_text()
+        == synm.convert_to_arm_objs().to_arm_text()
+    )
+
+
+def test_expression_references_are_skipped():
+    expression = {"value": "@pipeline().parameters.target", "type": "Expression"}
+    pipeline = SynPipeline(
+        {
+            "name": "p",
+            "properties": {
+                "activities": [
+                    {
+                        "name": "run",
+                        "type": "ExecutePipeline",
+                        "typeProperties": {
+                            "pipeline": {
+                                "referenceName": expression,
+                                "type": "PipelineReference",
+                            }
+                        },
+                        "inputs": [{"referenceName": "a", "type": "DatasetReference"}],
+                    }
+                ]
+            },
+        }
+    )
+    pipeline.populate_dependencies()
+
+    assert list(pipeline.deptracker) == [AzDependency("a", "DatasetReference")]
@@ -8,9 +8,11 @@ from azure.mgmt.resource import ResourceManagementClient
 from azure.mgmt.resource.resources.models import DeploymentMode
 
 
-from . import __packagename__, __version__, logger
+from . import TMP_DIR, __packagename__, __version__, logger
 from .azure import VALID_SYNAPSE_RESOURCES
 from .azure.arm import ArmTemplate
+from .azure.cache import ConversionCache
+from .azure.graph import DependencyGraphError
 from .azure.synapse import SynapseActionTemplate, SynManager
 from .commands_base import BaseCommand
 from .utils import EnvConfiguration
@@ -19,6 +21,7 @@ from .keyvault import AzureKeyVault
 from pygments.formatters import find_formatter_class
 from pygments.lexers import find_lexer_class_by_name
 import re
+import sys
 
 
 class SynapseDeployArmCommand(BaseCommand):
@@ -94,11 +97,23 @@ class SynapseConvertCommand(BaseCommand):
             config, syn_dir=self.proj_dir
         ).parse()
 
-        resp = syn_action_template.process(for_env=self.env)
+        dump_dir = TMP_DIR / ".synapse-workspace" if self.dump_rendered else None
+        resp = syn_action_template.process(for_env=self.env, dump_dir=dump_dir)
+        if dump_dir is not None:
+            logger.info(f"Rendered workspace written to {resp['tmpdir']}")
         # transform Synapse JSON to ARM file
         syn_workspace_name = resp["name"]
-        syn_dir = resp["tmpdir"]
-        synm = SynManager(workspace_name=syn_workspace_name, syn_dir=syn_dir)
+        cache = ConversionCache() if self.use_cache else None
+        synm = SynManager(
+            workspace_name=syn_workspace_name,
+            syn_dir=resp["syn_dir"],
+            max_workers=self.jobs,
+            processes=self.processes,
+            cache=cache,
+            # rendered per artifact, so cache entries never hold the secrets
+            tree=resp["source_tree"],
+            tokens=resp["tokens"],
+        )
 
         armt: ArmTemplate = synm.convert_to_arm_objs()
 
@@ -107,10 +122,14 @@ class SynapseConvertCommand(BaseCommand):
         else:
             output_path = self.output_dir / "synapseArm.json"
 
-        jdata: str = json.dumps(armt.to_arm_json(), indent=2)  # type: ignore
+        try:
+            jdata: str = armt.to_arm_text()  # type: ignore
+        except DependencyGraphError as e:
+            logger.error(str(e))
+            sys.exit(1)
 
         ##### final pass through -- rename ALL Workspace names to the supplied one -- needed for dynamic environment change
-        for default in defaults:
+        for default in synm.defaults:
             _d = default.split("WorkspaceDefault")
             _d[0] = syn_workspace_name
             modified = "-WorkspaceDefault".join(_d)
@@ -121,6 +140,9 @@ class SynapseConvertCommand(BaseCommand):
             logger.debug(f"Writing final dynamic ARM to {output_path}")
             f.write(jdata)
 
+        if cache is not None:
+            cache.prune()
+
 
 class SynapsePrettifyCommand(BaseCommand):
     def execute(self):
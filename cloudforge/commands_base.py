@@ -1,4 +1,4 @@
-from . import TMP_PATH, logger, TMP_DIR, __version__, __packagename__
+from . import TMP_PATH, logger, TMP_DIR, TF_WORKDIRS_PATH, __version__, __packagename__
 
 import shutil
 
@@ -64,7 +64,11 @@ class CleanCommands(BaseCommand):
                     fobj.unlink()
 
     def _clean_up_cftf_files(self) -> None:
-        """Cleans up the cftf files."""
+        """Cleans up the cftf files, including stable working directories."""
+        if TF_WORKDIRS_PATH.is_dir():
+            logger.warning(f"Removing {TF_WORKDIRS_PATH}")
+            shutil.rmtree(TF_WORKDIRS_PATH)
+
         for fobj in TMP_DIR.glob("*"):
             if "terraform" in fobj.name:
                 if fobj.is_dir():
@@ -1,31 +1,64 @@
-from azure.identity import ClientSecretCredential
 from pathlib import Path
-from typing import Tuple, Dict, Union
 
-from . import TMP_PATH, logger, __version__, __packagename__
+from . import logger, __version__, __packagename__
 from .commands_base import BaseCommand
+from .git_changes import GitError, changed_files
 from .tokenizer import Tokenizer
-from .utils import EnvConfiguration
-from .keyvault import AzureKeyVault
+from .terraform_cache import PluginCache, TerraformBinaryCache
+from .terraform_exec import Tfstate
 from .terraform_install import TerraformInstaller, __TERRAFORM_VERSION__
-from .terraform_exec import Terraform
-
-import shutil
+from .terraform_plan import StalePlanError
+from .terraform_timings import TimingsCollector
+from .terraform_pipeline import (
+    ACTION_STEPS,
+    TerraformActionError,
+    TerraformPipeline,
+    affected_projects,
+    discover_projects,
+    format_results,
+    run_pipelines,
+    run_projects,
+    write_summary,
+)
+
+import json
 import platform
 import os
 import sys
 
 
+def _terraform_installer() -> TerraformInstaller:
+    """Builds the installer resolving the Terraform binary, honouring the CLOUDFORGE_TERRAFORM_* overrides."""
+    return TerraformInstaller(
+        keep_binary=False,
+        version=os.getenv("CLOUDFORGE_TERRAFORM_VERSION", __TERRAFORM_VERSION__),
+        cache=TerraformBinaryCache(),
+        bin_path=os.getenv("CLOUDFORGE_TERRAFORM_BIN"),
+        search_path=True,
+    )
+
+
+def _plugin_cache() -> PluginCache:
+    """Builds the provider plugin cache, seeding it from CLOUDFORGE_PLUGIN_MIRROR when set."""
+    plugin_cache = PluginCache()
+    mirror_dir = os.getenv("CLOUDFORGE_PLUGIN_MIRROR")
+    if mirror_dir:
+        plugin_cache.warm(Path(mirror_dir))
+    return plugin_cache
+
+
 class TerraformCommands(BaseCommand):
     """Class for handling Terraform commands.
 
     Attributes:
         targeted_action (str): The targeted Terraform action.
         tokenizer (Tokenizer): The Tokenizer object used to replace and validate tokens.
-        config (EnvConfiguration): The EnvConfiguration object to load the environment configuration.
-        backend_config (Dict[str, str]): The backend configuration for Terraform.
-        arm_config (Dict[str, str]): The ARM configuration for Terraform.
-        tmp_dir (Path): The temporary directory for the parsed Terraform files.
+        stable_workdir (bool): Whether to reuse a per project/env working directory between runs.
+        force_init (bool): Whether to run terraform init even when its inputs are unchanged.
+        save_plan (Path): Where validate or plan saves its plan and manifest, if set.
+        apply_plan (Path): A saved plan deploy applies instead of planning again, if set.
+        timings_path (Path): Where the per-resource timings of plan and apply are written, if set.
+        pipeline (TerraformPipeline): The pipeline rendering the project for the env and running Terraform.
     """
 
     def setup(self) -> None:
@@ -35,98 +68,57 @@ class TerraformCommands(BaseCommand):
         self.tokenizer: Tokenizer = Tokenizer(self.proj_dir, "tf")
         self.tokenizer.read_root()
 
-        self.config: EnvConfiguration = EnvConfiguration.load_env(
-            self.env, self.proj_dir
-        )
-
-        vault_name: str = self.config.get("KEY_VAULT_NAME")
-
-        auth: ClientSecretCredential = ClientSecretCredential(
-            **self.config.get_terraform_creds()
-        )
-        tokens: Dict[str, str] = AzureKeyVault(vault_name, auth).get_secrets()
-
-        # get secrets from Key Vault
-        parsed_tree = self.tokenizer.replace_and_validate_tokens(tokens)
-
-        self.tmp_dir: Path = self.tokenizer.dump_to(
-            tree=parsed_tree, dirpath=TMP_PATH, unique=True
-        )
-
-        self.backend_config: Dict[str, str] = {
-            "storage_account_name": self.config.get("STORAGE_ACCOUNT_NAME"),
-            "sas_token": self.config.get("SAS_TOKEN"),
-            "key": self.config.get("TF_KEY"),
-            "container_name": self.config.get("CONTAINER_NAME"),
-        }
-
-        self.arm_config: Dict[str, str] = {
-            "ARM_CLIENT_ID": self.config.get("ARM_CLIENT_ID"),
-            "ARM_CLIENT_SECRET": self.config.get("ARM_CLIENT_SECRET"),
-            "ARM_TENANT_ID": self.config.get("ARM_TENANT_ID"),
-            "ARM_SUBSCRIPTION_ID": self.config.get("ARM_SUBSCRIPTION_ID"),
-        }
-
-    def _run_tf_cmd(self, cmd, **kwargs) -> None:
-        """Runs a Terraform command.
-
-        Args:
-            cmd (Callable): The Terraform command to run.
-            **kwargs: The keyword arguments to pass to the command.
-
-        Raises:
-            SystemExit: If the Terraform command raises an error.
-        """
-        options = kwargs.copy()
-
-        options["raise_on_error"] = False
-        options["capture_output"] = True
-        ret_code, msg, err_msg = cmd(**options)
-        if ret_code != 0:
-            self._clean_up()
-            logger.error(f"CMD: tf.{cmd.__name__}() raised error.. aborting")
-            logger.error(err_msg)
-            sys.exit(ret_code)
-        logger.info(msg)
-
-    def _clean_up(self) -> None:
-        """Cleans up the temporary directory."""
-        logger.warning(f"Removing directory: {self.tmp_dir.absolute()}")
-        shutil.rmtree(self.tmp_dir)  # clean up
+        self.pipeline: TerraformPipeline = TerraformPipeline(
+            self.env,
+            self.proj_dir,
+            self.tokenizer,
+            stable_workdir=self.stable_workdir,
+            force_init=self.force_init,
+            resource_timings=self.timings_path is not None,
+        ).prepare()
 
     def execute(self) -> None:
         """Executes the targeted Terraform action."""
-        if self.targeted_action in ("validate", "deploy"):
-            with TerraformInstaller(
-                keep_binary=False, version=__TERRAFORM_VERSION__
-            ) as tf_installer:
-                self.config.ensure_arms_in_env()  # this ensures arm credentials are set in os environment, used by Terraform binary
-                ectf_dir = str(self.tmp_dir.absolute())
-
-                tf = Terraform(
-                    terraform_bin_path=tf_installer.bin_path,
-                    working_dir=ectf_dir,
-                    is_env_vars_included=True,
-                )
-
-                self._run_tf_cmd(
-                    tf.init,
-                    backend_config=self.backend_config,
-                    backend=True,
-                    reconfigure=False,
-                )
-
-                if self.targeted_action == "validate":
-                    self._run_tf_cmd(tf.validate)
-                    self._run_tf_cmd(tf.plan, detailed_exitcode=False)
-
-                if self.targeted_action == "deploy":
-                    self._run_tf_cmd(tf.apply, skip_plan=True)
-
-            self._clean_up()
+        if self.targeted_action in ACTION_STEPS:
+            self.pipeline.plugin_cache = _plugin_cache()
+            with _terraform_installer() as tf_installer:
+                try:
+                    self.pipeline.run(
+                        self.targeted_action,
+                        tf_installer,
+                        save_plan=self.save_plan,
+                        apply_plan=self.apply_plan,
+                    )
+                except StalePlanError as e:
+                    self.pipeline.clean_up()
+                    logger.error(str(e))
+                    sys.exit(1)
+                except TerraformActionError as e:
+                    self.pipeline.clean_up()
+                    logger.error(f"CMD: tf.{e.step}() raised error.. aborting")
+                    logger.error(e.result.err)
+                    logger.error(
+                        f"Full output: {e.result.out_path}, {e.result.err_path}"
+                    )
+                    sys.exit(e.result.ret_code)
+                finally:
+                    self._report_timings()
+
+            self.pipeline.clean_up()
 
         elif self.targeted_action == "debug":
             self._handle_debug_action()
+            if self.pipeline.workdir_lock is not None:
+                self.pipeline.workdir_lock.release()
+
+    def _report_timings(self) -> None:
+        """Writes the per-resource timings as JSON and prints the slowest resources."""
+        if self.pipeline.timings_collector is None:
+            return
+        report = self.pipeline.timings_collector.report()
+        report.write(self.timings_path)
+        print(report.format_top())
+        logger.info(f"Wrote resource timings: {self.timings_path}")
 
     def _handle_debug_action(self) -> None:
         """Handles the debug action."""
@@ -139,17 +131,17 @@ class TerraformCommands(BaseCommand):
         wrapper_fname: str = "terraform.sh"
 
         prefix_str: str = ""
-        for k, v in self.arm_config.items():
+        for k, v in self.pipeline.arm_config.items():
             prefix_str += f"{k}={v} "
 
         backend_configs: str = ""
-        for k, v in self.backend_config.items():
+        for k, v in self.pipeline.backend_config.items():
             if k == "sas_token":
                 v = f'"{v}"'
             backend_configs += f"-backend-config={k}={v} "
 
-        init_path: Path = self.tmp_dir / init_fname
-        wrapper_path: Path = self.tmp_dir / wrapper_fname
+        init_path: Path = self.pipeline.tmp_dir / init_fname
+        wrapper_path: Path = self.pipeline.tmp_dir / wrapper_fname
 
         with open(init_path, "w") as init_f:
             script_str: str = (
@@ -166,5 +158,216 @@ class TerraformCommands(BaseCommand):
 
         os.chmod(init_path, 0o700)
         os.chmod(wrapper_path, 0o700)
-        logger.warning(f"Debug environment created in: {self.tmp_dir}")
+        logger.warning(f"Debug environment created in: {self.pipeline.tmp_dir}")
         logger.warning("Please take caution and remove directory when done.")
+
+
+class TerraformMultiEnvCommands(BaseCommand):
+    """Class for running a Terraform action for several envs concurrently.
+
+    The project is read once and every env renders its own tree from it; the envs share one
+    Terraform binary and the provider plugin cache.
+
+    Attributes:
+        action (str): The targeted Terraform action, "validate" or "plan".
+        envs (List[str]): The envs to run the action for.
+        proj_dir (Path): The project directory.
+        jobs (int): The maximum number of envs run at once.
+        stable_workdir (bool): Whether to reuse a per project/env working directory between runs.
+        force_init (bool): Whether to run terraform init even when its inputs are unchanged.
+        summary_path (Path): Where a JSON summary of the results is written, if set.
+    """
+
+    def setup(self) -> None:
+        """Sets up the TerraformMultiEnvCommands class."""
+        self.tokenizer: Tokenizer = Tokenizer(self.proj_dir, "tf")
+        self.tokenizer.read_root()
+
+    def execute(self) -> None:
+        """Executes the action for every env and prints a summary table.
+
+        Raises:
+            SystemExit: If the action failed for any env.
+        """
+        with _terraform_installer() as tf_installer:
+            results = run_pipelines(
+                self.action,
+                self.envs,
+                self.proj_dir,
+                self.tokenizer,
+                tf_installer,
+                jobs=self.jobs,
+                stable_workdir=self.stable_workdir,
+                force_init=self.force_init,
+                plugin_cache=_plugin_cache(),
+            )
+
+        print(format_results(results))
+        if self.summary_path:
+            write_summary(results, self.summary_path, action=self.action)
+        if not all(result.ok for result in results):
+            sys.exit(1)
+
+
+class TerraformMonorepoCommands(BaseCommand):
+    """Class for running a Terraform action for every root module under a directory.
+
+    Root modules are directories holding `.tf` files and `.env.<env>` files. Each one is read once
+    and its envs are run on a worker pool shared by all modules; a failing module does not stop the
+    others. With `changed_since`, only the modules affected by the files changed since that git ref
+    are run.
+
+    Attributes:
+        action (str): The targeted Terraform action, "validate" or "plan".
+        root_dir (Path): The directory searched for root modules.
+        envs (List[str]): The envs to run the action for, where a module has a configuration for them.
+        jobs (int): The maximum number of modules run at once.
+        stable_workdir (bool): Whether to reuse a per project/env working directory between runs.
+        force_init (bool): Whether to run terraform init even when its inputs are unchanged.
+        summary_path (Path): Where a JSON summary of the results is written, if set.
+        changed_since (str): A git ref; when set, unaffected modules are skipped.
+    """
+
+    def setup(self) -> None:
+        """Sets up the TerraformMonorepoCommands class."""
+        self.projects = discover_projects(self.root_dir, self.envs)
+        logger.info(
+            f"Discovered {len(self.projects)} root module(s) in {self.root_dir}"
+        )
+        self.skipped = 0
+        if self.changed_since:
+            try:
+                changed = changed_files(self.changed_since, self.root_dir)
+            except GitError as e:
+                logger.error(str(e))
+                sys.exit(1)
+            affected = affected_projects(self.projects, changed)
+            self.skipped = len(self.projects) - len(affected)
+            self.projects = affected
+            logger.info(
+                f"{len(self.projects)} root module(s) affected by {len(changed)} file(s) changed since {self.changed_since}"
+            )
+
+    def execute(self) -> None:
+        """Executes the action for every module and prints a summary table.
+
+        Raises:
+            SystemExit: If no module was found, or the action failed for any of them.
+        """
+        if not self.projects and self.skipped:
+            print(f"No root modules affected by changes since {self.changed_since}")
+            if self.summary_path:
+                write_summary([], self.summary_path, action=self.action)
+            return
+
+        if not self.projects:
+            logger.error(
+                f"No root modules with .env.[{','.join(self.envs)}] files found in {self.root_dir}"
+            )
+            sys.exit(1)
+
+        with _terraform_installer() as tf_installer:
+            results = run_projects(
+                self.action,
+                self.projects,
+                tf_installer,
+                jobs=self.jobs,
+                stable_workdir=self.stable_workdir,
+                force_init=self.force_init,
+                plugin_cache=_plugin_cache(),
+            )
+
+        print(format_results(results, root_dir=self.root_dir))
+        if self.summary_path:
+            write_summary(results, self.summary_path, action=self.action)
+        if not all(result.ok for result in results):
+            sys.exit(1)
+
+
+class TerraformTimingsCommands(BaseCommand):
+    """Class for reporting the per-resource timings of a recorded `terraform plan -json` or `apply -json` run.
+
+    Attributes:
+        events_path (Path): The recorded events, one JSON event per line.
+        top (int): The number of slowest resources listed.
+        json_path (Path): Where the full report is written as JSON, if set.
+        parallelism (int): The `-parallelism` the run used.
+    """
+
+    def setup(self) -> None:
+        """Sets up the TerraformTimingsCommands class."""
+        self.report = TimingsCollector.from_file(self.events_path).report(
+            self.parallelism
+        )
+
+    def execute(self) -> None:
+        """Prints the slowest resources, and writes the full report if asked to."""
+        print(self.report.format_top(self.top))
+        if self.json_path:
+            self.report.write(self.json_path)
+
+
+class TerraformStateCommands(BaseCommand):
+    """Class for comparing Terraform state snapshots.
+
+    Attributes:
+        action (str): The state action, "diff".
+        before_path (Path): The first state, e.g. pulled before an apply.
+        after_path (Path): The second state, e.g. pulled after it.
+        json_lines (bool): Whether changes are printed as JSON, one object per line.
+    """
+
+    def setup(self) -> None:
+        """Sets up the TerraformStateCommands class."""
+        self.before: Tfstate = Tfstate.load_file(str(self.before_path))
+        self.after: Tfstate = Tfstate.load_file(str(self.after_path))
+
+    def execute(self) -> None:
+        """Prints every changed resource as it is found, then a summary."""
+        if self.action == "diff":
+            counts = {"added": 0, "removed": 0, "changed": 0}
+            for change in self.before.diff(self.after):
+                counts[change.action] += 1
+                if self.json_lines:
+                    print(json.dumps(change.to_dict()), flush=True)
+                else:
+                    print(change.format(), flush=True)
+
+            unchanged = (
+                len(self.before.addresses) - counts["removed"] - counts["changed"]
+            )
+            logger.info(
+                f"{counts['added']} added, {counts['removed']} removed, "
+                f"{counts['changed']} changed, {unchanged} unchanged"
+            )
+
+
+class TerraformCacheCommands(BaseCommand):
+    """Class for handling the provider plugin cache commands.
+
+    Attributes:
+        action (str): The cache action, "warm" or "prune".
+        mirror_dir (Path): The filesystem provider mirror seeding the cache, used by "warm".
+        platforms (Tuple[str, ...]): The platforms to seed, all when empty, used by "warm".
+        max_bytes (int): The size the cache is pruned to, used by "prune".
+    """
+
+    def setup(self) -> None:
+        """Sets up the TerraformCacheCommands class."""
+        self.plugin_cache: PluginCache = PluginCache()
+
+    def execute(self) -> None:
+        """Executes the targeted cache action."""
+        if self.action == "warm":
+            added = self.plugin_cache.warm(
+                self.mirror_dir, platforms=self.platforms or None
+            )
+            print(
+                f"Seeded {len(added)} provider package(s) into {self.plugin_cache.root}"
+            )
+
+        elif self.action == "prune":
+            removed = self.plugin_cache.prune(self.max_bytes)
+            print(
+                f"Evicted {len(removed)} provider package(s) from {self.plugin_cache.root}"
+            )
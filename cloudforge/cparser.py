@@ -7,7 +7,14 @@ from .commands_azure import (
     SynapseConvertCommand,
     SynapseDeployArmCommand,
 )
-from .commands_terraform import TerraformCommands
+from .commands_terraform import (
+    TerraformCacheCommands,
+    TerraformCommands,
+    TerraformMonorepoCommands,
+    TerraformMultiEnvCommands,
+    TerraformStateCommands,
+    TerraformTimingsCommands,
+)
 
 import click
 
@@ -162,7 +169,35 @@ def deploy(arm_file, env, config):
     type=click.Choice(VALID_ENVS),
     required=True,
 )
-def convert(proj_dir, format, config, output, env):
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=None,
+    help="The number of workers loading artifacts. Defaults to the CPU count.",
+)
+@click.option(
+    "--processes/--threads",
+    default=False,
+    show_default=True,
+    help="Load artifacts with a pool of processes instead of threads. Parsing holds the GIL, so threads barely scale with --jobs; processes do, but every resource they build is copied back, which only pays off on large workspaces and many CPUs.",
+)
+@click.option(
+    "--cache/--no-cache",
+    "use_cache",
+    default=True,
+    show_default=True,
+    help="Reuse the conversion of artifacts unchanged since a previous run. Key Vault secrets are substituted on each run and never cached.",
+)
+@click.option(
+    "--dump-rendered",
+    is_flag=True,
+    default=False,
+    help="Also write the workspace, with actions applied and tokens substituted, to the temp directory for debugging.",
+)
+def convert(
+    proj_dir, format, config, output, env, jobs, processes, use_cache, dump_rendered
+):
     """
     Convert Synapse Workspace Files into various formats .
     """
@@ -178,41 +213,351 @@ def convert(proj_dir, format, config, output, env):
         output=output,
         env=env,
         output_dir=output_dir,
+        jobs=jobs,
+        processes=processes,
+        use_cache=use_cache,
+        dump_rendered=dump_rendered,
     ).execute()
 
 
 # Terraform Commands
-@cloudforge.command()
+@cloudforge.group()
+def tf():
+    """
+    Perform Terraform commands for CloudForge.
+    """
+    pass
+
+
+def _parse_envs(ctx, param, value):
+    """
+    Parses a comma separated list of environments.
+
+    Args:
+        value: The raw option value, e.g. "dev,stg".
+    """
+    if value is None:
+        return None
+    envs = [env.strip() for env in value.split(",") if env.strip()]
+    if not envs or any(env not in VALID_ENVS for env in envs):
+        raise click.BadParameter(
+            f"must be a comma separated list of {', '.join(VALID_ENVS)}"
+        )
+    return list(dict.fromkeys(envs))
+
+
+def _tf_action(action, multi_env=False):
+    """
+    Builds a `tf` subcommand running a Terraform action.
+
+    Args:
+        action: The action to perform. Must be "validate", "plan", "deploy", or "debug".
+        multi_env: Whether the action can run for several environments at once with --envs.
+    """
+
+    def command(
+        env,
+        proj_dir,
+        stable_workdir,
+        force_init,
+        envs=None,
+        jobs=None,
+        discover=None,
+        summary=None,
+        changed_since=None,
+        save_plan=None,
+        plan=None,
+        timings=None,
+    ):
+        """
+        Args:
+            env: The environment to target. Must be "dev", "stg", "uat", or "prod".
+            proj_dir: The project directory that holds ECTF files. Default is the current working directory.
+            stable_workdir: Whether to reuse a working directory per project and env between runs.
+            force_init: Whether to run terraform init even when its inputs are unchanged.
+            envs: The environments to target concurrently, instead of env.
+            jobs: The maximum number of environments, or root modules, run at once.
+            discover: A directory to search for root modules, instead of proj_dir.
+            summary: Where a JSON summary of the results is written.
+            changed_since: A git ref; only root modules affected by the files changed since it are run.
+            save_plan: Where the plan and its manifest are saved.
+            plan: A plan saved by validate or plan, applied without refreshing or planning again.
+            timings: Where the per-resource timings of plan and apply are written.
+        """
+        proj_dir = Path(proj_dir).absolute()
+        if (save_plan or timings) and (discover or changed_since or envs):
+            raise click.UsageError(
+                "--save-plan and --timings apply to a single ENV, they cannot be combined with --envs, --discover or --changed-since."
+            )
+        if discover or changed_since:
+            if not (env or envs):
+                raise click.UsageError("Missing argument 'ENV' (or --envs).")
+            if env and envs:
+                raise click.UsageError("Pass either ENV or --envs, not both.")
+            TerraformMonorepoCommands(
+                action=action,
+                root_dir=Path(discover or proj_dir).absolute(),
+                envs=envs or [env],
+                jobs=jobs,
+                stable_workdir=stable_workdir,
+                force_init=force_init,
+                summary_path=Path(summary) if summary else None,
+                changed_since=changed_since,
+            ).execute()
+            return
+
+        if envs:
+            if env is not None:
+                raise click.UsageError("Pass either ENV or --envs, not both.")
+            TerraformMultiEnvCommands(
+                action=action,
+                envs=envs,
+                proj_dir=proj_dir,
+                jobs=jobs,
+                stable_workdir=stable_workdir,
+                force_init=force_init,
+                summary_path=Path(summary) if summary else None,
+            ).execute()
+            return
+
+        if env is None:
+            raise click.UsageError("Missing argument 'ENV'.")
+        TerraformCommands(
+            action=action,
+            env=env,
+            proj_dir=proj_dir,
+            stable_workdir=stable_workdir,
+            force_init=force_init,
+            save_plan=Path(save_plan).absolute() if save_plan else None,
+            apply_plan=Path(plan).absolute() if plan else None,
+            timings_path=Path(timings) if timings else None,
+        ).execute()
+
+    if action != "debug":
+        command = click.option(
+            "--timings",
+            type=click.Path(dir_okay=False),
+            default=None,
+            help="Run plan and apply with -json, write per-resource timings to this file and print the slowest resources.",
+        )(command)
+    if action == "deploy":
+        command = click.option(
+            "--plan",
+            type=click.Path(exists=True, dir_okay=False),
+            default=None,
+            help="Apply a plan saved with --save-plan as is, skipping refresh and plan, if it still matches the configuration and state.",
+        )(command)
+    if multi_env:
+        command = click.option(
+            "--save-plan",
+            type=click.Path(dir_okay=False),
+            default=None,
+            help="Save the plan to this file, with a manifest next to it, for `deploy --plan`.",
+        )(command)
+        command = click.option(
+            "--changed-since",
+            metavar="REF",
+            default=None,
+            help="Only run the root modules under --discover, or --proj-dir, affected by the files changed since this git ref.",
+        )(command)
+        command = click.option(
+            "--summary",
+            type=click.Path(dir_okay=False),
+            default=None,
+            help="Write a JSON summary of the per-env results to this file.",
+        )(command)
+        command = click.option(
+            "--discover",
+            type=click.Path(exists=True, file_okay=False),
+            default=None,
+            help="Run for every root module (.tf files plus .env.<env> files) under this directory.",
+        )(command)
+        command = click.option(
+            "-j",
+            "--jobs",
+            type=click.IntRange(min=1),
+            default=None,
+            help="The maximum number of environments, or root modules with --discover, run at once.",
+        )(command)
+        command = click.option(
+            "--envs",
+            callback=_parse_envs,
+            default=None,
+            help="Run for several environments concurrently, e.g. dev,stg,uat,prod.",
+        )(command)
+    command = click.option(
+        "--force-init",
+        is_flag=True,
+        default=False,
+        help="Run terraform init even when the backend config, providers and modules are unchanged.",
+    )(command)
+    command = click.option(
+        "--stable-workdir/--fresh-workdir",
+        default=False,
+        help="Reuse a working directory per project and env between runs, keeping .terraform/ and the lock file.",
+        show_default=True,
+    )(command)
+    command = click.option(
+        "-d",
+        "--proj-dir",
+        help="Define the project directory that holds ECTF files. Default is the current working directory.",
+        default=str(Path.cwd().absolute()),
+        type=click.Path(),
+    )(command)
+    command = click.argument(
+        "env",
+        nargs=1,
+        type=click.Choice(VALID_ENVS),
+        required=not multi_env,
+    )(command)
+    return command
+
+
+tf.command(name="validate", help="Run terraform init, validate and plan.")(
+    _tf_action("validate", multi_env=True)
+)
+tf.command(name="plan", help="Run terraform init and plan.")(
+    _tf_action("plan", multi_env=True)
+)
+tf.command(name="deploy", help="Run terraform init and apply.")(_tf_action("deploy"))
+tf.command(
+    name="debug", help="Dump the rendered project with helper scripts to debug it."
+)(_tf_action("debug"))
+
+
+@tf.command()
 @click.argument(
-    "action",
+    "events_file",
     nargs=1,
-    type=click.Choice(["validate", "deploy", "debug"]),
+    type=click.Path(exists=True, dir_okay=False),
     required=True,
 )
+@click.option(
+    "-n",
+    "--top",
+    type=click.IntRange(min=1),
+    default=10,
+    show_default=True,
+    help="The number of slowest resources listed.",
+)
+@click.option(
+    "--json",
+    "json_path",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Write the full report, with the critical path and concurrency timeline, to this file.",
+)
+@click.option(
+    "--parallelism",
+    type=click.IntRange(min=1),
+    default=10,
+    show_default=True,
+    help="The -parallelism terraform ran with.",
+)
+def timings(events_file, top, json_path, parallelism):
+    """
+    Report per-resource timings of a recorded `terraform plan -json` or `apply -json` run.
+
+    Args:
+        events_file: The recorded output, one JSON event per line.
+        top: The number of slowest resources listed.
+        json_path: Where the full report is written.
+        parallelism: The -parallelism terraform ran with.
+    """
+    TerraformTimingsCommands(
+        events_path=Path(events_file),
+        top=top,
+        json_path=Path(json_path) if json_path else None,
+        parallelism=parallelism,
+    ).execute()
+
+
+@tf.group()
+def state():
+    """
+    Inspect Terraform state snapshots.
+    """
+    pass
+
+
+@state.command(name="diff")
+@click.argument("before", nargs=1, type=click.Path(exists=True, dir_okay=False))
+@click.argument("after", nargs=1, type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "--json",
+    "json_lines",
+    is_flag=True,
+    default=False,
+    help="Print each change as a JSON object, one per line.",
+)
+def state_diff(before, after, json_lines):
+    """
+    Compare two state files, e.g. from `terraform state pull`, by resource address and attribute.
+
+    Args:
+        before: The first state, e.g. pulled before an apply or from one env.
+        after: The second state.
+        json_lines: Whether changes are printed as JSON lines.
+    """
+    TerraformStateCommands(
+        action="diff",
+        before_path=Path(before),
+        after_path=Path(after),
+        json_lines=json_lines,
+    ).execute()
+
+
+@tf.group()
+def cache():
+    """
+    Manage the provider plugin cache shared by every Terraform run.
+    """
+    pass
+
+
+@cache.command()
 @click.argument(
-    "env",
+    "mirror_dir",
     nargs=1,
-    type=click.Choice(VALID_ENVS),
+    type=click.Path(exists=True, file_okay=False),
     required=True,
 )
 @click.option(
-    "-d",
-    "--proj-dir",
-    help="Define the project directory that holds ECTF files. Default is the current working directory.",
-    default=str(Path.cwd().absolute()),
-    type=click.Path(),
+    "-p",
+    "--platform",
+    "platforms",
+    multiple=True,
+    help="Only seed this platform, e.g. linux_amd64. Can be repeated. Default is every platform in the mirror.",
 )
-def tf(action, env, proj_dir):
+def warm(mirror_dir, platforms):
     """
-    Perform Terraform commands for CloudForge.
+    Seed the provider plugin cache from a filesystem provider mirror.
+
+    Args:
+        mirror_dir: The root of the mirror, e.g. the output of `terraform providers mirror`.
+        platforms: The platforms to seed.
+    """
+    TerraformCacheCommands(
+        action="warm", mirror_dir=Path(mirror_dir), platforms=platforms
+    ).execute()
+
+
+@cache.command()
+@click.option(
+    "--max-mb",
+    type=click.IntRange(min=0),
+    default=None,
+    help="The size in MiB the cache is pruned to. Default is 5 GiB.",
+)
+def prune(max_mb):
+    """
+    Evict the least recently used providers from the plugin cache.
 
     Args:
-        action: The action to perform. Must be "validate", "deploy", or "debug".
-        env: The environment to target. Must be "dev", "stg", "uat", or "prod".
-        proj_dir: The project directory that holds ECTF files. Default is the current working directory.
+        max_mb: The size in MiB the cache is pruned to.
     """
-    proj_dir = Path(proj_dir).absolute()
-    TerraformCommands(action=action, env=env, proj_dir=proj_dir).execute()
+    max_bytes = None if max_mb is None else max_mb * 1024**2
+    TerraformCacheCommands(action="prune", max_bytes=max_bytes).execute()
 
 
 def execute():
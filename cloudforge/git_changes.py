@@ -0,0 +1,64 @@
+"""
+The git_changes module lists the files changed in a local git checkout, so that only the Terraform
+root modules affected by a change need to be validated or planned.
+
+Example Usage:
+changed = changed_files("origin/main", Path("./terraform"))
+"""
+
+from pathlib import Path
+from typing import List, Set
+
+import subprocess
+
+
+class GitError(Exception):
+    """
+    Exception raised when a git command fails, e.g. for an unknown ref or outside a repository.
+    """
+
+    pass
+
+
+def _git(args: List[str], cwd: Path) -> str:
+    """Runs a git command and returns its stdout."""
+    try:
+        proc = subprocess.run(
+            ["git", *args],
+            cwd=str(cwd),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+        )
+    except FileNotFoundError as e:
+        raise GitError("git was not found on PATH") from e
+    if proc.returncode != 0:
+        raise GitError(f"git {' '.join(args)} failed: {proc.stderr.strip()}")
+    return proc.stdout
+
+
+def changed_files(ref: str, cwd: Path) -> Set[Path]:
+    """
+    Lists the files changed since a ref.
+
+    The diff is taken from the merge base of `ref` and HEAD, as a pull request would see it, to the
+    working tree, so uncommitted and untracked files count as changed too. Deleted files are listed
+    as well. Renames are not detected, so a renamed file is listed under both its old and new path.
+
+    Args:
+        ref (str): The ref to compare against, e.g. "origin/main" or a commit sha.
+        cwd (Path): Any directory inside the repository.
+
+    Returns:
+        Set[Path]: The absolute paths of the changed files.
+
+    Raises:
+        GitError: If git is missing, `cwd` is not in a repository or `ref` is unknown.
+    """
+    toplevel = Path(_git(["rev-parse", "--show-toplevel"], cwd).strip())
+    base = _git(["merge-base", ref, "HEAD"], toplevel).strip()
+
+    tracked = _git(["diff", "--name-only", "--no-renames", "-z", base], toplevel)
+    untracked = _git(["ls-files", "--others", "--exclude-standard", "-z"], toplevel)
+    names = tracked.split("\0") + untracked.split("\0")
+    return {(toplevel / name).resolve() for name in names if name}
@@ -0,0 +1,65 @@
+import pytest
+import subprocess
+from pathlib import Path
+from .git_changes import GitError, changed_files
+
+
+def _git(repo, *args):
+    subprocess.run(["git", *args], cwd=str(repo), check=True, capture_output=True)
+
+
+@pytest.fixture
+def repo(tmpdir):
+    repo = Path(tmpdir) / "repo"
+    (repo / "infra").mkdir(parents=True)
+    (repo / "infra" / "main.tf").write_text("")
+    (repo / "infra" / "old.tf").write_text("")
+    (repo / "README.md").write_text("")
+    _git(repo, "init", "-q", "-b", "main")
+    _git(repo, "-c", "user.name=t", "-c", "user.email=t@t", "add", ".")
+    _git(repo, "-c", "user.name=t", "-c", "user.email=t@t", "commit", "-qm", "base")
+    yield repo.resolve()
+
+
+def test_changed_files(repo):
+    _git(repo, "checkout", "-qb", "feature")
+    (repo / "infra" / "main.tf").write_text('resource "x" "y" {}')
+    _git(repo, "rm", "-q", "infra/old.tf")
+    _git(repo, "-c", "user.name=t", "-c", "user.email=t@t", "commit", "-qam", "edit")
+    # uncommitted and untracked files count too
+    (repo / "README.md").write_text("changed")
+    (repo / "infra" / "new.tf").write_text("")
+
+    assert changed_files("main", repo / "infra") == {
+        repo / "infra" / "main.tf",
+        repo / "infra" / "old.tf",
+        repo / "infra" / "new.tf",
+        repo / "README.md",
+    }
+
+
+def test_changed_files_lists_both_sides_of_renames(repo):
+    _git(repo, "checkout", "-qb", "feature")
+    (repo / "modules").mkdir()
+    _git(repo, "mv", "infra/main.tf", "modules/main.tf")
+    _git(repo, "-c", "user.name=t", "-c", "user.email=t@t", "commit", "-qm", "move")
+
+    assert changed_files("main", repo) == {
+        repo / "infra" / "main.tf",
+        repo / "modules" / "main.tf",
+    }
+
+
+def test_changed_files_ignores_commits_on_ref(repo):
+    _git(repo, "checkout", "-qb", "feature")
+    _git(repo, "checkout", "-q", "main")
+    (repo / "README.md").write_text("changed on main")
+    _git(repo, "-c", "user.name=t", "-c", "user.email=t@t", "commit", "-qam", "main")
+    _git(repo, "checkout", "-q", "feature")
+
+    assert changed_files("main", repo) == set()
+
+
+def test_changed_files_unknown_ref(repo):
+    with pytest.raises(GitError, match="no-such-ref"):
+        changed_files("no-such-ref", repo)
@@ -1,40 +1,112 @@
+from azure.core.exceptions import ResourceNotFoundError
 from azure.identity import ClientSecretCredential
 from azure.keyvault.secrets import SecretClient
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Optional
 
 from . import logger
 
+import re
+
 VAULT_URL_BASE = "https://{}.vault.azure.net"
+DEFAULT_MAX_WORKERS = 16
+# the names Key Vault accepts, others are rejected with a bad request
+_SECRET_NAME_RE = re.compile(r"^[0-9A-Za-z-]{1,127}$")
+# returned by `_get_secret` for names missing from the vault, as a secret value may itself be None
+_MISSING = object()
 
 
 class AzureKeyVault:
     """Class to access secrets from an Azure Key Vault."""
 
-    def __init__(self, vault_name: str, credential: ClientSecretCredential) -> None:
+    def __init__(
+        self,
+        vault_name: str,
+        credential: ClientSecretCredential,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+    ) -> None:
         """
         Initialize a new instance of the AzureKeyVault class.
 
         Args:
             vault_name (str): The name of the Azure Key Vault.
             credential (ClientSecretCredential): The credential object for accessing the Key Vault.
+            max_workers (int): The maximum number of secrets fetched concurrently. A value of 1 fetches sequentially.
         """
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+
         vault_url = VAULT_URL_BASE.format(vault_name)
         self.secret_client = SecretClient(
             vault_url, credential=credential, verify_challenge_resource=False
         )
+        self.max_workers = max_workers
 
-    def get_secrets(self):
+    def _get_secret(self, name: str) -> Any:
         """
-        Get all the secrets in the Azure Key Vault.
+        Fetch a single secret value from the Azure Key Vault.
+
+        Args:
+            name (str): The name of the secret.
 
         Returns:
-            dict: A dictionary containing the names and values of all the secrets in the Azure Key Vault.
+            str: The value of the secret, or `_MISSING` if the secret does not exist.
         """
-        secrets = dict()
-        for secret_properties in self.secret_client.list_properties_of_secrets():
-            secret = self.secret_client.get_secret(secret_properties.name)
-            logger.info("Storing secret: [%s]", secret.name)
-            secrets[secret.name] = secret.value
-        return secrets
+        try:
+            secret = self.secret_client.get_secret(name)
+        except ResourceNotFoundError:
+            logger.warning("Secret not found in vault: [%s]", name)
+            return _MISSING
+        logger.info("Storing secret: [%s]", secret.name)
+        return secret.value
+
+    def get_secrets(
+        self,
+        names: Optional[Iterable[str]] = None,
+        max_workers: Optional[int] = None,
+    ) -> Dict[str, str]:
+        """
+        Get secrets from the Azure Key Vault.
+
+        Secrets are fetched on a bounded thread pool, so at most `max_workers`
+        requests are in flight at any time. When `names` is supplied only those
+        secrets are fetched and the vault listing is skipped; names missing from
+        the vault, or that are not valid secret names, are left out of the result.
+
+        Args:
+            names (Iterable[str], optional): The secret names to fetch. Defaults to every secret in the vault.
+            max_workers (int, optional): Overrides the worker count set on the instance.
+
+        Returns:
+            dict: A dictionary containing the names and values of the fetched secrets.
+
+        Raises:
+            ValueError: If `max_workers` is less than 1.
+        """
+        if max_workers is not None and max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+        workers = self.max_workers if max_workers is None else max_workers
+        if names is None:
+            names = [
+                secret_properties.name
+                for secret_properties in self.secret_client.list_properties_of_secrets()
+            ]
+        else:
+            invalid = {name for name in names if not _SECRET_NAME_RE.match(name)}
+            if invalid:
+                logger.debug(f"Not valid Key Vault secret names, not fetched: {invalid}")
+            names = sorted(set(names) - invalid)
+        logger.debug(f"Fetching {len(names)} secrets with {workers} workers")
+
+        if workers == 1 or len(names) <= 1:
+            values = [self._get_secret(name) for name in names]
+        else:
+            with ThreadPoolExecutor(max_workers=min(workers, len(names))) as pool:
+                values = list(pool.map(self._get_secret, names))
+
+        return {
+            name: value for name, value in zip(names, values) if value is not _MISSING
+        }
 
 
 if __name__ == "__main__":
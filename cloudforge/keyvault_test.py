@@ -0,0 +1,109 @@
+import threading
+import time
+import pytest
+
+from azure.core.exceptions import ResourceNotFoundError
+from types import SimpleNamespace
+
+from . import keyvault
+from .keyvault import AzureKeyVault
+
+
+class FakeSecretClient:
+    """Local stand-in for SecretClient that injects latency on every get."""
+
+    latency = 0.0
+    secrets = {}
+
+    def __init__(self, vault_url, credential=None, **kwargs):
+        self.vault_url = vault_url
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.calls = 0
+        self.listed = False
+        self._lock = threading.Lock()
+
+    def list_properties_of_secrets(self):
+        self.listed = True
+        return [SimpleNamespace(name=name) for name in self.secrets]
+
+    def get_secret(self, name):
+        with self._lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.latency)
+        with self._lock:
+            self.in_flight -= 1
+        if name not in self.secrets:
+            raise ResourceNotFoundError("SecretNotFound")
+        return SimpleNamespace(name=name, value=self.secrets[name])
+
+
+@pytest.fixture
+def fake_client(monkeypatch):
+    FakeSecretClient.secrets = {f"secret{i}": f"value{i}" for i in range(40)}
+    FakeSecretClient.latency = 0.01
+    monkeypatch.setattr(keyvault, "SecretClient", FakeSecretClient)
+    return FakeSecretClient
+
+
+def test_get_secrets_sequential(fake_client):
+    akv = AzureKeyVault("vault", credential=None, max_workers=1)
+    assert akv.get_secrets() == fake_client.secrets
+    assert akv.secret_client.max_in_flight == 1
+
+
+def test_get_secrets_concurrent_is_bounded(fake_client):
+    akv = AzureKeyVault("vault", credential=None, max_workers=4)
+    secrets = akv.get_secrets()
+    assert secrets == fake_client.secrets
+    assert list(secrets) == list(fake_client.secrets)
+    assert akv.secret_client.max_in_flight <= 4
+    assert akv.secret_client.calls == len(fake_client.secrets)
+
+
+def test_get_secrets_scales_with_workers(fake_client):
+    fake_client.latency = 0.02
+    sequential = AzureKeyVault("vault", credential=None, max_workers=1)
+    concurrent = AzureKeyVault("vault", credential=None, max_workers=20)
+
+    start = time.perf_counter()
+    sequential.get_secrets()
+    sequential_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    concurrent.get_secrets()
+    concurrent_time = time.perf_counter() - start
+
+    assert concurrent_time < sequential_time / 4
+
+
+def test_invalid_worker_count(fake_client):
+    with pytest.raises(ValueError):
+        AzureKeyVault("vault", credential=None, max_workers=0)
+    akv = AzureKeyVault("vault", credential=None)
+    with pytest.raises(ValueError):
+        akv.get_secrets(names=["secret1"], max_workers=0)
+
+
+def test_get_secrets_by_name_skips_listing(fake_client):
+    akv = AzureKeyVault("vault", credential=None, max_workers=4)
+    secrets = akv.get_secrets(names={"secret1", "secret7", "missing"})
+    assert secrets == {"secret1": "value1", "secret7": "value7"}
+    assert akv.secret_client.listed is False
+    assert akv.secret_client.calls == 3
+
+
+def test_get_secrets_keeps_empty_values(fake_client):
+    fake_client.secrets = {"set": "value", "unset": None}
+    akv = AzureKeyVault("vault", credential=None, max_workers=2)
+    assert akv.get_secrets() == {"set": "value", "unset": None}
+    assert akv.get_secrets(names=["unset", "missing"]) == {"unset": None}
+
+
+def test_get_secrets_skips_invalid_names(fake_client):
+    akv = AzureKeyVault("vault", credential=None, max_workers=4)
+    secrets = akv.get_secrets(names=["secret1", "my_secret", "a.b", "", "x" * 128])
+    assert secrets == {"secret1": "value1"}
+    assert akv.secret_client.calls == 1
@@ -0,0 +1,533 @@
+"""
+The terraform_cache module provides the TerraformBinaryCache class, a persistent on-disk cache of
+Terraform binaries shared between runs and between concurrent processes.
+
+Layout:
+    <cache_dir>/
+        .lock                          global lock guarding the index and eviction
+        index/<version>_<os>_<arch>    name of the blob holding that build
+        blobs/<sha256>/terraform       content-addressed binary
+        leases/<sha256>.lock           shared by every process running that binary
+
+Binaries are moved into `blobs/` through a staging directory and renamed into place, and index
+entries are written with `os.replace`, so readers never observe a half-installed binary. When the
+blobs exceed `max_bytes` the least recently used ones are evicted, except those still leased.
+
+Example Usage:
+cache = TerraformBinaryCache()
+key = cache.key("1.0.11", "linux", "amd64")
+tfbin = cache.get(key)
+...  # run tfbin
+cache.release()
+
+The module also provides the PluginCache class, a shared `TF_PLUGIN_CACHE_DIR` so provider
+packages are downloaded once and reused by every working directory:
+
+    <cache_dir>/
+        .lock                                                   held by writers (init, warm, prune)
+        <hostname>/<namespace>/<type>/<version>/<os>_<arch>/    unpacked provider package
+
+plugins = PluginCache()
+plugins.warm(mirror_dir)
+tf = Terraform(working_dir=workdir, env_vars=plugins.env())
+"""
+
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import hashlib
+import os
+import platform
+import semantic_version
+import shutil
+import re
+import tempfile
+import zipfile
+
+from . import CACHE_DIR, logger
+from .utils import FileLock, LockTimeoutError
+
+BINARY_NAME = "terraform"
+DEFAULT_MAX_CACHE_BYTES = 2 * 1024**3
+DEFAULT_MAX_PLUGIN_CACHE_BYTES = 5 * 1024**3
+
+# terraform-provider-<type>_<version>_<os>_<arch>.zip, as laid out in a packed provider mirror
+_PACKED_PROVIDER_RE = re.compile(
+    r"^terraform-provider-(?P<type>[\w-]+?)_(?P<version>[^_]+)_(?P<platform>[^_]+_[^_]+)\.zip$"
+)
+
+
+def host_platform() -> str:
+    """
+    Returns the platform Terraform installs providers for on this host.
+
+    Returns:
+        str: The `<os>_<arch>` platform, e.g. `linux_amd64`.
+    """
+    arch = platform.machine().lower()
+    arch = {"x86_64": "amd64", "aarch64": "arm64"}.get(arch, arch)
+    return f"{platform.system().lower()}_{arch}"
+
+
+def sha256_file(fpath: Path, chunk_size: int = 1024 * 1024) -> str:
+    """
+    Computes the SHA256 hex digest of a file without loading it into memory.
+
+    Args:
+        fpath (Path): The path of the file to hash.
+        chunk_size (int): The number of bytes read per iteration.
+
+    Returns:
+        str: The hex digest of the file content.
+    """
+    digest = hashlib.sha256()
+    with open(fpath, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class TerraformBinaryCache:
+    """
+    A size-bounded, content-addressed cache of Terraform binaries.
+
+    The binaries returned by `get` and `put` are leased until `release`, so another process
+    evicting blobs leaves them in place while they are run.
+
+    Args:
+        cache_dir (Path, optional): The root of the cache. Defaults to `<CACHE_DIR>/terraform`.
+        max_bytes (int): The maximum total size of cached binaries before LRU eviction kicks in.
+
+    Attributes:
+        root (Path): The root of the cache.
+        max_bytes (int): The maximum total size of cached binaries.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Optional[Path] = None,
+        max_bytes: int = DEFAULT_MAX_CACHE_BYTES,
+    ) -> None:
+        self.root: Path = Path(cache_dir) if cache_dir else CACHE_DIR / "terraform"
+        self.max_bytes: int = max_bytes
+        self._blobs: Path = self.root / "blobs"
+        self._index: Path = self.root / "index"
+        self._leases_dir: Path = self.root / "leases"
+        self._leases: Dict[str, FileLock] = {}
+
+        self._blobs.mkdir(parents=True, exist_ok=True)
+        self._index.mkdir(parents=True, exist_ok=True)
+        self._leases_dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def key(version: str, pyos: str, arch: str) -> str:
+        """
+        Builds the cache key of a Terraform build.
+
+        Args:
+            version (str): The Terraform version.
+            pyos (str): The operating system, e.g. `linux`.
+            arch (str): The architecture, e.g. `amd64`.
+
+        Returns:
+            str: The cache key.
+        """
+        return f"{version}_{pyos}_{arch}"
+
+    def lock(self, key: Optional[str] = None) -> FileLock:
+        """
+        Returns a lock on the whole cache, or on a single key when supplied.
+
+        Args:
+            key (str, optional): Lock only this key, so installs of other builds are not blocked.
+
+        Returns:
+            FileLock: An unacquired lock.
+        """
+        name = ".lock" if key is None else f".{key}.lock"
+        return FileLock(self.root / name)
+
+    def get(self, key: str) -> Optional[Path]:
+        """
+        Looks up a binary, marks it as recently used and leases it until `release`.
+
+        Args:
+            key (str): The cache key, see `key`.
+
+        Returns:
+            Path: The path of the cached binary, or `None` on a cache miss.
+        """
+        try:
+            digest = (self._index / key).read_text().strip()
+        except FileNotFoundError:
+            return None
+
+        # leased before the blob is checked: an eviction has either removed it already or skips it
+        self._lease(digest)
+        binary = self._blobs / digest / BINARY_NAME
+        if not binary.is_file():
+            self._leases.pop(digest).release()
+            return None
+
+        os.utime(binary.parent)
+        logger.debug(f"Terraform cache hit: [{key}]-->[{binary}]")
+        return binary
+
+    def find(
+        self,
+        match: Callable[[semantic_version.Version], bool],
+        pyos: str,
+        arch: str,
+    ) -> Optional[Tuple[semantic_version.Version, Path]]:
+        """
+        Finds the highest cached version accepted by `match` for a platform.
+
+        Args:
+            match (Callable[[semantic_version.Version], bool]): Returns True for acceptable versions.
+            pyos (str): The operating system, e.g. `linux`.
+            arch (str): The architecture, e.g. `amd64`.
+
+        Returns:
+            Tuple[semantic_version.Version, Path]: The version and path of the cached binary, or `None`.
+        """
+        candidates = []
+        for index_file in self._index.iterdir():
+            if index_file.name.startswith("."):
+                continue
+            version, key_os, key_arch = index_file.name.rsplit("_", 2)
+            if (key_os, key_arch) != (pyos, arch):
+                continue
+            try:
+                parsed = semantic_version.Version(version)
+            except ValueError:
+                continue
+            if match(parsed):
+                candidates.append(parsed)
+
+        for version in sorted(candidates, reverse=True):
+            binary = self.get(self.key(str(version), pyos, arch))
+            if binary is not None:
+                return version, binary
+        return None
+
+    def put(self, key: str, binary: Path) -> Path:
+        """
+        Moves a binary into the cache, records it under `key` and leases it until `release`.
+
+        Args:
+            key (str): The cache key, see `key`.
+            binary (Path): The binary to move into the cache. It is consumed by this call.
+
+        Returns:
+            Path: The path of the cached binary.
+        """
+        digest = sha256_file(binary)
+        blob_dir = self._blobs / digest
+
+        with self.lock():
+            if not (blob_dir / BINARY_NAME).is_file():
+                staging = Path(tempfile.mkdtemp(prefix=".staging-", dir=self.root))
+                shutil.move(str(binary), staging / BINARY_NAME)
+                os.chmod(staging / BINARY_NAME, 0o755)
+                os.rename(staging, blob_dir)
+                logger.info(f"Cached terraform binary: [{key}]-->[{blob_dir}]")
+            else:
+                os.remove(binary)
+                os.utime(blob_dir)
+
+            self._write_index(key, digest)
+            self._lease(digest)
+            self._evict(keep=digest)
+
+        return blob_dir / BINARY_NAME
+
+    def get_or_install(self, key: str, fetch: Callable[[Path], Path]) -> Path:
+        """
+        Returns a cached binary, calling `fetch` to produce it on a cache miss.
+
+        Concurrent callers asking for the same key are serialized, so a build is
+        downloaded at most once even when several jobs start together.
+
+        Args:
+            key (str): The cache key, see `key`.
+            fetch (Callable[[Path], Path]): Called with a scratch directory; must return the path of a fresh binary inside it.
+
+        Returns:
+            Path: The path of the cached binary.
+        """
+        binary = self.get(key)
+        if binary is not None:
+            return binary
+
+        with self.lock(key):
+            binary = self.get(key)
+            if binary is not None:
+                return binary
+
+            scratch = Path(tempfile.mkdtemp(prefix=".download-", dir=self.root))
+            try:
+                return self.put(key, fetch(scratch))
+            finally:
+                shutil.rmtree(scratch, ignore_errors=True)
+
+    def release(self) -> None:
+        """Releases the leases taken by `get` and `put`, once their binaries are no longer run."""
+        for lease in self._leases.values():
+            lease.release()
+        self._leases.clear()
+
+    def _lease_lock(self, digest: str, **kwargs) -> FileLock:
+        return FileLock(self._leases_dir / f"{digest}.lock", **kwargs)
+
+    def _lease(self, digest: str) -> None:
+        if digest not in self._leases:
+            self._leases[digest] = self._lease_lock(digest, shared=True).acquire()
+
+    def _write_index(self, key: str, digest: str) -> None:
+        tmp = self._index / f".{key}.tmp"
+        tmp.write_text(digest)
+        os.replace(tmp, self._index / key)
+
+    def _blob_usage(self) -> List[Tuple[float, int, Path]]:
+        usage = []
+        for blob_dir in self._blobs.iterdir():
+            binary = blob_dir / BINARY_NAME
+            if not binary.is_file():
+                continue
+            usage.append((blob_dir.stat().st_mtime, binary.stat().st_size, blob_dir))
+        return sorted(usage)
+
+    def _evict(self, keep: Optional[str] = None) -> None:
+        """Removes least recently used blobs until the cache fits in `max_bytes`, skipping leased ones."""
+        usage = self._blob_usage()
+        total = sum(size for _, size, _ in usage)
+
+        evicted = set()
+        for _, size, blob_dir in usage:
+            if total <= self.max_bytes:
+                break
+            if blob_dir.name == keep:
+                continue
+            try:
+                lease = self._lease_lock(blob_dir.name, timeout=0).acquire()
+            except LockTimeoutError:
+                logger.debug(f"Not evicting terraform binary in use: {blob_dir}")
+                continue
+            try:
+                logger.warning(f"Evicting cached terraform binary: {blob_dir}")
+                shutil.rmtree(blob_dir, ignore_errors=True)
+            finally:
+                lease.release()
+            evicted.add(blob_dir.name)
+            total -= size
+
+        if not evicted:
+            return
+
+        for index_file in self._index.iterdir():
+            if index_file.read_text().strip() in evicted:
+                index_file.unlink()
+
+
+class PluginCache:
+    """
+    A shared, size-bounded Terraform provider plugin cache.
+
+    Terraform does not guard `TF_PLUGIN_CACHE_DIR` against concurrent writers, so callers hold
+    `lock` while running an init that may install providers into it, see `holds`. Entries are `<hostname>/<namespace>/<type>/<version>/<platform>`
+    directories; the least recently used ones are removed by `prune`.
+
+    Args:
+        cache_dir (Path, optional): The root of the cache. Defaults to `<CACHE_DIR>/plugins`.
+        max_bytes (int): The maximum total size of cached providers kept by `prune`.
+
+    Attributes:
+        root (Path): The root of the cache.
+        max_bytes (int): The maximum total size of cached providers.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Optional[Path] = None,
+        max_bytes: int = DEFAULT_MAX_PLUGIN_CACHE_BYTES,
+    ) -> None:
+        self.root: Path = Path(cache_dir) if cache_dir else CACHE_DIR / "plugins"
+        self.max_bytes: int = max_bytes
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def env(self) -> Dict[str, str]:
+        """
+        Builds the environment variables pointing Terraform at the cache.
+
+        Returns:
+            Dict[str, str]: The environment variables to pass to `Terraform`.
+        """
+        return {"TF_PLUGIN_CACHE_DIR": str(self.root.absolute())}
+
+    def lock(self) -> FileLock:
+        """
+        Returns the lock held by writers of the cache.
+
+        Returns:
+            FileLock: An unacquired lock.
+        """
+        return FileLock(self.root / ".lock")
+
+    def entries(self) -> Iterator[Path]:
+        """
+        Iterates over the cached provider packages.
+
+        Yields:
+            Path: The `<hostname>/<namespace>/<type>/<version>/<platform>` directory of each package.
+        """
+        for entry in self.root.glob("*/*/*/*/*"):
+            if entry.is_dir() and not entry.relative_to(self.root).parts[0].startswith(
+                "."
+            ):
+                yield entry
+
+    def warm(
+        self, mirror_dir: Path, platforms: Optional[Sequence[str]] = None
+    ) -> List[Path]:
+        """
+        Seeds the cache from a filesystem provider mirror.
+
+        Both the packed (`terraform-provider-<type>_<version>_<platform>.zip`) and unpacked
+        (`<version>/<platform>/`) mirror layouts are understood. Packages already in the cache
+        are left alone.
+
+        Args:
+            mirror_dir (Path): The root of the mirror, holding `<hostname>/<namespace>/<type>/` directories.
+            platforms (Sequence[str], optional): Only seed these platforms, e.g. `linux_amd64`. Defaults to all.
+
+        Returns:
+            List[Path]: The cache entries that were added.
+        """
+        added = []
+        with self.lock():
+            for relpath, version, platform, src in _iter_mirror(Path(mirror_dir)):
+                if platforms is not None and platform not in platforms:
+                    continue
+                entry = self.root / relpath / version / platform
+                if entry.exists():
+                    continue
+                self._install_entry(entry, src)
+                logger.info(f"Seeded provider plugin cache: [{entry}]")
+                added.append(entry)
+        return added
+
+    def holds(self, providers: Dict[str, str], platform: str) -> bool:
+        """
+        Checks whether every provider version is cached for a platform, so an init needing only
+        these takes them from the cache and writes nothing to it.
+
+        The check holds the lock, so a package another init is still writing does not count.
+
+        Args:
+            providers (Dict[str, str]): Provider addresses mapped to their version, see `parse_lock_file`.
+            platform (str): The platform, see `host_platform`.
+
+        Returns:
+            bool: Whether all of them are cached.
+        """
+        with self.lock():
+            return all(
+                (self.root / address / version / platform).is_dir()
+                for address, version in providers.items()
+            )
+
+    def touch_used(self, workdir: Path) -> None:
+        """
+        Marks the providers installed in `workdir` as recently used, so `prune` keeps them.
+
+        Args:
+            workdir (Path): A working directory `terraform init` ran in.
+        """
+        for installed in (Path(workdir) / ".terraform" / "providers").glob("*/*/*/*/*"):
+            entry = self.root / installed.relative_to(installed.parents[4])
+            if entry.is_dir():
+                os.utime(entry)
+
+    def missing_providers(self, workdir: Path) -> List[Path]:
+        """
+        Lists the providers installed in `workdir` whose files are gone, e.g. links into the
+        cache left dangling after `prune` evicted their packages.
+
+        Args:
+            workdir (Path): A working directory `terraform init` ran in.
+
+        Returns:
+            List[Path]: The installed provider directories that no longer resolve.
+        """
+        providers = (Path(workdir) / ".terraform" / "providers").glob("*/*/*/*/*")
+        return [installed for installed in providers if not installed.exists()]
+
+    def prune(self, max_bytes: Optional[int] = None) -> List[Path]:
+        """
+        Removes the least recently used providers until the cache fits in `max_bytes`.
+
+        Args:
+            max_bytes (int, optional): Overrides the size limit set on the instance.
+
+        Returns:
+            List[Path]: The cache entries that were removed.
+        """
+        limit = self.max_bytes if max_bytes is None else max_bytes
+        removed = []
+        with self.lock():
+            usage = sorted(
+                (entry.stat().st_mtime, _dir_size(entry), entry)
+                for entry in self.entries()
+            )
+            total = sum(size for _, size, _ in usage)
+            for _, size, entry in usage:
+                if total <= limit:
+                    break
+                logger.warning(f"Evicting cached provider: {entry}")
+                shutil.rmtree(entry, ignore_errors=True)
+                removed.append(entry)
+                total -= size
+        return removed
+
+    def _install_entry(self, entry: Path, src: Path) -> None:
+        """Installs a package through a staging directory so readers never see it half-written."""
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        staging = Path(tempfile.mkdtemp(prefix=".staging-", dir=self.root))
+        try:
+            if src.is_file():
+                _extract_zip(src, staging / "package")
+            else:
+                shutil.copytree(src, staging / "package")
+            os.rename(staging / "package", entry)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+
+def _iter_mirror(mirror_dir: Path) -> Iterator[Tuple[Path, str, str, Path]]:
+    """Yields `(<hostname>/<namespace>/<type>, version, platform, package)` for every package of a mirror."""
+    for type_dir in mirror_dir.glob("*/*/*"):
+        if not type_dir.is_dir():
+            continue
+        relpath = type_dir.relative_to(mirror_dir)
+        for child in sorted(type_dir.iterdir()):
+            packed = _PACKED_PROVIDER_RE.match(child.name)
+            if packed and child.is_file():
+                yield relpath, packed["version"], packed["platform"], child
+            elif child.is_dir():
+                for platform_dir in sorted(child.iterdir()):
+                    if platform_dir.is_dir():
+                        yield relpath, child.name, platform_dir.name, platform_dir
+
+
+def _extract_zip(src: Path, dest: Path) -> None:
+    with zipfile.ZipFile(src) as zfile:
+        for info in zfile.infolist():
+            extracted = Path(zfile.extract(info, dest))
+            # zipfile drops the permission bits, provider executables need them back
+            mode = info.external_attr >> 16
+            if mode:
+                os.chmod(extracted, mode)
+
+
+def _dir_size(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
@@ -0,0 +1,103 @@
+import os
+import pytest
+import zipfile
+from pathlib import Path
+from .terraform_cache import PluginCache
+from .terraform_exec import Terraform
+
+AZURERM = Path("registry.terraform.io/hashicorp/azurerm")
+RANDOM = Path("registry.terraform.io/hashicorp/random")
+
+
+@pytest.fixture
+def mirror(tmpdir):
+    """A fake filesystem provider mirror mixing the packed and unpacked layouts."""
+    root = Path(tmpdir) / "mirror"
+
+    # packed: terraform-provider-<type>_<version>_<platform>.zip
+    (root / AZURERM).mkdir(parents=True)
+    for platform in ("linux_amd64", "darwin_arm64"):
+        with zipfile.ZipFile(
+            root / AZURERM / f"terraform-provider-azurerm_3.0.0_{platform}.zip", "w"
+        ) as zfile:
+            info = zipfile.ZipInfo("terraform-provider-azurerm_v3.0.0_x5")
+            info.external_attr = 0o755 << 16
+            zfile.writestr(info, b"\0" * 1024)
+
+    # unpacked: <version>/<platform>/
+    unpacked = root / RANDOM / "3.4.0" / "linux_amd64"
+    unpacked.mkdir(parents=True)
+    (unpacked / "terraform-provider-random_v3.4.0_x5").write_bytes(b"\0" * 512)
+
+    yield root
+
+
+@pytest.fixture
+def plugins(tmpdir):
+    yield PluginCache(Path(tmpdir) / "plugins")
+
+
+def test_warm_from_mirror(plugins, mirror):
+    added = plugins.warm(mirror)
+
+    assert sorted(p.relative_to(plugins.root) for p in added) == [
+        AZURERM / "3.0.0" / "darwin_arm64",
+        AZURERM / "3.0.0" / "linux_amd64",
+        RANDOM / "3.4.0" / "linux_amd64",
+    ]
+    binary = (
+        plugins.root
+        / AZURERM
+        / "3.0.0/linux_amd64/terraform-provider-azurerm_v3.0.0_x5"
+    )
+    assert binary.is_file() and os.access(binary, os.X_OK)
+
+    # already cached packages are left alone
+    assert plugins.warm(mirror) == []
+
+
+def test_warm_platform_filter(plugins, mirror):
+    added = plugins.warm(mirror, platforms=["linux_amd64"])
+
+    assert {p.name for p in added} == {"linux_amd64"}
+    assert not (plugins.root / AZURERM / "3.0.0" / "darwin_arm64").exists()
+
+
+def test_prune_evicts_least_recently_used(plugins, mirror, tmpdir):
+    plugins.warm(mirror)
+    for mtime, relpath in enumerate(
+        [
+            AZURERM / "3.0.0" / "darwin_arm64",
+            AZURERM / "3.0.0" / "linux_amd64",
+            RANDOM / "3.4.0" / "linux_amd64",
+        ]
+    ):
+        os.utime(plugins.root / relpath, (1000 + mtime, 1000 + mtime))
+
+    # a working directory that used darwin azurerm marks it as recently used
+    workdir = Path(tmpdir) / "workdir"
+    used = workdir / ".terraform" / "providers" / AZURERM / "3.0.0" / "darwin_arm64"
+    used.mkdir(parents=True)
+    plugins.touch_used(workdir)
+
+    removed = plugins.prune(max_bytes=1024)
+
+    assert [p.relative_to(plugins.root) for p in removed] == [
+        AZURERM / "3.0.0" / "linux_amd64",
+        RANDOM / "3.4.0" / "linux_amd64",
+    ]
+    assert [p.relative_to(plugins.root) for p in plugins.entries()] == [
+        AZURERM / "3.0.0" / "darwin_arm64"
+    ]
+
+
+def test_plugin_cache_injected_into_terraform(plugins, tmpdir):
+    fake_tf = Path(tmpdir) / "terraform"
+    fake_tf.write_text('#!/bin/sh\necho "$TF_PLUGIN_CACHE_DIR"\n')
+    fake_tf.chmod(0o755)
+
+    tf = Terraform(terraform_bin_path=str(fake_tf), env_vars=plugins.env())
+    ret_code, out, _ = tf.cmd("version")
+
+    assert ret_code == 0
+    assert out.strip() == str(plugins.root.absolute())
@@ -1,40 +1,279 @@
+import asyncio
+import hashlib
 import json
 import os
 import subprocess
 import sys
 import tempfile
-from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Type, Union
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    Union,
+)
 
 from . import logger
+from .terraform_plan import PlanResult, read_state_header
+from .terraform_stream import (
+    DEFAULT_KILL_TIMEOUT,
+    DEFAULT_TAIL_BYTES,
+    CommandResult,
+    LineCallback,
+    read_tail,
+    run_streaming,
+    spool_paths,
+)
 
 COMMAND_WITH_SUBCOMMANDS = {"workspace"}
 
 
+# canonical JSON of resource attributes, hashed to skip unchanged instances when diffing
+_DIGEST_ENCODER = json.JSONEncoder(sort_keys=True, separators=(",", ":"))
+
+
+def _attribute_changes(
+    before: Any, after: Any, path: str = ""
+) -> Iterator[Tuple[str, Any, Any]]:
+    """Yield (attribute path, before, after) for every leaf that differs, e.g. ('tags.env', 'dev', 'stg')."""
+    if isinstance(before, dict) and isinstance(after, dict):
+        for key in sorted(before.keys() | after.keys()):
+            yield from _attribute_changes(
+                before.get(key), after.get(key), f"{path}.{key}" if path else key
+            )
+    elif isinstance(before, list) and isinstance(after, list):
+        for i in range(max(len(before), len(after))):
+            yield from _attribute_changes(
+                before[i] if i < len(before) else None,
+                after[i] if i < len(after) else None,
+                f"{path}[{i}]",
+            )
+    elif before != after:
+        yield path, before, after
+
+
+class StateChange:
+    """A resource instance that differs between two states.
+
+    :param address: address of the resource instance
+    :param action: 'added', 'removed' or 'changed'
+    :param before: attributes in the first state, None if added
+    :param after: attributes in the second state, None if removed
+    """
+
+    SYMBOLS = {"added": "+", "removed": "-", "changed": "~"}
+
+    def __init__(
+        self,
+        address: str,
+        action: str,
+        before: Optional[Dict[str, Any]] = None,
+        after: Optional[Dict[str, Any]] = None,
+    ):
+        self.address = address
+        self.action = action
+        self.before = before
+        self.after = after
+
+    @property
+    def attribute_changes(self) -> List[Tuple[str, Any, Any]]:
+        """(attribute path, before, after) of every attribute that differs"""
+        if self.action != "changed":
+            return []
+        return list(_attribute_changes(self.before, self.after))
+
+    def to_dict(self) -> Dict[str, Any]:
+        data: Dict[str, Any] = {"address": self.address, "action": self.action}
+        if self.action == "changed":
+            data["attributes"] = [
+                {"path": path, "before": before, "after": after}
+                for path, before, after in self.attribute_changes
+            ]
+        return data
+
+    def format(self) -> str:
+        """Render the change as text, one more line per differing attribute."""
+        lines = [f"{self.SYMBOLS[self.action]} {self.address}"]
+        for path, before, after in self.attribute_changes:
+            lines.append(f"    {path}: {json.dumps(before)} -> {json.dumps(after)}")
+        return "\n".join(lines)
+
+    def __repr__(self) -> str:
+        return f"StateChange({self.address!r}, {self.action!r})"
+
+
 class Tfstate:
-    def __init__(self, data: Optional[Dict[str, str]] = None):
-        self.tfstate_file: Optional[str] = None
-        self.native_data = data
-        if data:
-            self.__dict__ = data
+    """Terraform state, read from its file on first access.
+
+    The file is read again only once it changed: its modification time and
+    size are checked on every access, and when they differ the serial and
+    lineage at the head of the file decide whether the state really is new.
+    Top level keys of the state are exposed as attributes, e.g. ``serial``
+    or ``resources``, and resource instances are indexed by address, type and
+    module.
+
+    :param data: state already in memory, instead of a file
+    :param tfstate_file: path of the state file
+    """
+
+    def __init__(
+        self,
+        data: Optional[Dict[str, Any]] = None,
+        tfstate_file: Optional[str] = None,
+    ):
+        self.tfstate_file = tfstate_file
+        self._data = data
+        self._stat: Optional[Tuple[int, int]] = None
+        self._header: Tuple[Optional[int], Optional[str]] = (None, None)
+        self._index: Optional[Dict[str, Dict[str, Any]]] = None
+        self._digests: Optional[Dict[str, bytes]] = None
+        self._by_type: Dict[str, List[Dict[str, Any]]] = {}
+        self._by_module: Dict[str, List[Dict[str, Any]]] = {}
 
     @staticmethod
     def load_file(file_path: str) -> "Tfstate":
-        """Read the tfstate file and load its contents.
-
-        Parses then as JSON and put the result into the object.
+        """Bind a tfstate file, its contents are read on first access."""
+        return Tfstate(tfstate_file=file_path)
+
+    def _refresh(self) -> None:
+        if self.tfstate_file is None:
+            return
+        try:
+            st = os.stat(self.tfstate_file)
+        except OSError:
+            logger.debug("%s does not exist", self.tfstate_file)
+            self._stat, self._header = None, (None, None)
+            self._data, self._index = None, None
+            return
+
+        stat = (st.st_mtime_ns, st.st_size)
+        if stat == self._stat:
+            return
+        header = read_state_header(self.tfstate_file)
+        self._stat = stat
+        if self._data is not None and header == self._header and header[0] is not None:
+            # rewritten but the same state, e.g. touched by a command
+            return
+
+        logger.debug("read data from %s", self.tfstate_file)
+        with open(self.tfstate_file) as f:
+            self._data = json.load(f)
+        self._header = header
+        self._index = None
+
+    @property
+    def native_data(self) -> Optional[Dict[str, Any]]:
+        """The state as parsed from the file, None if there is none."""
+        self._refresh()
+        return self._data
+
+    def __getattr__(self, item: str) -> Any:
+        if item.startswith("_"):
+            raise AttributeError(item)
+        data = self.native_data
+        if data and item in data:
+            return data[item]
+        raise AttributeError(item)
+
+    def _indexed(self) -> Dict[str, Dict[str, Any]]:
+        data = self.native_data
+        if self._index is not None:
+            return self._index
+
+        self._index, self._by_type, self._by_module = {}, {}, {}
+        self._digests = None
+        for resource in (data or {}).get("resources", []):
+            module = resource.get("module", "")
+            address = f"{resource['type']}.{resource['name']}"
+            if resource.get("mode") == "data":
+                address = f"data.{address}"
+            if module:
+                address = f"{module}.{address}"
+            for instance in resource.get("instances", []):
+                key = instance.get("index_key")
+                suffix = "" if key is None else f"[{json.dumps(key)}]"
+                entry = {
+                    "address": address + suffix,
+                    "mode": resource.get("mode"),
+                    "type": resource["type"],
+                    "name": resource["name"],
+                    "module": module,
+                    "provider": resource.get("provider"),
+                    "index_key": key,
+                    "attributes": instance.get("attributes", {}),
+                }
+                self._index[entry["address"]] = entry
+                self._by_type.setdefault(entry["type"], []).append(entry)
+                self._by_module.setdefault(module, []).append(entry)
+        return self._index
+
+    @property
+    def addresses(self) -> List[str]:
+        """Addresses of every resource instance in the state."""
+        return list(self._indexed())
+
+    def resource(self, address: str) -> Optional[Dict[str, Any]]:
+        """Look up a resource instance.
+
+        :param address: full address, e.g. 'module.net.azurerm_subnet.a["x"]'
+        :return: dict with address, mode, type, name, module, provider,
+                 index_key and attributes, or None if it is not in the state
         """
-        logger.debug("read data from %s", file_path)
-        if os.path.exists(file_path):
-            with open(file_path) as f:
-                json_data = json.load(f)
+        return self._indexed().get(address)
+
+    def resources_by_type(self, resource_type: str) -> List[Dict[str, Any]]:
+        """Resource instances of a type, e.g. 'azurerm_storage_account'."""
+        self._indexed()
+        return list(self._by_type.get(resource_type, ()))
+
+    def resources_in_module(self, module: str = "") -> List[Dict[str, Any]]:
+        """Resource instances declared directly in a module, '' for the root module."""
+        self._indexed()
+        return list(self._by_module.get(module, ()))
+
+    def _instance_digests(self) -> Dict[str, bytes]:
+        index = self._indexed()
+        if self._digests is None:
+            self._digests = {
+                address: hashlib.blake2b(
+                    _DIGEST_ENCODER.encode(entry["attributes"]).encode(), digest_size=16
+                ).digest()
+                for address, entry in index.items()
+            }
+        return self._digests
 
-            tf_state = Tfstate(json_data)
-            tf_state.tfstate_file = file_path
-            return tf_state
+    def diff(self, other: "Tfstate") -> Iterator[StateChange]:
+        """Compare with another state, e.g. this one before an apply and other after it.
 
-        logger.debug("%s does not exist", file_path)
+        Resource instances are matched by address and compared by a hash of
+        their attributes, only those whose hash differs are compared attribute
+        by attribute, lazily, when their attribute_changes are read.
 
-        return Tfstate()
+        :param other: the state to compare with
+        :return: iterator of StateChange, in address order, unchanged
+                 instances are skipped
+        """
+        mine, theirs = self._indexed(), other._indexed()
+        my_digests, their_digests = self._instance_digests(), other._instance_digests()
+        for address in sorted(mine.keys() | theirs.keys()):
+            if address not in theirs:
+                yield StateChange(
+                    address, "removed", before=mine[address]["attributes"]
+                )
+            elif address not in mine:
+                yield StateChange(address, "added", after=theirs[address]["attributes"])
+            elif my_digests[address] != their_digests[address]:
+                yield StateChange(
+                    address,
+                    "changed",
+                    before=mine[address]["attributes"],
+                    after=theirs[address]["attributes"],
+                )
 
 
 class TerraformFlag:
@@ -76,6 +315,9 @@ class Terraform:
         var_file: Optional[str] = None,
         terraform_bin_path: Optional[str] = None,
         is_env_vars_included: bool = True,
+        env_vars: Optional[Dict[str, str]] = None,
+        spool_dir: Optional[str] = None,
+        tail_bytes: int = DEFAULT_TAIL_BYTES,
     ):
         """
         :param working_dir: the folder of the working folder, if not given,
@@ -92,8 +334,15 @@ class Terraform:
         :param terraform_bin_path: binary path of terraform
         :type is_env_vars_included: bool
         :param is_env_vars_included: included env variables when calling terraform cmd
+        :param env_vars: extra env variables when calling terraform cmd,
+                        will override the ones inherited from the environment
+        :param spool_dir: where output is written with capture_output="spool"
+        :param tail_bytes: how much of the output is kept in memory with capture_output="spool"
         """
         self.is_env_vars_included = is_env_vars_included
+        self.env_vars = dict() if env_vars is None else env_vars
+        self.spool_dir = spool_dir
+        self.tail_bytes = tail_bytes
         self.working_dir = working_dir
         self.state = state
         self.targets = [] if targets is None else targets
@@ -319,6 +568,7 @@ class Terraform:
         capture_output: Union[bool, str] = True,
         raise_on_error: bool = True,
         synchronous: bool = True,
+        on_line: Sequence[LineCallback] = (),
         **kwargs,
     ) -> CommandOutput:
         """Run a terraform command, if success, will try to read state file
@@ -338,6 +588,10 @@ class Terraform:
                 if the option 'capture_output' is passed (with any value other than
                     True), terraform output will be printed to stdout/stderr and
                     "None" will be returned as out and err.
+                if the option 'capture_output' is "spool", terraform output is written
+                    to files in 'spool_dir' and only the last 'tail_bytes' of it are
+                    returned as out and err; the files are exposed as out_path and
+                    err_path on the result.
                 if the option 'raise_on_error' is passed (with any value that evaluates to True),
                     and the terraform command returns a nonzerop return code, then
                     a TerraformCommandError exception will be raised. The exception object will
@@ -345,11 +599,32 @@ class Terraform:
                       returncode: The command's return code
                       out: The captured stdout, or None if not captured
                       err: The captured stderr, or None if not captured
+                if the option 'on_line' is passed, output is streamed line by line to
+                    the callbacks while the command runs, see 'cmd_async'
         :return: ret_code, out, err
         """
+        if on_line:
+            return asyncio.run(
+                self.cmd_async(
+                    cmd,
+                    *args,
+                    capture_output=(
+                        capture_output if capture_output in (True, "spool") else False
+                    ),
+                    raise_on_error=raise_on_error,
+                    on_line=on_line,
+                    **kwargs,
+                )
+            )
+
+        out_path = err_path = None
         if capture_output is True:
             stderr = subprocess.PIPE
             stdout = subprocess.PIPE
+        elif capture_output == "spool":
+            out_path, err_path = spool_paths(self.spool_dir, cmd.split()[0])
+            stdout = open(out_path, "wb")
+            stderr = open(err_path, "wb")
         elif capture_output == "framework":
             stderr = None
             stdout = None
@@ -362,15 +637,22 @@ class Terraform:
 
         working_folder = self.working_dir if self.working_dir else None
 
-        environ_vars = {}
-        if self.is_env_vars_included:
-            environ_vars = os.environ.copy()
-        p = subprocess.Popen(
-            cmds, stdout=stdout, stderr=stderr, cwd=working_folder, env=environ_vars
-        )
+        try:
+            p = subprocess.Popen(
+                cmds,
+                stdout=stdout,
+                stderr=stderr,
+                cwd=working_folder,
+                env=self._environ(),
+            )
+        finally:
+            if capture_output == "spool":
+                # the child holds its own handles to the spool files
+                stdout.close()
+                stderr.close()
 
         if not synchronous:
-            return None, None, None
+            return CommandResult(None, None, None, out_path=out_path, err_path=err_path)
 
         out, err = p.communicate()
         ret_code = p.returncode
@@ -385,6 +667,9 @@ class Terraform:
         if capture_output is True:
             out = out.decode()
             err = err.decode()
+        elif capture_output == "spool":
+            out = read_tail(out_path, self.tail_bytes)
+            err = read_tail(err_path, self.tail_bytes)
         else:
             out = None
             err = None
@@ -392,7 +677,72 @@ class Terraform:
         if ret_code and raise_on_error:
             raise TerraformCommandError(ret_code, " ".join(cmds), out=out, err=err)
 
-        return ret_code, out, err
+        return CommandResult(ret_code, out, err, out_path=out_path, err_path=err_path)
+
+    async def cmd_async(
+        self,
+        cmd: str,
+        *args,
+        capture_output: Union[bool, str] = True,
+        raise_on_error: bool = True,
+        on_line: Sequence[LineCallback] = (),
+        kill_timeout: float = DEFAULT_KILL_TIMEOUT,
+        **kwargs,
+    ) -> CommandOutput:
+        """Run a terraform command on asyncio, streaming its output line by line
+
+        Unlike 'cmd', output is not buffered until the process exits: every line of
+        stdout and stderr is handed to the 'on_line' callbacks as soon as it is
+        written. Cancelling the awaiting task terminates terraform's process group.
+
+        :param cmd: command and sub-command of terraform, see 'cmd'
+        :param args: arguments of a command
+        :param capture_output: whether to also return the output,
+                    if False "None" will be returned as out and err,
+                    if "spool" the output is written to files, see 'cmd'
+        :param raise_on_error: raise a TerraformCommandError on a nonzero return code
+        :param on_line: callbacks called with the stream name ("stdout" or "stderr")
+                    and each line of output, e.g. LoggerSink, FileSink, ProgressSink
+        :param kill_timeout: seconds to wait after SIGTERM before killing the process group
+        :param kwargs: option flags, see 'cmd'
+        :return: ret_code, out, err
+        """
+        cmds = self.generate_cmd_string(cmd, *args, **kwargs)
+        logger.info("Command: %s", " ".join(cmds))
+
+        try:
+            result = await run_streaming(
+                cmds,
+                cwd=self.working_dir if self.working_dir else None,
+                env=self._environ(),
+                on_line=on_line,
+                capture_output=capture_output,
+                kill_timeout=kill_timeout,
+                spool_dir=self.spool_dir,
+                spool_name=cmd.split()[0],
+                tail_bytes=self.tail_bytes,
+            )
+        finally:
+            self.temp_var_files.clean_up()
+
+        if result.ret_code == 0:
+            self.read_state_file()
+        else:
+            logger.warning("error: %s", result.err)
+
+        if result.ret_code and raise_on_error:
+            raise TerraformCommandError(
+                result.ret_code, " ".join(cmds), out=result.out, err=result.err
+            )
+
+        return result
+
+    def _environ(self) -> Dict[str, str]:
+        environ_vars = {}
+        if self.is_env_vars_included:
+            environ_vars = os.environ.copy()
+        environ_vars.update(self.env_vars)
+        return environ_vars
 
     def output(
         self, *args, capture_output: bool = True, **kwargs
@@ -430,11 +780,35 @@ class Terraform:
 
         return json.loads(out.lstrip())
 
+    def show_plan(self, plan_file: str, **kwargs) -> PlanResult:
+        """Refer to https://www.terraform.io/docs/commands/show.html
+
+        Parses the JSON representation of a saved plan. The output is spooled to
+        disk and scanned in chunks, so a large plan is never loaded whole.
+
+        :param plan_file: path of the plan file, relative to the working folder
+        :param kwargs: same as kwags in method 'cmd'
+        :return: PlanResult with the resource changes of the plan
+        :raises TerraformCommandError: if terraform show fails
+        """
+        kwargs["json"] = IsFlagged
+        kwargs["capture_output"] = "spool"
+        kwargs["raise_on_error"] = False
+        result = self.cmd("show", plan_file, **kwargs)
+        try:
+            if result.ret_code:
+                raise TerraformCommandError(
+                    result.ret_code, "show", out=result.out, err=result.err
+                )
+            return PlanResult.from_file(result.out_path)
+        finally:
+            # the plan holds sensitive values
+            result.remove_spool()
+
     def read_state_file(self, file_path=None) -> None:
-        """Read .tfstate file
+        """Bind .tfstate file, it is read on first access of self.tfstate
 
         :param file_path: relative path to working dir
-        :return: states file in dict type
         """
 
         working_dir = self.working_dir or ""
@@ -451,7 +825,9 @@ class Terraform:
 
         file_path = os.path.join(working_dir, file_path)
 
-        self.tfstate = Tfstate.load_file(file_path)
+        # keep the bound state, and what it already read, while the path is unchanged
+        if self.tfstate is None or self.tfstate.tfstate_file != file_path:
+            self.tfstate = Tfstate.load_file(file_path)
 
     def set_workspace(self, workspace, *args, **kwargs) -> CommandOutput:
         """Set workspace
@@ -0,0 +1,181 @@
+import json
+import os
+import pytest
+from pathlib import Path
+from . import terraform_exec
+from .terraform_exec import StateChange, Terraform, Tfstate
+
+
+def _state(serial, resources):
+    return {
+        "version": 4,
+        "terraform_version": "1.5.7",
+        "serial": serial,
+        "lineage": "6d1c",
+        "outputs": {},
+        "resources": resources,
+    }
+
+
+RESOURCES = [
+    {
+        "mode": "managed",
+        "type": "azurerm_resource_group",
+        "name": "rg",
+        "provider": 'provider["registry.terraform.io/hashicorp/azurerm"]',
+        "instances": [{"attributes": {"name": "rg-dev"}}],
+    },
+    {
+        "module": "module.network",
+        "mode": "managed",
+        "type": "azurerm_subnet",
+        "name": "subnet",
+        "instances": [
+            {"index_key": "aks", "attributes": {"name": "snet-aks"}},
+            {"index_key": "db", "attributes": {"name": "snet-db"}},
+        ],
+    },
+    {
+        "mode": "data",
+        "type": "azurerm_client_config",
+        "name": "current",
+        "instances": [{"attributes": {}}],
+    },
+    {
+        "module": "module.network",
+        "mode": "managed",
+        "type": "azurerm_virtual_network",
+        "name": "vnet",
+        "instances": [{"index_key": 0, "attributes": {"name": "vnet-dev"}}],
+    },
+]
+
+
+@pytest.fixture
+def state_file(tmpdir):
+    fpath = Path(tmpdir) / "terraform.tfstate"
+    fpath.write_text(json.dumps(_state(1, RESOURCES)))
+    yield fpath
+
+
+def test_state_is_read_lazily(state_file, monkeypatch):
+    loads = []
+    json_load = json.load
+    monkeypatch.setattr(
+        terraform_exec.json, "load", lambda f: loads.append(f) or json_load(f)
+    )
+
+    state = Tfstate.load_file(str(state_file))
+    assert loads == []
+
+    assert state.serial == 1
+    assert state.lineage == "6d1c"
+    state.resources, state.native_data
+    assert len(loads) == 1
+
+
+def test_state_reloads_when_serial_changes(state_file):
+    state = Tfstate.load_file(str(state_file))
+    assert state.serial == 1
+
+    state_file.write_text(json.dumps(_state(2, RESOURCES[:1])))
+    os.utime(state_file, ns=(1, 1))
+    assert state.serial == 2
+    assert state.addresses == ["azurerm_resource_group.rg"]
+
+    state_file.unlink()
+    assert state.native_data is None
+    with pytest.raises(AttributeError):
+        state.serial
+
+
+def test_state_keeps_data_when_only_touched(state_file):
+    state = Tfstate.load_file(str(state_file))
+    data = state.native_data
+
+    os.utime(state_file, ns=(1, 1))
+    assert state.native_data is data
+
+
+def test_state_index(state_file):
+    state = Tfstate.load_file(str(state_file))
+
+    assert state.addresses == [
+        "azurerm_resource_group.rg",
+        'module.network.azurerm_subnet.subnet["aks"]',
+        'module.network.azurerm_subnet.subnet["db"]',
+        "data.azurerm_client_config.current",
+        "module.network.azurerm_virtual_network.vnet[0]",
+    ]
+    subnet = state.resource('module.network.azurerm_subnet.subnet["db"]')
+    assert subnet["attributes"] == {"name": "snet-db"}
+    assert (subnet["module"], subnet["index_key"]) == ("module.network", "db")
+    assert state.resource("azurerm_subnet.subnet") is None
+
+    assert [r["index_key"] for r in state.resources_by_type("azurerm_subnet")] == [
+        "aks",
+        "db",
+    ]
+    assert [r["name"] for r in state.resources_in_module()] == ["rg", "current"]
+    assert len(state.resources_in_module("module.network")) == 3
+
+
+def test_commands_do_not_read_state(state_file, monkeypatch):
+    tf_bin = state_file.parent / "terraform"
+    tf_bin.write_text("#!/bin/sh\ntrue\n")
+    tf_bin.chmod(0o755)
+    tf = Terraform(terraform_bin_path=str(tf_bin), working_dir=str(state_file.parent))
+    state = tf.tfstate
+
+    monkeypatch.setattr(terraform_exec.json, "load", pytest.fail)
+    for _ in range(3):
+        tf.cmd("plan")
+    assert tf.tfstate is state
+
+
+def test_state_diff(state_file):
+    resources = json.loads(json.dumps(RESOURCES))
+    # rg renamed, db subnet removed, vnet tagged, a subnet added
+    resources[0]["instances"][0]["attributes"]["name"] = "rg-stg"
+    resources[1]["instances"][1] = {
+        "index_key": "web",
+        "attributes": {"name": "snet-web"},
+    }
+    resources[3]["instances"][0]["attributes"]["tags"] = {"env": "stg"}
+    after_file = state_file.with_name("after.tfstate")
+    after_file.write_text(json.dumps(_state(2, resources)))
+
+    before, after = Tfstate.load_file(str(state_file)), Tfstate.load_file(
+        str(after_file)
+    )
+    changes = list(before.diff(after))
+
+    assert [(c.address, c.action) for c in changes] == [
+        ("azurerm_resource_group.rg", "changed"),
+        ('module.network.azurerm_subnet.subnet["db"]', "removed"),
+        ('module.network.azurerm_subnet.subnet["web"]', "added"),
+        ("module.network.azurerm_virtual_network.vnet[0]", "changed"),
+    ]
+    assert changes[0].attribute_changes == [("name", "rg-dev", "rg-stg")]
+    assert changes[3].to_dict()["attributes"] == [
+        {"path": "tags", "before": None, "after": {"env": "stg"}}
+    ]
+    assert changes[0].format().splitlines() == [
+        "~ azurerm_resource_group.rg",
+        '    name: "rg-dev" -> "rg-stg"',
+    ]
+    assert list(before.diff(before)) == []
+
+
+def test_attribute_paths():
+    change = StateChange(
+        "x.y",
+        "changed",
+        before={"rules": [{"ports": [80, 443]}], "tags": {"a": "1", "b": "2"}},
+        after={"rules": [{"ports": [80]}, {"ports": [22]}], "tags": {"a": "1"}},
+    )
+    assert change.attribute_changes == [
+        ("rules[0].ports[1]", 443, None),
+        ("rules[1]", None, {"ports": [22]}),
+        ("tags.b", "2", None),
+    ]
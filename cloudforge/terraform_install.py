@@ -1,32 +1,264 @@
 from pathlib import Path
-from typing import Optional
+from typing import Dict, List, Optional, Union
 
+import hashlib
+import json
 import os
 import platform
+import re
 import requests
 import semantic_version
+import subprocess
 import tempfile
+import time
 import zipfile
 import shutil
 
-from . import logger
+from . import TMP_DIR, logger
+from .terraform_cache import TerraformBinaryCache
+from .utils import FileLock
 
 __TERRAFORM_VERSION__ = "1.0.11"
 
+RELEASES_URL = "https://releases.hashicorp.com/terraform"
+
+DEFAULT_INDEX_TTL = 6 * 60 * 60
+
+
+class TerraformChecksumError(Exception):
+    """
+    Exception raised when a downloaded Terraform archive does not match its published SHA256.
+    """
+
+    pass
+
+
+_VERSION_RE = re.compile(r"Terraform v(\S+)")
+
+
+def probe_terraform_version(
+    tf_bin: Union[str, Path],
+) -> Optional[semantic_version.Version]:
+    """
+    Asks a terraform binary for its version.
+
+    Uses `terraform version -json`, falling back to parsing the plain text output of
+    releases that predate the `-json` flag.
+
+    Args:
+        tf_bin: The path to the terraform binary.
+
+    Returns:
+        The version of the binary, or None if it could not be run or parsed.
+    """
+    try:
+        proc = subprocess.run(
+            [str(tf_bin), "version", "-json"],
+            capture_output=True,
+            timeout=30,
+            text=True,
+        )
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.debug(f"Unable to run [{tf_bin}]: {e}")
+        return None
+
+    try:
+        raw_version = json.loads(proc.stdout)["terraform_version"]
+    except (ValueError, KeyError, TypeError):
+        match = _VERSION_RE.search(proc.stdout)
+        if not match:
+            return None
+        raw_version = match.group(1)
+
+    try:
+        return semantic_version.Version(raw_version)
+    except ValueError:
+        return None
+
+
+class ReleaseIndex:
+    """
+    Terraform release metadata from the HashiCorp releases endpoint, optionally cached on disk.
+
+    The full index lists every build ever released and is only needed to resolve the latest
+    version or a version range. Exact versions are looked up through the much smaller per-version
+    endpoint, whose content never changes once published.
+
+    The full index is stored in a compact form that keeps each version's entry as an unparsed JSON
+    string, so loading it only materializes the version list; the builds of a version are decoded
+    when that version is requested. A cached index younger than `ttl` is used as-is, an older one is
+    revalidated with ETag / If-Modified-Since.
+
+    Args:
+        releases_url: The base url of the Terraform releases endpoint.
+        cache_dir: The directory to cache the index in. If None, nothing is written to disk.
+        ttl: Seconds a cached full index is trusted without revalidation.
+
+    Attributes:
+        releases_url: The base url of the Terraform releases endpoint.
+    """
+
+    def __init__(
+        self,
+        releases_url: str = RELEASES_URL,
+        cache_dir: Optional[Path] = None,
+        ttl: float = DEFAULT_INDEX_TTL,
+    ):
+        self.releases_url = releases_url.rstrip("/")
+        self._ttl = ttl
+        self._cache_dir: Optional[Path] = None
+        if cache_dir is not None:
+            url_hash = hashlib.sha1(self.releases_url.encode()).hexdigest()[:12]
+            self._cache_dir = Path(cache_dir) / url_hash
+            self._cache_dir.mkdir(parents=True, exist_ok=True)
+
+        self._compact: Optional[Dict[str, str]] = None
+        self._entries: Dict[str, Optional[dict]] = {}
+
+    def _load_compact(self) -> Dict[str, str]:
+        """
+        Loads the compact full index, revalidating the disk cache when it is stale.
+
+        Returns:
+            A dictionary mapping version strings to their unparsed JSON entries.
+        """
+        if self._compact is not None:
+            return self._compact
+
+        index_file = meta_file = None
+        meta: Dict[str, Union[str, float]] = {}
+        if self._cache_dir is not None:
+            index_file = self._cache_dir / "index.compact.json"
+            meta_file = self._cache_dir / "index.meta.json"
+            if index_file.is_file() and meta_file.is_file():
+                meta = json.loads(meta_file.read_text())
+
+        if meta and time.time() - float(meta["fetched_at"]) < self._ttl:
+            logger.debug("Using cached terraform release index")
+            self._compact = json.loads(index_file.read_text())
+            return self._compact
+
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = str(meta["etag"])
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = str(meta["last_modified"])
+
+        resp = requests.get(f"{self.releases_url}/index.json", headers=headers)
+
+        if resp.status_code == 304 and index_file is not None:
+            logger.debug("Terraform release index not modified")
+            self._compact = json.loads(index_file.read_text())
+        else:
+            resp.raise_for_status()
+            self._compact = {
+                version: json.dumps(self._compact_entry(entry))
+                for version, entry in resp.json()["versions"].items()
+            }
+            meta = {
+                "etag": resp.headers.get("ETag", ""),
+                "last_modified": resp.headers.get("Last-Modified", ""),
+            }
+            if index_file is not None:
+                self._atomic_write(index_file, json.dumps(self._compact))
+
+        if meta_file is not None:
+            meta["fetched_at"] = time.time()
+            self._atomic_write(meta_file, json.dumps(meta))
+        return self._compact
+
+    @staticmethod
+    def _compact_entry(entry: dict) -> dict:
+        return {
+            "shasums": entry.get("shasums"),
+            "builds": [
+                {k: build.get(k) for k in ("os", "arch", "filename", "url")}
+                for build in entry.get("builds", [])
+            ],
+        }
+
+    @staticmethod
+    def _atomic_write(fpath: Path, content: str) -> None:
+        tmp = fpath.with_name(f".{fpath.name}.{os.getpid()}.tmp")
+        tmp.write_text(content)
+        os.replace(tmp, fpath)
+
+    def _fetch_version(self, version: str) -> Optional[dict]:
+        """
+        Fetches the entry of a single version from the per-version endpoint.
+
+        Args:
+            version: The exact version string.
+
+        Returns:
+            The compact entry of the version, or None if it does not exist.
+        """
+        entry_file = None
+        if self._cache_dir is not None:
+            entry_file = self._cache_dir / f"{version}.json"
+            if entry_file.is_file():
+                return json.loads(entry_file.read_text())
+
+        resp = requests.get(f"{self.releases_url}/{version}/index.json")
+        if resp.status_code == 404:
+            return None
+        resp.raise_for_status()
+
+        entry = self._compact_entry(resp.json())
+        if entry_file is not None:
+            with FileLock(self._cache_dir / ".lock"):
+                self._atomic_write(entry_file, json.dumps(entry))
+        return entry
+
+    def versions(self) -> List[semantic_version.Version]:
+        """
+        Lists every released version. Requires the full index.
+
+        Returns:
+            A list of semantic_version.Version objects.
+        """
+        return [semantic_version.Version(v) for v in self._load_compact().keys()]
+
+    def get(self, version: semantic_version.Version) -> Optional[dict]:
+        """
+        Gets the entry of a version, with its `builds` and `shasums` file name.
+
+        Uses the full index when it is already loaded, the per-version endpoint otherwise.
+
+        Args:
+            version: The exact version.
+
+        Returns:
+            The entry of the version, or None if it does not exist.
+        """
+        key = str(version)
+        if key not in self._entries:
+            if self._compact is not None:
+                raw = self._compact.get(key)
+                self._entries[key] = json.loads(raw) if raw else None
+            else:
+                self._entries[key] = self._fetch_version(key)
+        return self._entries[key]
+
 
 class TerraformInstaller:
     """
     A class that installs the Terraform binary on the local system.
 
     Attributes:
-        _version_index: A dictionary that maps release versions to their metadata.
+        _releases: A ReleaseIndex holding the release metadata, fetched on first use.
         _pyos: A string representing the operating system of the local system.
         _arch: A string representing the architecture of the local system.
         _tf_bin: A string representing the path to the Terraform binary.
+        _cache: An optional TerraformBinaryCache the binary is installed into and reused from.
+        _spec: A semantic_version.SimpleSpec of acceptable versions, when a range was requested.
+        source: Where the binary was resolved from: "explicit", "path", "cache" or "download".
 
     Methods:
         __init__: Initializes the TerraformInstaller object.
-        install: Downloads and installs the Terraform binary on the local system.
+        install: Resolves an existing Terraform binary, or downloads and installs one on the local system.
+        _matches: Checks whether a version satisfies the requested version or range.
+        _resolve_local: Looks for a matching binary on an explicit path, then on PATH.
         _get_binary_metadata: Gets the metadata for the Terraform binary of the specified version.
         _download_and_install: Downloads and installs the Terraform binary of the specified version.
         _latest_release_version: Gets the latest release version of Terraform.
@@ -35,19 +267,34 @@ class TerraformInstaller:
         __exit__: Exits the context and removes the Terraform binary.
     """
 
-    def __init__(self, version: Optional[str] = None, keep_binary=False):
+    def __init__(
+        self,
+        version: Optional[str] = None,
+        keep_binary=False,
+        cache: Optional[TerraformBinaryCache] = None,
+        releases_url: str = RELEASES_URL,
+        bin_path: Optional[str] = None,
+        search_path: bool = False,
+        releases: Optional[ReleaseIndex] = None,
+    ):
         """
         Initializes the TerraformInstaller object.
 
         Args:
-            version: A string representing the version of Terraform to install.
+            version: A string representing the version of Terraform to install, either exact
+                     (e.g. `1.0.11`) or a semantic version range (e.g. `>=1.0.11,<2.0.0`).
+            keep_binary: Whether to keep a downloaded binary on exit. Cached and local binaries are always kept.
+            cache: A TerraformBinaryCache to install into; a cached build is reused without any network call.
+            releases_url: The base url of the Terraform releases endpoint.
+            bin_path: An explicit terraform binary to use when its version matches.
+            search_path: Whether to look for a matching terraform binary on PATH before downloading.
+            releases: The ReleaseIndex to resolve versions with. Defaults to one at `releases_url`,
+                      cached next to `cache` when a cache is supplied.
         """
-        tf_index = requests.get(
-            "https://releases.hashicorp.com/terraform/index.json"
-        ).json()
-        self._version_index = {
-            semantic_version.Version(k): v for k, v in tf_index["versions"].items()
-        }
+        if releases is None:
+            index_dir = cache.root / "releases" if cache is not None else None
+            releases = ReleaseIndex(releases_url, cache_dir=index_dir)
+        self._releases = releases
 
         self._pyos = platform.system().lower()
         self._arch = platform.machine().lower()
@@ -56,19 +303,124 @@ class TerraformInstaller:
             self._arch = "amd64"
 
         self._tf_bin = None
-
-        self._version = (
-            self._latest_release_version()
-            if not version
-            else self._exact_release_version(version)
-        )
+        self._cache = cache
+        self._explicit_bin = bin_path
+        self._search_path = search_path
+        self.source: Optional[str] = None
+
+        # resolving the latest version or a range needs the release index, so it is deferred to install
+        self._version: Optional[semantic_version.Version] = None
+        self._spec: Optional[semantic_version.SimpleSpec] = None
+        if version:
+            try:
+                self._version = semantic_version.Version(version)
+            except ValueError:
+                self._spec = semantic_version.SimpleSpec(version)
         self._keep_binary = keep_binary
 
+    def _matches(self, version: Optional[semantic_version.Version]) -> bool:
+        """
+        Checks whether a version satisfies the requested version or range.
+
+        Args:
+            version: The version to check.
+
+        Returns:
+            True if the version is acceptable.
+        """
+        if version is None:
+            return False
+        if self._spec is not None:
+            return self._spec.match(version)
+        if self._version is None:
+            self._version = self._latest_release_version()
+        return version == self._version
+
+    def _resolve_local(self) -> Optional[Path]:
+        """
+        Looks for a matching binary on an explicit path, then on PATH.
+
+        Returns:
+            The path to a matching terraform binary, or None.
+        """
+        candidates = []
+        if self._explicit_bin:
+            candidates.append(("explicit", self._explicit_bin))
+        if self._search_path:
+            candidates.append(("path", shutil.which("terraform")))
+
+        for source, candidate in candidates:
+            if not candidate:
+                continue
+            found = probe_terraform_version(candidate)
+            if self._matches(found):
+                logger.info(f"Using {source} terraform binary: [{candidate}] v{found}")
+                self.source = source
+                self._version = found
+                return Path(candidate)
+            logger.warning(
+                f"Ignoring {source} terraform binary [{candidate}]: v{found} does not match"
+            )
+        return None
+
+    def _resolve_cached(self) -> Optional[Path]:
+        """
+        Looks for a matching binary in the cache, without any network call.
+
+        Returns:
+            The path to a cached terraform binary, or None.
+        """
+        if self._cache is None:
+            return None
+
+        if self._spec is not None:
+            found = self._cache.find(self._spec.match, self._pyos, self._arch)
+            if found is None:
+                return None
+            self._version, tf_bin = found
+            return tf_bin
+
+        if self._version is None:
+            return None
+        key = self._cache.key(str(self._version), self._pyos, self._arch)
+        return self._cache.get(key)
+
     def install(self):
         """
-        Downloads and installs the Terraform binary on the local system.
+        Resolves an existing Terraform binary, or downloads and installs one on the local system.
+
+        The binary is looked up on the explicit path, then on PATH, then in the cache, and only
+        downloaded when none of them match the requested version.
         """
-        self._tf_bin = self._download_and_install()
+        tf_bin = self._resolve_local()
+        if tf_bin is not None:
+            self._tf_bin = tf_bin
+            return
+
+        tf_bin = self._resolve_cached()
+        if tf_bin is not None:
+            self.source = "cache"
+            self._tf_bin = tf_bin
+            return
+
+        if self._spec is not None:
+            self._version = self._spec.select(
+                [x for x in self._releases.versions() if not x.prerelease]
+            )
+            if self._version is None:
+                raise IndexError("No version matches %s" % self._spec)
+        elif self._version is None:
+            self._version = self._latest_release_version()
+
+        self.source = "download"
+        if self._cache is None:
+            self._tf_bin = self._download_and_install()
+            return
+
+        key = self._cache.key(str(self._version), self._pyos, self._arch)
+        self._tf_bin = self._cache.get_or_install(
+            key, lambda scratch: self._download_and_install(dest_dir=scratch)
+        )
 
     def _get_binary_metadata(self, version: semantic_version.Version):
         """
@@ -80,35 +432,134 @@ class TerraformInstaller:
         Returns:
             A dictionary containing the metadata for the Terraform binary.
         """
-        for build in self._version_index[version]["builds"]:
+        version = self._exact_release_version(str(version))
+        for build in self._releases.get(version)["builds"]:
             if build.get("arch") == self._arch and build.get("os") == self._pyos:
                 return build
         raise IndexError("version not found, fatal error")
 
-    def _download_and_install(self):
+    def _expected_sha256(self, filename: str) -> Optional[str]:
+        """
+        Looks up the published SHA256 of a release archive in the release `SHA256SUMS` file.
+
+        Args:
+            filename: The file name of the release archive.
+
+        Raises:
+            TerraformChecksumError: If the archive is not listed in `SHA256SUMS`.
+
+        Returns:
+            The hex digest, or None if the release publishes no `SHA256SUMS`.
+        """
+        shasums = self._releases.get(self._version).get("shasums")
+        if not shasums:
+            logger.warning(f"No SHA256SUMS published for {self._version}")
+            return None
+
+        resp = requests.get(f"{self._releases.releases_url}/{self._version}/{shasums}")
+        resp.raise_for_status()
+        for line in resp.text.splitlines():
+            digest, _, name = line.strip().partition("  ")
+            if name == filename:
+                return digest.lower()
+        raise TerraformChecksumError("%s not listed in %s" % (filename, shasums))
+
+    def _download(self, url: str, part_file: Path, chunk_size: int = 1024 * 1024):
+        """
+        Streams a download to disk, resuming a previous partial download via HTTP Range.
+
+        Args:
+            url: The url to download.
+            part_file: The partial download to write to and resume from.
+            chunk_size: The number of bytes held in memory at a time.
+
+        Returns:
+            The SHA256 hex digest of the complete file.
+        """
+        digest = hashlib.sha256()
+        offset = part_file.stat().st_size if part_file.is_file() else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+
+        with requests.get(url, headers=headers, stream=True) as resp:
+            if resp.status_code == 416:
+                # the partial download is already complete
+                resp = None
+            elif resp.status_code == 206:
+                logger.info(f"Resuming download of {url} at byte {offset}")
+            else:
+                resp.raise_for_status()
+                offset = 0
+
+            # hash what is already on disk before appending to it
+            if offset:
+                with open(part_file, "rb") as f:
+                    for chunk in iter(lambda: f.read(chunk_size), b""):
+                        digest.update(chunk)
+
+            if resp is not None:
+                with open(part_file, "ab" if offset else "wb") as f:
+                    for chunk in resp.iter_content(chunk_size=chunk_size):
+                        f.write(chunk)
+                        digest.update(chunk)
+
+        return digest.hexdigest()
+
+    def _download_and_install(self, dest_dir: Optional[Path] = None):
         """
         Downloads and installs the Terraform binary of the specified version.
 
+        The archive is streamed to disk while its SHA256 is computed and checked against the
+        release `SHA256SUMS`, so memory use does not depend on the archive size. An interrupted
+        download is resumed on the next call; a corrupt one, or one that fails to extract, is
+        deleted. Only the `terraform` member is extracted.
+
+        Args:
+            dest_dir: The directory to extract the binary into. Defaults to a new temporary directory.
+
+        Raises:
+            TerraformChecksumError: If the downloaded archive does not match its published SHA256.
+            zipfile.BadZipFile: If the downloaded archive is not a valid zip file.
+
         Returns:
             A string representing the path to the Terraform binary.
         """
         mdata = self._get_binary_metadata(self._version)
 
         url = mdata["url"]
+        filename = mdata.get("filename") or url.rsplit("/", 1)[-1]
+        expected = self._expected_sha256(filename)
 
-        tf_zip = requests.get(url)
-
-        with tempfile.NamedTemporaryFile(suffix="tf.zip") as zfile:
-            zfile.write(tf_zip.content)
-            zfile.flush()
-            with zipfile.ZipFile(zfile.name) as zip_ref:
-                tfbin_path = Path(tempfile.gettempdir()) / (
-                    "terraform-" + next(tempfile._get_candidate_names())
+        downloads_dir = (
+            self._cache.root / "downloads" if self._cache is not None else TMP_DIR
+        )
+        downloads_dir.mkdir(parents=True, exist_ok=True)
+        part_file = downloads_dir / f".{filename}.part"
+
+        with FileLock(downloads_dir / f".{filename}.lock"):
+            actual = self._download(url, part_file)
+            if expected is not None and actual != expected:
+                part_file.unlink()
+                raise TerraformChecksumError(
+                    "Checksum mismatch for %s: expected %s, got %s"
+                    % (filename, expected, actual)
                 )
-                zip_ref.extractall(tfbin_path)
+
+            tfbin_path = dest_dir or Path(tempfile.gettempdir()) / (
+                "terraform-" + next(tempfile._get_candidate_names())
+            )
+            tfbin_path.mkdir(parents=True, exist_ok=True)
+            tfbin = tfbin_path / "terraform"
+
+            try:
+                with zipfile.ZipFile(part_file) as zip_ref:
+                    with zip_ref.open("terraform") as src, open(tfbin, "wb") as dst:
+                        shutil.copyfileobj(src, dst)
+            finally:
+                # without a published checksum a corrupt archive is only found here; never
+                # resume from it
+                part_file.unlink()
 
         # finally make terraform executable
-        tfbin = tfbin_path / "terraform"
         os.chmod(tfbin, (os.stat(tfbin).st_mode | 0o111))
 
         return tfbin
@@ -120,9 +571,7 @@ class TerraformInstaller:
         Returns:
             A semantic_version.Version object representing the latest release version of Terraform.
         """
-        latest_version = max(
-            [x for x in self._version_index.keys() if not x.prerelease]
-        )
+        latest_version = max([x for x in self._releases.versions() if not x.prerelease])
         return latest_version
 
     def _exact_release_version(self, version: str):
@@ -136,7 +585,7 @@ class TerraformInstaller:
             A semantic_version.Version object representing the specified version of Terraform.
         """
         version = semantic_version.Version(version)
-        if not self._version_index.get(version):
+        if not self._releases.get(version):
             raise IndexError("Version does not exist")
         return version
 
@@ -154,8 +603,11 @@ class TerraformInstaller:
         """
         Exits the context and removes the Terraform binary.
         """
-        # delete binary to free up space
-        if not self._keep_binary:
+        if self._cache is not None:
+            # the binary is no longer run, so it may be evicted
+            self._cache.release()
+        # delete binary to free up space, cached and local binaries are not ours to remove
+        if not self._keep_binary and self._cache is None and self.source == "download":
             logger.warning("Removing terraform binary: %s" % self._tf_bin)
             os.remove(self._tf_bin)
             shutil.rmtree(self._tf_bin.parent)
@@ -172,3 +624,15 @@ class TerraformInstaller:
             return str(self._tf_bin)
         except:
             raise ValueError("tf bin not set -- did it install correctly?")
+
+    @property
+    def version(self) -> str:
+        """
+        Gets the version of the resolved Terraform binary.
+
+        Returns:
+            A string representing the Terraform version.
+        """
+        if self._version is None:
+            raise ValueError("tf version not set -- did it install correctly?")
+        return str(self._version)
@@ -0,0 +1,767 @@
+"""
+The terraform_pipeline module renders a Terraform project for one env and runs Terraform actions in it.
+
+A TerraformPipeline loads the env configuration, fetches the secrets referenced by the project from
+Key Vault, renders the shared source tree into a working directory and runs init and the steps of an
+action there. Credentials are handed to Terraform through its environment rather than `os.environ`,
+so pipelines for different envs can run side by side in one process.
+
+run_pipelines runs several envs concurrently from a single read of the source tree and a single
+Terraform binary, and format_results renders their outcome as a table.
+
+discover_projects finds every root module of a monorepo, a directory holding `.tf` files and
+`.env.<env>` files, and run_projects runs them on a bounded worker pool; write_summary records
+the outcome as JSON. affected_projects narrows them down to the ones a set of changed files, e.g.
+from a git diff, touches through their own files or the local modules they use.
+
+Example Usage:
+tokenizer = Tokenizer(proj_dir, "tf")
+tokenizer.read_root()
+results = run_pipelines("validate", ["dev", "stg"], proj_dir, tokenizer, tf_installer, jobs=2)
+print(format_results(results))
+
+projects = discover_projects(repo_dir, ["dev"])
+projects = affected_projects(projects, changed_files("origin/main", repo_dir))
+results = run_projects("validate", projects, tf_installer, jobs=4)
+write_summary(results, Path("summary.json"), action="validate")
+"""
+
+from azure.identity import ClientSecretCredential
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import hashlib
+import json
+import os
+import shutil
+import time
+
+from . import TF_WORKDIRS_PATH, TMP_PATH, VALID_ENVS, logger
+from .keyvault import AzureKeyVault
+from .terraform_cache import PluginCache, host_platform
+from .terraform_exec import IsFlagged, Terraform, TerraformCommandError
+from .terraform_install import TerraformInstaller
+from .terraform_project import (
+    init_fingerprint,
+    parse_lock_file,
+    project_dependencies,
+    provider_addresses,
+    read_init_fingerprint,
+    with_local_modules,
+    write_init_fingerprint,
+)
+from .terraform_plan import (
+    PLAN_FILE,
+    PlanManifest,
+    PlanResult,
+    StalePlanError,
+    file_hash,
+)
+from .terraform_stream import CommandResult, LoggerSink
+from .terraform_timings import TimingsCollector
+from .tokenizer import Tokenizer
+from .utils import EnvConfiguration, FileLock
+
+# the terraform commands run after init by each action
+ACTION_STEPS: Dict[str, Sequence[str]] = {
+    "validate": ("validate", "plan"),
+    "plan": ("plan",),
+    "deploy": ("apply",),
+}
+
+
+class TerraformActionError(Exception):
+    """
+    Exception raised when a Terraform command of a pipeline fails.
+
+    Attributes:
+        env (str): The env of the pipeline.
+        step (str): The Terraform command that failed.
+        result (CommandResult): The result of the command, holding the tail of its output.
+    """
+
+    def __init__(self, env: str, step: str, result: CommandResult) -> None:
+        self.env = env
+        self.step = step
+        self.result = result
+        super().__init__(
+            f"[{env}] terraform {step} failed with exit code {result.ret_code}"
+        )
+
+
+class PipelineResult:
+    """
+    The outcome of a pipeline.
+
+    Attributes:
+        env (str): The env of the pipeline.
+        timings (Dict[str, float]): Seconds spent in each phase, in the order they ran.
+        error (str): The reason the pipeline failed, or `None` if it succeeded.
+        proj_dir (Path): The project directory of the pipeline.
+    """
+
+    def __init__(
+        self,
+        env: str,
+        timings: Dict[str, float],
+        error: Optional[str] = None,
+        proj_dir: Optional[Path] = None,
+    ) -> None:
+        self.env = env
+        self.timings = timings
+        self.error = error
+        self.proj_dir = proj_dir
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    @property
+    def total(self) -> float:
+        return sum(self.timings.values())
+
+    def to_dict(self) -> dict:
+        """
+        Converts the result to a JSON serializable dictionary.
+
+        Returns:
+            dict: The project, env, status, timings, total and error.
+        """
+        return {
+            "project": str(self.proj_dir) if self.proj_dir is not None else None,
+            "env": self.env,
+            "status": "ok" if self.ok else "failed",
+            "timings": {phase: round(t, 3) for phase, t in self.timings.items()},
+            "total": round(self.total, 3),
+            "error": self.error,
+        }
+
+
+class TerraformPipeline:
+    """
+    Renders a Terraform project for one env and runs Terraform actions in it.
+
+    Args:
+        env (str): The env to render, selecting the `.env.<env>` configuration.
+        proj_dir (Path): The project directory.
+        tokenizer (Tokenizer): A tokenizer that already read the project, shared between envs.
+        stable_workdir (bool): Whether to reuse a per project/env working directory between runs.
+        force_init (bool): Whether to run terraform init even when its inputs are unchanged.
+        plugin_cache (PluginCache, optional): The provider plugin cache. Defaults to the shared one.
+        resource_timings (bool): Whether plan and apply run with `-json` to time every resource.
+
+    Attributes:
+        config (EnvConfiguration): The env configuration.
+        backend_config (Dict[str, str]): The backend configuration for Terraform.
+        arm_config (Dict[str, str]): The ARM configuration for Terraform.
+        parsed_tree (Dict[str, str]): The rendered Terraform files.
+        tmp_dir (Path): The working directory holding the rendered files.
+        workdir_lock (FileLock): The lock held on the working directory while in stable mode.
+        timings (Dict[str, float]): Seconds spent in each phase so far.
+        plan_result (PlanResult): The changes of the plan saved or applied by the last run, if any.
+        timings_collector (TimingsCollector): The resource timings of plan and apply, with `resource_timings`.
+    """
+
+    def __init__(
+        self,
+        env: str,
+        proj_dir: Path,
+        tokenizer: Tokenizer,
+        stable_workdir: bool = False,
+        force_init: bool = False,
+        plugin_cache: Optional[PluginCache] = None,
+        resource_timings: bool = False,
+    ) -> None:
+        self.env = env
+        self.proj_dir = Path(proj_dir)
+        self.tokenizer = tokenizer
+        self.stable_workdir = stable_workdir
+        self.force_init = force_init
+        self.plugin_cache = plugin_cache or PluginCache()
+        self.workdir_lock: Optional[FileLock] = None
+        self.timings: Dict[str, float] = {}
+        self.plan_result: Optional[PlanResult] = None
+        self.timings_collector: Optional[TimingsCollector] = (
+            TimingsCollector() if resource_timings else None
+        )
+
+    def prepare(self) -> "TerraformPipeline":
+        """
+        Loads the env configuration, fetches its secrets and renders the project into the working directory.
+
+        Returns:
+            TerraformPipeline: The pipeline itself.
+        """
+        started = time.monotonic()
+
+        self.config: EnvConfiguration = EnvConfiguration.load_env(
+            self.env, self.proj_dir
+        )
+
+        vault_name: str = self.config.get("KEY_VAULT_NAME")
+
+        auth: ClientSecretCredential = ClientSecretCredential(
+            **self.config.get_terraform_creds()
+        )
+        # get only the secrets referenced by the project from Key Vault
+        tokens: Dict[str, str] = AzureKeyVault(vault_name, auth).get_secrets(
+            names=self.tokenizer.collect_tokens()
+        )
+
+        self.parsed_tree: Dict[str, str] = self.tokenizer.replace_and_validate_tokens(
+            tokens
+        )
+
+        if self.stable_workdir:
+            self.tmp_dir: Path = self._stable_workdir_path()
+            # appended rather than `with_suffix`, which would cut dotted env names short
+            lock_path = self.tmp_dir.parent / (self.tmp_dir.name + ".lock")
+            self.workdir_lock = FileLock(lock_path).acquire()
+            self.tokenizer.sync_to(tree=self.parsed_tree, dirpath=self.tmp_dir)
+        else:
+            self.tmp_dir: Path = self.tokenizer.dump_to(
+                tree=self.parsed_tree, dirpath=TMP_PATH, unique=True
+            )
+
+        self.backend_config: Dict[str, str] = {
+            "storage_account_name": self.config.get("STORAGE_ACCOUNT_NAME"),
+            "sas_token": self.config.get("SAS_TOKEN"),
+            "key": self.config.get("TF_KEY"),
+            "container_name": self.config.get("CONTAINER_NAME"),
+        }
+
+        self.arm_config: Dict[str, str] = {
+            "ARM_CLIENT_ID": self.config.get("ARM_CLIENT_ID"),
+            "ARM_CLIENT_SECRET": self.config.get("ARM_CLIENT_SECRET"),
+            "ARM_TENANT_ID": self.config.get("ARM_TENANT_ID"),
+            "ARM_SUBSCRIPTION_ID": self.config.get("ARM_SUBSCRIPTION_ID"),
+        }
+
+        self.timings["prepare"] = time.monotonic() - started
+        return self
+
+    def _stable_workdir_path(self) -> Path:
+        """Builds the working directory path reused by every run of this project and env.
+
+        Returns:
+            Path: A directory keyed by the absolute project directory and the env.
+        """
+        proj_dir = self.proj_dir.absolute()
+        proj_hash = hashlib.sha1(str(proj_dir).encode()).hexdigest()[:12]
+        return TF_WORKDIRS_PATH / f"{proj_dir.name}-{self.env}-{proj_hash}"
+
+    def terraform(self, tf_bin: str) -> Terraform:
+        """
+        Builds a Terraform wrapper bound to the working directory.
+
+        The ARM credentials of the env are passed through the environment of the Terraform
+        process, so concurrent pipelines for different envs do not clobber each other.
+
+        Args:
+            tf_bin (str): The path of the Terraform binary.
+
+        Returns:
+            Terraform: The wrapper.
+        """
+        return Terraform(
+            terraform_bin_path=tf_bin,
+            working_dir=str(self.tmp_dir.absolute()),
+            is_env_vars_included=True,
+            env_vars={**self.plugin_cache.env(), **self.config.get_arms()},
+        )
+
+    def run(
+        self,
+        action: str,
+        tf_installer: TerraformInstaller,
+        save_plan: Optional[Path] = None,
+        apply_plan: Optional[Path] = None,
+    ) -> None:
+        """
+        Runs init and the steps of an action in the working directory.
+
+        Args:
+            action (str): The action to run, one of `ACTION_STEPS`.
+            tf_installer (TerraformInstaller): The installer that resolved the Terraform binary.
+            save_plan (Path, optional): Where the plan step saves its plan, along with a manifest.
+            apply_plan (Path, optional): A plan saved by an earlier run, applied as is by the apply step.
+
+        Raises:
+            TerraformActionError: If a Terraform command fails.
+            StalePlanError: If `apply_plan` does not match the current configuration or state.
+        """
+        tf = self.terraform(tf_installer.bin_path)
+
+        self._init(tf, tf_installer.version)
+
+        for step in ACTION_STEPS[action]:
+            if step == "validate":
+                self._run_tf_cmd(step, tf.validate)
+            elif step == "plan" and save_plan:
+                # taken before planning, a state written meanwhile makes the plan stale
+                manifest = self._plan_manifest(tf, tf_installer.version)
+                self._run_tf_cmd(step, tf.plan, detailed_exitcode=False, out=PLAN_FILE)
+                self._show_plan(tf)
+                self._save_plan(manifest, save_plan)
+            elif step == "plan":
+                self._run_tf_cmd(step, tf.plan, detailed_exitcode=False)
+            elif step == "apply" and apply_plan:
+                self._check_plan(tf, tf_installer.version, apply_plan)
+                shutil.copyfile(apply_plan, self.tmp_dir / PLAN_FILE)
+                self._show_plan(tf)
+                logger.info(
+                    f"[{self.env}] Applying saved plan {apply_plan}, skipping refresh and plan"
+                )
+                self._run_tf_cmd(step, tf.apply, dir_or_plan=PLAN_FILE)
+            elif step == "apply":
+                self._run_tf_cmd(step, tf.apply, skip_plan=True)
+
+    def _plan_manifest(self, tf: Terraform, tf_version: str) -> PlanManifest:
+        """Builds the manifest of the current inputs, pulling the state for its serial and lineage.
+
+        Args:
+            tf (Terraform): The Terraform wrapper bound to the working directory.
+            tf_version (str): The version of the Terraform binary.
+
+        Raises:
+            TerraformActionError: If the state could not be pulled.
+        """
+        started = time.monotonic()
+        # not logged, the state holds secrets; only its head is read back from the spool
+        result = tf.cmd("state pull", capture_output="spool", raise_on_error=False)
+        try:
+            if result.ret_code != 0:
+                raise TerraformActionError(self.env, "state", result)
+            return PlanManifest.build(
+                self.parsed_tree,
+                self.proj_dir,
+                self.backend_config,
+                self.config.get_arms(),
+                result.out_path,
+                tf_version,
+            )
+        finally:
+            result.remove_spool()
+            self.timings["state"] = time.monotonic() - started
+
+    def _show_plan(self, tf: Terraform) -> None:
+        """Parses the plan in the working directory into `plan_result` and logs its summary.
+
+        Args:
+            tf (Terraform): The Terraform wrapper bound to the working directory.
+
+        Raises:
+            TerraformActionError: If terraform show fails.
+        """
+        started = time.monotonic()
+        try:
+            self.plan_result = tf.show_plan(PLAN_FILE)
+        except TerraformCommandError as e:
+            raise TerraformActionError(
+                self.env, "show", CommandResult(e.returncode, e.out, e.err)
+            ) from e
+        finally:
+            self.timings["show"] = time.monotonic() - started
+        logger.info(f"[{self.env}] {self.plan_result.summary()}")
+
+    def _save_plan(self, manifest: PlanManifest, plan_path: Path) -> None:
+        """Copies the plan out of the working directory and writes its manifest next to it.
+
+        Args:
+            manifest (PlanManifest): The manifest of the inputs the plan was made from.
+            plan_path (Path): Where the plan is saved.
+        """
+        plan_path = Path(plan_path)
+        plan_path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(self.tmp_dir / PLAN_FILE, plan_path)
+        manifest.write(plan_path)
+        logger.info(f"[{self.env}] Saved plan: {plan_path}")
+
+    def _check_plan(self, tf: Terraform, tf_version: str, plan_path: Path) -> None:
+        """Checks that a saved plan was made from the current configuration and state.
+
+        Args:
+            tf (Terraform): The Terraform wrapper bound to the working directory.
+            tf_version (str): The version of the Terraform binary.
+            plan_path (Path): The saved plan.
+
+        Raises:
+            StalePlanError: If the plan, or what it was made from, changed.
+        """
+        saved = PlanManifest.read(plan_path)
+        mismatches = saved.mismatches(self._plan_manifest(tf, tf_version))
+        if saved.plan_hash != file_hash(plan_path):
+            mismatches.append("plan file")
+        if mismatches:
+            raise StalePlanError(Path(plan_path), mismatches)
+
+    def _run_tf_cmd(self, step: str, cmd, **kwargs) -> CommandResult:
+        """Runs a Terraform command, timing it.
+
+        Args:
+            step (str): The name the command is reported under.
+            cmd (Callable): The Terraform command to run.
+            **kwargs: The keyword arguments to pass to the command.
+
+        Raises:
+            TerraformActionError: If the Terraform command fails.
+        """
+        options = kwargs.copy()
+
+        options["raise_on_error"] = False
+        # spool output to disk, only its tail is kept in memory for error reporting
+        options["capture_output"] = "spool"
+        events = self.timings_collector is not None and step in ("plan", "apply")
+        # log output as it is produced instead of once the command exits
+        sinks = [LoggerSink(prefix=f"[{self.env}] ", json_messages=events)]
+        if events:
+            # one JSON event per line, timestamped, for every resource operation
+            options["json"] = IsFlagged
+            sinks.append(self.timings_collector)
+        options["on_line"] = sinks
+
+        started = time.monotonic()
+        try:
+            result = cmd(**options)
+        finally:
+            self.timings[step] = time.monotonic() - started
+
+        if result.ret_code != 0:
+            raise TerraformActionError(self.env, step, result)
+        result.remove_spool()
+        return result
+
+    def _init(self, tf: Terraform, tf_version: str) -> None:
+        """Runs terraform init, unless the working directory was already initialized with the same inputs.
+
+        Args:
+            tf (Terraform): The Terraform wrapper bound to the working directory.
+            tf_version (str): The version of the Terraform binary.
+        """
+        fingerprint = init_fingerprint(
+            self.backend_config, self.parsed_tree, self.tmp_dir, tf_version
+        )
+        if not self.force_init and read_init_fingerprint(self.tmp_dir) == fingerprint:
+            missing = self.plugin_cache.missing_providers(self.tmp_dir)
+            if not missing:
+                logger.info(
+                    f"[{self.env}] Backend, providers and modules unchanged, skipping init"
+                )
+                # keep the providers this working directory links to from being pruned
+                self.plugin_cache.touch_used(self.tmp_dir)
+                self.timings["init"] = 0.0
+                return
+            logger.info(
+                f"[{self.env}] Providers missing from the plugin cache, running init: "
+                + ", ".join(str(p) for p in missing)
+            )
+
+        # terraform does not guard the plugin cache against concurrent writers, but an init
+        # taking every provider from the cache writes nothing to it and needs no lock
+        lock = nullcontext() if self._providers_cached() else self.plugin_cache.lock()
+        with lock:
+            self._run_tf_cmd(
+                "init",
+                tf.init,
+                backend_config=self.backend_config,
+                backend=True,
+                reconfigure=False,
+            )
+        self.plugin_cache.touch_used(self.tmp_dir)
+        # init may have created or updated the lock file, so fingerprint the result
+        write_init_fingerprint(
+            self.tmp_dir,
+            init_fingerprint(
+                self.backend_config, self.parsed_tree, self.tmp_dir, tf_version
+            ),
+        )
+
+    def _providers_cached(self) -> bool:
+        """Checks whether init can take every provider the dependency lock file pins from the plugin cache.
+
+        Returns:
+            bool: Whether the lock file pins every required provider and all of them are cached.
+        """
+        locked = parse_lock_file(self.tmp_dir)
+        # without a lock file, e.g. on a first init, the versions terraform picks are unknown
+        required = provider_addresses(with_local_modules(self.parsed_tree))
+        if not locked or not required <= set(locked):
+            return False
+        return self.plugin_cache.holds(locked, host_platform())
+
+    def clean_up(self) -> None:
+        """Cleans up the temporary directory, or releases a stable working directory."""
+        if not hasattr(self, "tmp_dir"):
+            return
+
+        if self.workdir_lock is not None:
+            logger.info(f"Keeping working directory: {self.tmp_dir.absolute()}")
+            self.workdir_lock.release()
+            return
+
+        logger.warning(f"Removing directory: {self.tmp_dir.absolute()}")
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)  # clean up
+
+
+def _run_one(
+    action: str,
+    env: str,
+    proj_dir: Path,
+    tokenizer: Tokenizer,
+    tf_installer: TerraformInstaller,
+    **pipeline_kwargs,
+) -> PipelineResult:
+    """Runs the pipeline of one env, turning any failure into a failed result."""
+    pipeline = TerraformPipeline(env, proj_dir, tokenizer, **pipeline_kwargs)
+    try:
+        pipeline.prepare().run(action, tf_installer)
+    except TerraformActionError as e:
+        logger.error(str(e))
+        logger.error(e.result.err)
+        logger.error(f"Full output: {e.result.out_path}, {e.result.err_path}")
+        error = str(e)
+    except Exception as e:
+        logger.error(f"[{proj_dir}:{env}] {type(e).__name__}: {e}")
+        error = f"{type(e).__name__}: {e}"
+    else:
+        error = None
+    finally:
+        pipeline.clean_up()
+    return PipelineResult(env, pipeline.timings, error=error, proj_dir=proj_dir)
+
+
+def run_pipelines(
+    action: str,
+    envs: Sequence[str],
+    proj_dir: Path,
+    tokenizer: Tokenizer,
+    tf_installer: TerraformInstaller,
+    jobs: Optional[int] = None,
+    **pipeline_kwargs,
+) -> List[PipelineResult]:
+    """
+    Runs an action for several envs concurrently.
+
+    The envs share the source tree read by `tokenizer`, the Terraform binary of `tf_installer`
+    and the provider plugin cache. A failing env does not stop the others.
+
+    Args:
+        action (str): The action to run, one of `ACTION_STEPS`.
+        envs (Sequence[str]): The envs to run the action for.
+        proj_dir (Path): The project directory.
+        tokenizer (Tokenizer): A tokenizer that already read the project.
+        tf_installer (TerraformInstaller): The installer that resolved the Terraform binary.
+        jobs (int, optional): The maximum number of envs run at once. Defaults to all of them.
+        **pipeline_kwargs: Passed to every TerraformPipeline.
+
+    Returns:
+        List[PipelineResult]: The results, in the order of `envs`.
+    """
+    jobs = jobs or len(envs)
+    pipeline_kwargs.setdefault("plugin_cache", PluginCache())
+    with ThreadPoolExecutor(max_workers=max(1, min(jobs, len(envs)))) as pool:
+        futures = [
+            pool.submit(
+                _run_one,
+                action,
+                env,
+                proj_dir,
+                tokenizer,
+                tf_installer,
+                **pipeline_kwargs,
+            )
+            for env in envs
+        ]
+        return [future.result() for future in futures]
+
+
+def discover_projects(
+    root_dir: Path, envs: Sequence[str] = VALID_ENVS
+) -> Dict[Path, List[str]]:
+    """
+    Finds the Terraform root modules under a directory.
+
+    A root module is a directory holding `.tf` files and a `.env.<env>` file for at least one of
+    `envs`. Hidden directories, such as `.git` and `.terraform`, and `sandbox` directories are skipped.
+
+    Args:
+        root_dir (Path): The directory to search, e.g. the root of a monorepo.
+        envs (Sequence[str]): The envs of interest.
+
+    Returns:
+        Dict[Path, List[str]]: Each root module mapped to the envs it has a configuration for, sorted by path.
+    """
+    projects: Dict[Path, List[str]] = {}
+    for dirpath, dirnames, filenames in os.walk(root_dir):
+        dirnames[:] = sorted(
+            d for d in dirnames if not d.startswith(".") and d != "sandbox"
+        )
+        if not any(fname.endswith(".tf") for fname in filenames):
+            continue
+        project_envs = [env for env in envs if f".env.{env}" in filenames]
+        if project_envs:
+            projects[Path(dirpath).absolute()] = project_envs
+    return dict(sorted(projects.items()))
+
+
+def affected_projects(
+    projects: Dict[Path, List[str]], changed: Iterable[Path]
+) -> Dict[Path, List[str]]:
+    """
+    Keeps the root modules affected by a set of changed files.
+
+    A module is affected when a changed file lies in its directory, or in the directory of a local
+    module it uses, directly or through other local modules. Module sources are read from the same
+    files the Tokenizer reads for the project.
+
+    Args:
+        projects (Dict[Path, List[str]]): Root modules mapped to their envs, as from discover_projects.
+        changed (Iterable[Path]): The changed files.
+
+    Returns:
+        Dict[Path, List[str]]: The affected subset of `projects`.
+    """
+    changed_dirs = set()
+    for fpath in changed:
+        changed_dirs.update(Path(fpath).resolve().parents)
+
+    affected: Dict[Path, List[str]] = {}
+    for proj_dir, envs in projects.items():
+        tokenizer = Tokenizer(proj_dir, "tf").read_root()
+        dependencies = project_dependencies(proj_dir, tokenizer.tree)
+        if not dependencies.isdisjoint(changed_dirs):
+            affected[proj_dir] = envs
+    return affected
+
+
+def _run_project(
+    action: str,
+    proj_dir: Path,
+    envs: Sequence[str],
+    tf_installer: TerraformInstaller,
+    **pipeline_kwargs,
+) -> List[PipelineResult]:
+    """Reads a project once and runs the pipeline of each of its envs, isolating any failure."""
+    try:
+        tokenizer = Tokenizer(proj_dir, "tf")
+        tokenizer.read_root()
+    except Exception as e:
+        logger.error(f"[{proj_dir}] {type(e).__name__}: {e}")
+        return [
+            PipelineResult(env, {}, error=f"{type(e).__name__}: {e}", proj_dir=proj_dir)
+            for env in envs
+        ]
+
+    return [
+        _run_one(action, env, proj_dir, tokenizer, tf_installer, **pipeline_kwargs)
+        for env in envs
+    ]
+
+
+def run_projects(
+    action: str,
+    projects: Dict[Path, Sequence[str]],
+    tf_installer: TerraformInstaller,
+    jobs: Optional[int] = None,
+    **pipeline_kwargs,
+) -> List[PipelineResult]:
+    """
+    Runs an action for many projects on a bounded worker pool.
+
+    Every project is a unit of work: it is read once and its envs run one after the other. A
+    failing project does not stop the others.
+
+    Args:
+        action (str): The action to run, one of `ACTION_STEPS`.
+        projects (Dict[Path, Sequence[str]]): The project directories mapped to their envs, see `discover_projects`.
+        tf_installer (TerraformInstaller): The installer that resolved the Terraform binary.
+        jobs (int, optional): The maximum number of projects run at once. Defaults to the CPU count.
+        **pipeline_kwargs: Passed to every TerraformPipeline.
+
+    Returns:
+        List[PipelineResult]: The results, in the order of `projects`.
+    """
+    if not projects:
+        return []
+
+    jobs = jobs or os.cpu_count() or 1
+    pipeline_kwargs.setdefault("plugin_cache", PluginCache())
+    with ThreadPoolExecutor(max_workers=max(1, min(jobs, len(projects)))) as pool:
+        futures = [
+            pool.submit(
+                _run_project, action, proj_dir, envs, tf_installer, **pipeline_kwargs
+            )
+            for proj_dir, envs in projects.items()
+        ]
+        return [result for future in futures for result in future.result()]
+
+
+def write_summary(
+    results: Sequence[PipelineResult], fpath: Path, action: Optional[str] = None
+) -> Path:
+    """
+    Writes pipeline results as a JSON report.
+
+    Args:
+        results (Sequence[PipelineResult]): The results to report.
+        fpath (Path): The path of the report.
+        action (str, optional): The action the results are for.
+
+    Returns:
+        Path: The path of the report.
+    """
+    fpath = Path(fpath)
+    fpath.parent.mkdir(parents=True, exist_ok=True)
+    summary = {
+        "action": action,
+        "ok": sum(1 for result in results if result.ok),
+        "failed": sum(1 for result in results if not result.ok),
+        "results": [result.to_dict() for result in results],
+    }
+    fpath.write_text(json.dumps(summary, indent=2))
+    logger.info(f"Wrote summary: {fpath}")
+    return fpath
+
+
+def format_results(
+    results: Sequence[PipelineResult], root_dir: Optional[Path] = None
+) -> str:
+    """
+    Renders pipeline results as a table with the timing of each phase.
+
+    Args:
+        results (Sequence[PipelineResult]): The results to render.
+        root_dir (Path, optional): When supplied, a project column is shown relative to it.
+
+    Returns:
+        str: The table.
+    """
+    phases: List[str] = []
+    for result in results:
+        phases.extend(p for p in result.timings if p not in phases)
+
+    header = ["ENV", "STATUS"] + [p.upper() for p in phases] + ["TOTAL", "ERROR"]
+    if root_dir is not None:
+        header.insert(0, "PROJECT")
+    rows = [header]
+    for result in results:
+        project = []
+        if root_dir is not None:
+            project = [os.path.relpath(result.proj_dir, root_dir)]
+        rows.append(
+            project
+            + [result.env, "ok" if result.ok else "FAILED"]
+            + [
+                f"{result.timings[p]:.1f}s" if p in result.timings else "-"
+                for p in phases
+            ]
+            + [f"{result.total:.1f}s", result.error or ""]
+        )
+
+    widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+    return "\n".join(
+        "  ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip()
+        for row in rows
+    )
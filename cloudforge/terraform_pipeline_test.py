@@ -0,0 +1,449 @@
+import json
+import os
+import pytest
+import time
+from pathlib import Path
+from . import terraform_pipeline
+from .terraform_cache import PluginCache, host_platform
+from .terraform_pipeline import (
+    PipelineResult,
+    TerraformPipeline,
+    affected_projects,
+    discover_projects,
+    format_results,
+    run_pipelines,
+    run_projects,
+    write_summary,
+)
+from .terraform_plan import StalePlanError
+from .tokenizer import Tokenizer
+
+ENVS = ["dev", "stg", "uat"]
+
+# stand-in for terraform: records which credentials and rendered files each command saw
+STUB_TERRAFORM = """#!/bin/sh
+case "$1" in
+  plan)
+    echo "$1 $ARM_CLIENT_ID $(cat main.tf)" >> "{calls}"
+    sleep 0.5
+    [ "$ARM_SUBSCRIPTION_ID" = "broken" ] && {{ echo "Error: subscription not found" >&2; exit 1; }}
+    echo "No changes."
+    ;;
+  *)
+    echo "$1 $ARM_CLIENT_ID" >> "{calls}"
+    ;;
+esac
+"""
+
+# stand-in for terraform saving and applying plans against a state file
+PLAN_TERRAFORM = """#!/bin/sh
+echo "$*" >> "{calls}"
+case "$1" in
+  plan)
+    for arg; do
+      case "$arg" in -out=*) cat main.tf > "${{arg#-out=}}" ;; esac
+    done
+    ;;
+  state)
+    cat "{state}"
+    ;;
+  show)
+    echo '{{"resource_changes": [{{"address": "a.b", "change": {{"actions": ["delete"]}}}}]}}'
+    ;;
+esac
+"""
+
+# stand-in for terraform linking its providers into the plugin cache on init
+LINK_TERRAFORM = """#!/bin/sh
+echo "$1" >> "{calls}"
+if [ "$1" = init ]; then
+  mkdir -p .terraform/providers/{provider}
+  ln -sfn "$TF_PLUGIN_CACHE_DIR/{provider}/linux_amd64" .terraform/providers/{provider}/linux_amd64
+fi
+"""
+
+# stand-in for terraform pinning a provider in the dependency lock file on a slow init
+LOCKING_TERRAFORM = """#!/bin/sh
+if [ "$1" = init ]; then
+  echo "init start" >> "{calls}"
+  sleep 0.5
+  printf 'provider "{provider}" {{\\n  version = "{version}"\\n}}\\n' > .terraform.lock.hcl
+  echo "init end" >> "{calls}"
+fi
+"""
+
+
+class FakeKeyVault:
+    def __init__(self, vault_name, credential):
+        self.vault_name = vault_name
+
+    def get_secrets(self, names=None):
+        return {"rg_name": f"rg-{self.vault_name}"}
+
+
+class FakeInstaller:
+    def __init__(self, bin_path):
+        self.bin_path = str(bin_path)
+        self.version = "1.0.11"
+
+
+def _write_project(proj_dir, envs, main_tf='rg = "{{__rg_name__}}"'):
+    proj_dir.mkdir(parents=True)
+    (proj_dir / "main.tf").write_text(main_tf)
+    for env in envs:
+        subscription = "broken" if env == "uat" else f"sub-{env}"
+        (proj_dir / f".env.{env}").write_text(
+            "\n".join(
+                [
+                    f"KEY_VAULT_NAME=kv-{env}",
+                    f"ARM_CLIENT_ID=client-{env}",
+                    "ARM_CLIENT_SECRET=secret",
+                    "ARM_TENANT_ID=tenant",
+                    f"ARM_SUBSCRIPTION_ID={subscription}",
+                    "STORAGE_ACCOUNT_NAME=sa",
+                    "SAS_TOKEN=token",
+                    f"TF_KEY={env}.tfstate",
+                    "CONTAINER_NAME=tfstate",
+                ]
+            )
+        )
+
+
+@pytest.fixture
+def project(tmpdir, monkeypatch):
+    root = Path(tmpdir)
+    proj_dir = root / "project"
+    _write_project(proj_dir, ENVS)
+
+    calls = root / "calls.log"
+    tf_bin = root / "terraform"
+    tf_bin.write_text(STUB_TERRAFORM.format(calls=calls))
+    tf_bin.chmod(0o755)
+
+    monkeypatch.delenv("ARM_VARS_USE_EXISTING", raising=False)
+    monkeypatch.setattr(terraform_pipeline, "AzureKeyVault", FakeKeyVault)
+
+    tokenizer = Tokenizer(proj_dir, "tf")
+    tokenizer.read_root()
+    yield proj_dir, tokenizer, FakeInstaller(tf_bin), calls, root
+
+
+def test_envs_run_concurrently(project):
+    proj_dir, tokenizer, installer, calls, root = project
+
+    started = time.monotonic()
+    results = run_pipelines(
+        "plan",
+        ENVS,
+        proj_dir,
+        tokenizer,
+        installer,
+        jobs=3,
+        plugin_cache=PluginCache(root / "plugins"),
+    )
+    elapsed = time.monotonic() - started
+
+    assert [r.env for r in results] == ENVS
+    # three half-second plans ran side by side
+    assert elapsed < 1.4
+    assert all(r.timings["plan"] >= 0.5 for r in results)
+
+    # every env saw its own credentials and its own rendered tree
+    plans = sorted(line for line in calls.read_text().splitlines() if "plan" in line)
+    assert plans == [
+        'plan client-dev rg = "rg-kv-dev"',
+        'plan client-stg rg = "rg-kv-stg"',
+        'plan client-uat rg = "rg-kv-uat"',
+    ]
+
+
+def test_failing_env_does_not_stop_the_others(project):
+    proj_dir, tokenizer, installer, _, root = project
+
+    results = run_pipelines(
+        "validate",
+        ENVS,
+        proj_dir,
+        tokenizer,
+        installer,
+        jobs=1,
+        plugin_cache=PluginCache(root / "plugins"),
+    )
+
+    assert [r.ok for r in results] == [True, True, False]
+    assert "[uat] terraform plan failed with exit code 1" in results[2].error
+    assert list(results[0].timings) == ["prepare", "init", "validate", "plan"]
+
+
+def test_format_results():
+    table = format_results(
+        [
+            PipelineResult("dev", {"prepare": 1.25, "init": 3.0, "plan": 10.0}),
+            PipelineResult("prod", {"prepare": 1.0}, error="KeyError: 'TF_KEY'"),
+        ]
+    )
+
+    assert table.splitlines() == [
+        "ENV   STATUS  PREPARE  INIT  PLAN   TOTAL  ERROR",
+        "dev   ok      1.2s     3.0s  10.0s  14.2s",
+        "prod  FAILED  1.0s     -     -      1.0s   KeyError: 'TF_KEY'",
+    ]
+
+
+@pytest.fixture
+def monorepo(project):
+    _, _, installer, calls, root = project
+    repo = root / "repo"
+    _write_project(repo / "network", ["dev", "stg"])
+    _write_project(repo / "apps" / "web", ["dev"])
+    # rendering fails: the vault has no such secret
+    _write_project(repo / "apps" / "api", ["dev"], main_tf='x = "{{__missing__}}"')
+    # not root modules: no env files, or no .tf files, or hidden
+    (repo / "network" / "modules" / "subnet").mkdir(parents=True)
+    (repo / "network" / "modules" / "subnet" / "main.tf").write_text("")
+    (repo / "docs").mkdir()
+    (repo / "docs" / ".env.dev").write_text("")
+    _write_project(repo / "apps" / "web" / ".terraform" / "modules" / "x", ["dev"])
+    yield repo, installer, root
+
+
+def test_discover_projects(monorepo):
+    repo, _, _ = monorepo
+
+    assert discover_projects(repo, ["dev", "stg"]) == {
+        repo / "apps" / "api": ["dev"],
+        repo / "apps" / "web": ["dev"],
+        repo / "network": ["dev", "stg"],
+    }
+    assert discover_projects(repo, ["stg"]) == {repo / "network": ["stg"]}
+
+
+def test_run_projects_isolates_failures(monorepo):
+    repo, installer, root = monorepo
+
+    results = run_projects(
+        "plan",
+        discover_projects(repo, ["dev", "stg"]),
+        installer,
+        jobs=2,
+        plugin_cache=PluginCache(root / "plugins"),
+    )
+
+    assert [
+        (r.proj_dir.relative_to(repo).as_posix(), r.env, r.ok) for r in results
+    ] == [
+        ("apps/api", "dev", False),
+        ("apps/web", "dev", True),
+        ("network", "dev", True),
+        ("network", "stg", True),
+    ]
+    assert "UnparsedTokensError" in results[0].error
+
+    summary = json.loads(
+        write_summary(results, root / "out" / "summary.json", action="plan").read_text()
+    )
+    assert (summary["action"], summary["ok"], summary["failed"]) == ("plan", 3, 1)
+    assert summary["results"][1]["project"] == str(repo / "apps" / "web")
+    assert summary["results"][1]["status"] == "ok"
+    assert set(summary["results"][1]["timings"]) == {"prepare", "init", "plan"}
+
+    table = format_results(results, root_dir=repo).splitlines()
+    assert table[0].startswith("PROJECT   ENV  STATUS")
+    assert table[1].startswith("apps/api  dev  FAILED")
+
+
+def test_affected_projects(monorepo):
+    repo, _, _ = monorepo
+    projects = discover_projects(repo, ["dev"])
+    shared = repo / "modules" / "tags"
+    shared.mkdir(parents=True)
+    (shared / "main.tf").write_text("")
+    (repo / "apps" / "web" / "main.tf").write_text(
+        'module "tags" {\n  source = "../../modules/tags"\n}\n'
+    )
+
+    def affected(*changed):
+        return sorted(
+            p.relative_to(repo).as_posix()
+            for p in affected_projects(projects, [repo / c for c in changed])
+        )
+
+    assert affected("modules/tags/main.tf") == ["apps/web"]
+    assert affected("network/.env.dev", "docs/index.md") == ["network"]
+    assert affected("network/modules/subnet/main.tf") == ["network"]
+    assert affected("README.md") == []
+
+
+def test_deploy_applies_saved_plan(project):
+    proj_dir, tokenizer, _, _, root = project
+    calls, state = root / "plan-calls.log", root / "state.json"
+    state.write_text('{"version": 4, "serial": 7, "lineage": "abc"}')
+    tf_bin = root / "terraform-plan"
+    tf_bin.write_text(PLAN_TERRAFORM.format(calls=calls, state=state))
+    tf_bin.chmod(0o755)
+    installer = FakeInstaller(tf_bin)
+    plan_path = root / "plans" / "dev.tfplan"
+
+    def run(action, tokenizer=tokenizer, **kwargs):
+        pipeline = TerraformPipeline(
+            "dev", proj_dir, tokenizer, plugin_cache=PluginCache(root / "plugins")
+        ).prepare()
+        try:
+            pipeline.run(action, installer, **kwargs)
+        finally:
+            pipeline.clean_up()
+        return pipeline
+
+    pipeline = run("validate", save_plan=plan_path)
+    assert plan_path.read_text() == 'rg = "rg-kv-dev"'
+    assert pipeline.plan_result.to_destroy == 1
+
+    calls.write_text("")
+    run("deploy", apply_plan=plan_path)
+    steps = [line.split()[0] for line in calls.read_text().splitlines()]
+    # no refresh or plan, the saved plan is applied as is
+    assert steps == ["init", "state", "show", "apply"]
+    assert calls.read_text().splitlines()[-1].endswith("cloudforge.tfplan")
+
+    state.write_text('{"version": 4, "serial": 8, "lineage": "abc"}')
+    with pytest.raises(StalePlanError, match="state_serial"):
+        run("deploy", apply_plan=plan_path)
+
+    state.write_text('{"version": 4, "serial": 7, "lineage": "abc"}')
+    (proj_dir / "main.tf").write_text('rg = "{{__rg_name__}}-2"')
+    with pytest.raises(StalePlanError, match="tree_hash"):
+        run("deploy", Tokenizer(proj_dir, "tf").read_root(), apply_plan=plan_path)
+
+
+def test_resource_timings_run_plan_with_json(project):
+    proj_dir, tokenizer, _, _, root = project
+    calls, state = root / "plan-calls.log", root / "state.json"
+    state.write_text("")
+    tf_bin = root / "terraform-plan"
+    tf_bin.write_text(PLAN_TERRAFORM.format(calls=calls, state=state))
+    tf_bin.chmod(0o755)
+
+    pipeline = TerraformPipeline(
+        "dev",
+        proj_dir,
+        tokenizer,
+        plugin_cache=PluginCache(root / "plugins"),
+        resource_timings=True,
+    ).prepare()
+    try:
+        pipeline.run("validate", FakeInstaller(tf_bin))
+    finally:
+        pipeline.clean_up()
+
+    flags = {
+        line.split()[0]: line.split()[1:] for line in calls.read_text().splitlines()
+    }
+    assert "-json" in flags["plan"]
+    assert "-json" not in flags["validate"]
+    assert pipeline.timings_collector.report().timings == []
+
+
+def test_skipped_init_keeps_providers_and_reinits_after_prune(project, monkeypatch):
+    proj_dir, tokenizer, _, _, root = project
+    monkeypatch.setattr(terraform_pipeline, "TF_WORKDIRS_PATH", root / "workdirs")
+    provider = "registry.terraform.io/hashicorp/random/3.4.0"
+    calls = root / "link-calls.log"
+    tf_bin = root / "terraform-link"
+    tf_bin.write_text(LINK_TERRAFORM.format(calls=calls, provider=provider))
+    tf_bin.chmod(0o755)
+    plugins = PluginCache(root / "plugins")
+    entry = plugins.root / provider / "linux_amd64"
+    entry.mkdir(parents=True)
+    (entry / "terraform-provider-random").write_bytes(b"\0" * 512)
+
+    def run():
+        calls.write_text("")
+        pipeline = TerraformPipeline(
+            "dev", proj_dir, tokenizer, stable_workdir=True, plugin_cache=plugins
+        ).prepare()
+        try:
+            pipeline.run("validate", FakeInstaller(tf_bin))
+        finally:
+            pipeline.clean_up()
+        return calls.read_text().split()
+
+    assert run()[0] == "init"
+
+    os.utime(entry, (1000, 1000))
+    assert "init" not in run()
+    # the skipped init still marked the linked provider as used
+    assert entry.stat().st_mtime > 1000
+    assert plugins.prune(max_bytes=1024) == []
+
+    assert plugins.prune(max_bytes=0) == [entry]
+    assert run()[0] == "init"
+
+
+def test_stable_workdir_locks_are_per_env(tmpdir, monkeypatch):
+    root = Path(tmpdir)
+    proj_dir = root / "app"
+    envs = ["prod.eu", "prod.us"]
+    _write_project(proj_dir, envs)
+    monkeypatch.delenv("ARM_VARS_USE_EXISTING", raising=False)
+    monkeypatch.setattr(terraform_pipeline, "AzureKeyVault", FakeKeyVault)
+    monkeypatch.setattr(terraform_pipeline, "TF_WORKDIRS_PATH", root / "workdirs")
+    tokenizer = Tokenizer(proj_dir, "tf")
+    tokenizer.read_root()
+
+    locks = []
+    for env in envs:
+        pipeline = TerraformPipeline(
+            env, proj_dir, tokenizer, stable_workdir=True
+        ).prepare()
+        locks.append(pipeline.workdir_lock.path)
+        pipeline.clean_up()
+
+    # with_suffix would have given both "app-prod.lock"
+    assert locks[0] != locks[1]
+    assert locks[0].name.startswith("app-prod.eu-")
+
+
+def test_inits_overlap_once_providers_are_cached(tmpdir, monkeypatch):
+    root = Path(tmpdir)
+    proj_dir = root / "project"
+    _write_project(
+        proj_dir,
+        ["dev", "stg"],
+        main_tf="terraform {\n  required_providers {\n"
+        '    random = { source = "hashicorp/random" }\n  }\n}\n',
+    )
+    monkeypatch.delenv("ARM_VARS_USE_EXISTING", raising=False)
+    monkeypatch.setattr(terraform_pipeline, "AzureKeyVault", FakeKeyVault)
+    monkeypatch.setattr(terraform_pipeline, "TF_WORKDIRS_PATH", root / "workdirs")
+    tokenizer = Tokenizer(proj_dir, "tf")
+    tokenizer.read_root()
+
+    calls = root / "calls.log"
+    tf_bin = root / "terraform"
+    provider = "registry.terraform.io/hashicorp/random"
+    tf_bin.write_text(
+        LOCKING_TERRAFORM.format(calls=calls, provider=provider, version="3.4.0")
+    )
+    tf_bin.chmod(0o755)
+    plugins = PluginCache(root / "plugins")
+    (plugins.root / provider / "3.4.0" / host_platform()).mkdir(parents=True)
+
+    def run_inits():
+        calls.write_text("")
+        results = run_pipelines(
+            "validate",
+            ["dev", "stg"],
+            proj_dir,
+            tokenizer,
+            FakeInstaller(tf_bin),
+            stable_workdir=True,
+            force_init=True,
+            plugin_cache=plugins,
+        )
+        assert all(r.ok for r in results)
+        return calls.read_text().split("\n")[:-1]
+
+    # without a lock file the providers init picks are unknown, so inits take turns
+    assert run_inits() == ["init start", "init end"] * 2
+    # the pinned provider is cached, so the inits run side by side
+    assert run_inits() == ["init start"] * 2 + ["init end"] * 2
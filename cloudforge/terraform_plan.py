@@ -0,0 +1,593 @@
+"""
+The terraform_plan module hands a saved Terraform plan from one run over to a later deployment.
+
+`terraform plan -out` writes a binary plan that `terraform apply` can execute as is, without
+refreshing or planning again. A PlanManifest saved next to the plan records what the plan was made
+from: the rendered tree, the variables and backend, the state serial and lineage and the Terraform
+version. A deployment builds the manifest of its own inputs and only applies the plan while both
+still match, so a plan reviewed in CI is never applied to a configuration or state it was not made
+for.
+
+Example Usage:
+manifest = PlanManifest.build(tree, proj_dir, backend_config, env_vars, state_path, tf_version)
+manifest.write(plan_path)
+
+saved = PlanManifest.read(plan_path)
+mismatches = saved.mismatches(manifest)
+
+PlanResult models the `terraform show -json` output of a plan. Plans of large estates run to hundreds
+of megabytes, so the document is scanned in chunks and only the `resource_changes` entries are
+decoded, one at a time, keeping their addresses and actions.
+
+Example Usage:
+plan = PlanResult.from_file(Path("plan.json"))
+if plan.to_destroy:
+    print([change.address for change in plan.changes("delete")])
+"""
+
+from pathlib import Path
+from typing import IO, Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import hashlib
+import json
+import os
+import re
+
+# the plan file name inside the working directory
+PLAN_FILE = "cloudforge.tfplan"
+
+# `terraform state pull` prints these before the resources, within the first few hundred bytes
+_STATE_HEADER_BYTES = 64 * 1024
+_SERIAL_RE = re.compile(r'"serial"\s*:\s*(\d+)')
+_LINEAGE_RE = re.compile(r'"lineage"\s*:\s*"([^"]*)"')
+
+# backend settings selecting the state, as opposed to credentials that may rotate
+_BACKEND_KEYS = ("storage_account_name", "container_name", "key")
+_TARGET_ENV_VARS = ("ARM_SUBSCRIPTION_ID", "ARM_TENANT_ID")
+
+
+class StalePlanError(Exception):
+    """
+    Exception raised when a saved plan no longer matches the configuration or state it would be applied to.
+
+    Args:
+        plan_path (Path): The saved plan.
+        mismatches (List[str]): The manifest fields that differ.
+    """
+
+    def __init__(self, plan_path: Path, mismatches: List[str]) -> None:
+        self.plan_path = plan_path
+        self.mismatches = mismatches
+        super().__init__(
+            f"Saved plan {plan_path} is stale, {', '.join(mismatches)} changed since it was made. "
+            "Create a new plan with `validate --save-plan`."
+        )
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_hash(fpath: Path) -> str:
+    """
+    Hashes a file in chunks.
+
+    Args:
+        fpath (Path): The file.
+
+    Returns:
+        str: The sha256 hex digest of the file content.
+    """
+    digest = hashlib.sha256()
+    with open(fpath, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def tree_hash(tree: Dict[str, str], root: Path) -> str:
+    """
+    Hashes a rendered tree independently of where the project is checked out.
+
+    Args:
+        tree (Dict[str, str]): The rendered files, keyed by path.
+        root (Path): The directory the paths are made relative to.
+
+    Returns:
+        str: The sha256 hex digest of the tree.
+    """
+    files = {Path(fpath).relative_to(root).as_posix(): c for fpath, c in tree.items()}
+    return _sha256(json.dumps(files, sort_keys=True).encode())
+
+
+def var_hash(backend_config: Dict[str, str], env_vars: Dict[str, str]) -> str:
+    """
+    Hashes the inputs a plan depends on besides the rendered tree.
+
+    These are the backend settings locating the state, the target subscription and tenant and the
+    `TF_VAR_*` variables. Credentials such as the SAS token or client secret are left out, so
+    rotating them does not invalidate a plan.
+
+    Args:
+        backend_config (Dict[str, str]): The backend configuration.
+        env_vars (Dict[str, str]): The environment Terraform runs with.
+
+    Returns:
+        str: The sha256 hex digest of the inputs.
+    """
+    inputs = {
+        "backend": {k: backend_config.get(k) for k in _BACKEND_KEYS},
+        "env": {
+            k: v
+            for k, v in env_vars.items()
+            if k in _TARGET_ENV_VARS or k.startswith("TF_VAR_")
+        },
+    }
+    return _sha256(json.dumps(inputs, sort_keys=True).encode())
+
+
+def read_state_header(fpath: Path) -> Tuple[Optional[int], Optional[str]]:
+    """
+    Reads the serial and lineage of a state, as printed by `terraform state pull`.
+
+    Only the head of the file is read, the state itself may be large.
+
+    Args:
+        fpath (Path): The state file.
+
+    Returns:
+        Tuple[Optional[int], Optional[str]]: The serial and lineage, `None` when there is no state yet.
+    """
+    with open(fpath, "r", encoding="utf-8", errors="replace") as f:
+        head = f.read(_STATE_HEADER_BYTES)
+    serial = _SERIAL_RE.search(head)
+    lineage = _LINEAGE_RE.search(head)
+    return (
+        int(serial.group(1)) if serial else None,
+        lineage.group(1) if lineage else None,
+    )
+
+
+def manifest_path(plan_path: Path) -> Path:
+    """Returns the path of the manifest saved next to a plan."""
+    plan_path = Path(plan_path)
+    return plan_path.with_name(plan_path.name + ".manifest.json")
+
+
+class PlanManifest:
+    """
+    Records what a saved plan was made from.
+
+    Args:
+        tree_hash (str): The hash of the rendered tree.
+        var_hash (str): The hash of the backend settings and variables.
+        state_serial (int, optional): The serial of the state the plan was made against.
+        state_lineage (str, optional): The lineage of that state.
+        terraform_version (str): The version of Terraform that made the plan.
+        plan_hash (str, optional): The hash of the plan file, set when the manifest is written.
+    """
+
+    # the fields a deployment must match to apply the plan
+    FIELDS = (
+        "tree_hash",
+        "var_hash",
+        "state_serial",
+        "state_lineage",
+        "terraform_version",
+    )
+
+    def __init__(
+        self,
+        tree_hash: str,
+        var_hash: str,
+        state_serial: Optional[int],
+        state_lineage: Optional[str],
+        terraform_version: str,
+        plan_hash: Optional[str] = None,
+    ) -> None:
+        self.tree_hash = tree_hash
+        self.var_hash = var_hash
+        self.state_serial = state_serial
+        self.state_lineage = state_lineage
+        self.terraform_version = terraform_version
+        self.plan_hash = plan_hash
+
+    @classmethod
+    def build(
+        cls,
+        tree: Dict[str, str],
+        proj_dir: Path,
+        backend_config: Dict[str, str],
+        env_vars: Dict[str, str],
+        state_path: Path,
+        terraform_version: str,
+    ) -> "PlanManifest":
+        """
+        Builds the manifest of the current inputs.
+
+        Args:
+            tree (Dict[str, str]): The rendered files, keyed by path under `proj_dir`.
+            proj_dir (Path): The project directory.
+            backend_config (Dict[str, str]): The backend configuration.
+            env_vars (Dict[str, str]): The environment Terraform runs with, on top of `os.environ`.
+            state_path (Path): The output of `terraform state pull`.
+            terraform_version (str): The version of the Terraform binary.
+
+        Returns:
+            PlanManifest: The manifest.
+        """
+        serial, lineage = read_state_header(state_path)
+        return cls(
+            tree_hash=tree_hash(tree, proj_dir),
+            var_hash=var_hash(backend_config, {**os.environ, **env_vars}),
+            state_serial=serial,
+            state_lineage=lineage,
+            terraform_version=terraform_version,
+        )
+
+    def to_dict(self) -> Dict[str, object]:
+        """Returns the manifest as a JSON serializable dictionary."""
+        return {field: getattr(self, field) for field in self.FIELDS + ("plan_hash",)}
+
+    def write(self, plan_path: Path) -> Path:
+        """
+        Writes the manifest next to a saved plan, recording the hash of the plan file.
+
+        Args:
+            plan_path (Path): The saved plan.
+
+        Returns:
+            Path: The path of the manifest.
+        """
+        self.plan_hash = file_hash(plan_path)
+        fpath = manifest_path(plan_path)
+        fpath.write_text(json.dumps(self.to_dict(), indent=2))
+        return fpath
+
+    @classmethod
+    def read(cls, plan_path: Path) -> "PlanManifest":
+        """
+        Reads the manifest saved next to a plan.
+
+        Args:
+            plan_path (Path): The saved plan.
+
+        Returns:
+            PlanManifest: The manifest.
+
+        Raises:
+            FileNotFoundError: If the plan has no manifest.
+        """
+        data = json.loads(manifest_path(plan_path).read_text())
+        return cls(**{k: data.get(k) for k in cls.FIELDS + ("plan_hash",)})
+
+    def mismatches(self, current: "PlanManifest") -> List[str]:
+        """
+        Compares the manifest of a saved plan to the manifest of the current inputs.
+
+        Args:
+            current (PlanManifest): The manifest of the current inputs.
+
+        Returns:
+            List[str]: The fields that differ, empty when the plan can be applied.
+        """
+        return [f for f in self.FIELDS if getattr(self, f) != getattr(current, f)]
+
+
+# a complete string, a bracket, or the opening quote of a string that is not fully buffered yet
+_TOKEN_RE = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"|[{}\[\]"]')
+# everything up to the next bracket, or string that is not fully buffered yet
+_SKIP_RE = re.compile(r'(?:[^"{}\[\]]+|"[^"\\]*(?:\\.[^"\\]*)*")*')
+_IN_STRING_RE = re.compile(r'["\\]')
+_VALUE_END_RE = re.compile(r"[,\]}]")
+_NON_WS_RE = re.compile(r"\S")
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+
+class _JsonScanner:
+    """
+    Walks the structure of a JSON document read in chunks, without decoding it.
+
+    Only the unread part of the current chunk is kept in memory, plus the value being captured, if any.
+    """
+
+    def __init__(self, f: IO[str], chunk_size: int) -> None:
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.mark: Optional[int] = None
+
+    def _fill(self) -> bool:
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            return False
+        start = self.pos if self.mark is None else min(self.mark, self.pos)
+        self.buf = self.buf[start:] + chunk
+        self.pos -= start
+        if self.mark is not None:
+            self.mark -= start
+        return True
+
+    def _search(self, regex: "re.Pattern") -> Optional["re.Match"]:
+        while True:
+            match = regex.search(self.buf, self.pos)
+            if match:
+                return match
+            self.pos = len(self.buf)
+            if not self._fill():
+                return None
+
+    def next_token(self, strings: bool = False) -> str:
+        """
+        Moves past the next bracket, or string, and returns it.
+
+        Args:
+            strings (bool): Whether strings are returned too. Otherwise they are skipped over along
+                with scalars, in bulk, which is what makes skipping large values fast.
+
+        Returns:
+            str: The token, empty at the end of the document.
+        """
+        if strings:
+            match = self._search(_TOKEN_RE)
+            if match is None:
+                return ""
+            self.pos = match.end()
+            if match.group() != '"':
+                return match.group()
+            # the string spans chunks
+            self.mark = self.pos - 1
+            try:
+                self._skip_string_tail()
+                return self.buf[self.mark : self.pos]
+            finally:
+                self.mark = None
+
+        while True:
+            end = _SKIP_RE.match(self.buf, self.pos).end()
+            if end == len(self.buf):
+                self.pos = end
+                if not self._fill():
+                    return ""
+                continue
+            self.pos = end + 1
+            if self.buf[end] != '"':
+                return self.buf[end]
+            # the string spans chunks
+            self._skip_string_tail()
+
+    def _skip_string_tail(self) -> None:
+        # the string did not fit what is buffered, walk it escape by escape
+        while True:
+            match = self._search(_IN_STRING_RE)
+            if match is None:
+                raise ValueError("Unexpected end of JSON document in a string")
+            self.pos = match.end()
+            if match.group() == '"':
+                return
+            if self.pos >= len(self.buf) and not self._fill():
+                raise ValueError("Unexpected end of JSON document in a string")
+            self.pos += 1
+
+    def peek(self) -> str:
+        """Moves to the next non whitespace character and returns it, without consuming it."""
+        match = self._search(_NON_WS_RE)
+        if match is None:
+            return ""
+        self.pos = match.start()
+        return match.group()
+
+    def skip_value(self) -> None:
+        """Moves past the value starting at the next non whitespace character."""
+        first = self.peek()
+        if first in ("{", "["):
+            depth = 0
+            while True:
+                token = self.next_token()
+                if token in ("{", "["):
+                    depth += 1
+                elif token in ("}", "]"):
+                    depth -= 1
+                    if depth == 0:
+                        return
+                elif not token:
+                    raise ValueError("Unexpected end of JSON document")
+        elif first == '"':
+            self.next_token(strings=True)
+        else:
+            match = self._search(_VALUE_END_RE)
+            self.pos = match.start() if match else len(self.buf)
+
+    def read_value(self) -> Any:
+        """Decodes the value starting at the next non whitespace character."""
+        self.peek()
+        self.mark = self.pos
+        try:
+            self.skip_value()
+            return json.loads(self.buf[self.mark : self.pos])
+        finally:
+            self.mark = None
+
+    def iter_array(self) -> Iterator[Any]:
+        """Decodes the items of the array whose opening bracket was just read, one at a time."""
+        while True:
+            char = self.peek()
+            if char == ",":
+                self.pos += 1
+            elif char == "]":
+                self.pos += 1
+                return
+            elif not char:
+                raise ValueError("Unexpected end of JSON document in an array")
+            else:
+                yield self.read_value()
+
+
+def iter_top_level_array(
+    f: IO[str], key: str, chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> Iterator[Any]:
+    """
+    Decodes the items of an array held by a key of the top level object, one at a time.
+
+    Every other value is skipped over without being decoded.
+
+    Args:
+        f (IO[str]): The JSON document.
+        key (str): The key of the array.
+        chunk_size (int): The number of characters read at once.
+
+    Returns:
+        Iterator[Any]: The decoded items.
+    """
+    scanner = _JsonScanner(f, chunk_size)
+    depth = 0
+    last_string = None
+    while True:
+        token = scanner.next_token(strings=depth <= 1)
+        if not token:
+            return
+        if token == "[" and depth == 1 and last_string == json.dumps(key):
+            # an array in the top level object follows its key
+            yield from scanner.iter_array()
+        elif token in ("{", "["):
+            depth += 1
+        elif token in ("}", "]"):
+            depth -= 1
+        elif depth == 1:
+            last_string = token
+
+
+# `change.actions` of a resource change, mapped to a single action
+_ACTIONS = {
+    ("create",): "create",
+    ("read",): "read",
+    ("update",): "update",
+    ("delete",): "delete",
+    ("no-op",): "no-op",
+    ("delete", "create"): "replace",
+    ("create", "delete"): "replace",
+}
+
+
+class ResourceChange:
+    """
+    A planned change of one resource instance.
+
+    Args:
+        address (str): The address of the resource instance, e.g. `module.net.azurerm_subnet.a[0]`.
+        actions (Sequence[str]): The actions Terraform plans, e.g. `["delete", "create"]`.
+        type (str, optional): The resource type.
+        provider_name (str, optional): The provider of the resource.
+
+    Attributes:
+        action (str): The actions as one of "create", "read", "update", "delete", "replace" or "no-op".
+    """
+
+    def __init__(
+        self,
+        address: str,
+        actions: Sequence[str],
+        type: Optional[str] = None,
+        provider_name: Optional[str] = None,
+    ) -> None:
+        self.address = address
+        self.actions = tuple(actions)
+        self.type = type
+        self.provider_name = provider_name
+        self.action = _ACTIONS.get(self.actions, "-".join(self.actions))
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> "ResourceChange":
+        """Builds a change from an entry of `resource_changes`, dropping the before and after values."""
+        return cls(
+            address=data["address"],
+            actions=data.get("change", {}).get("actions", []),
+            type=data.get("type"),
+            provider_name=data.get("provider_name"),
+        )
+
+    def __repr__(self) -> str:
+        return f"ResourceChange({self.address!r}, {self.action!r})"
+
+
+class PlanResult:
+    """
+    The resource changes of a plan, indexed by address and by action.
+
+    Args:
+        changes (Sequence[ResourceChange]): The resource changes, in plan order.
+
+    Attributes:
+        resource_changes (Dict[str, ResourceChange]): The changes keyed by resource address.
+        counts (Dict[str, int]): The number of changes per action.
+    """
+
+    def __init__(self, changes: Sequence[ResourceChange]) -> None:
+        self.resource_changes: Dict[str, ResourceChange] = {}
+        self._by_action: Dict[str, List[ResourceChange]] = {}
+        for change in changes:
+            self.resource_changes[change.address] = change
+            self._by_action.setdefault(change.action, []).append(change)
+        self.counts: Dict[str, int] = {
+            action: len(changes) for action, changes in self._by_action.items()
+        }
+
+    @classmethod
+    def from_file(
+        cls, fpath: Path, chunk_size: int = DEFAULT_CHUNK_SIZE
+    ) -> "PlanResult":
+        """
+        Parses the output of `terraform show -json <plan>`, without loading the whole document.
+
+        Args:
+            fpath (Path): The JSON plan.
+            chunk_size (int): The number of characters read at once.
+
+        Returns:
+            PlanResult: The plan.
+        """
+        with open(fpath, "r", encoding="utf-8") as f:
+            return cls(
+                [
+                    ResourceChange.from_json(data)
+                    for data in iter_top_level_array(f, "resource_changes", chunk_size)
+                ]
+            )
+
+    def changes(self, action: str) -> List[ResourceChange]:
+        """
+        Returns the changes of an action.
+
+        Args:
+            action (str): One of "create", "read", "update", "delete", "replace" or "no-op".
+
+        Returns:
+            List[ResourceChange]: The changes, in plan order.
+        """
+        return list(self._by_action.get(action, ()))
+
+    @property
+    def to_add(self) -> int:
+        """The number of resources created, replacements included, as counted by `terraform plan`."""
+        return self.counts.get("create", 0) + self.counts.get("replace", 0)
+
+    @property
+    def to_change(self) -> int:
+        """The number of resources updated in place."""
+        return self.counts.get("update", 0)
+
+    @property
+    def to_destroy(self) -> int:
+        """The number of resources destroyed, replacements included, as counted by `terraform plan`."""
+        return self.counts.get("delete", 0) + self.counts.get("replace", 0)
+
+    @property
+    def has_changes(self) -> bool:
+        """Whether applying the plan changes any resource."""
+        return bool(self.to_add or self.to_change or self.to_destroy)
+
+    def summary(self) -> str:
+        """Returns the counts the way `terraform plan` prints them."""
+        return f"Plan: {self.to_add} to add, {self.to_change} to change, {self.to_destroy} to destroy."
@@ -0,0 +1,152 @@
+import io
+import json
+import pytest
+import tracemalloc
+from pathlib import Path
+from .terraform_plan import (
+    PlanManifest,
+    PlanResult,
+    iter_top_level_array,
+    manifest_path,
+    read_state_header,
+    tree_hash,
+    var_hash,
+)
+
+BACKEND_CONFIG = {
+    "storage_account_name": "sa",
+    "sas_token": "token",
+    "key": "dev.tfstate",
+    "container_name": "tfstate",
+}
+
+
+def test_tree_hash_ignores_checkout_location():
+    tree = {"/a/proj/main.tf": "x", "/a/proj/mod/main.tf": "y"}
+    moved = {"/ci/build/proj/main.tf": "x", "/ci/build/proj/mod/main.tf": "y"}
+
+    assert tree_hash(tree, Path("/a/proj")) == tree_hash(moved, Path("/ci/build/proj"))
+    assert tree_hash(tree, Path("/a/proj")) != tree_hash(
+        {**tree, "/a/proj/main.tf": "z"}, Path("/a/proj")
+    )
+
+
+def test_var_hash_ignores_credentials():
+    env_vars = {"ARM_SUBSCRIPTION_ID": "sub", "ARM_CLIENT_SECRET": "s1", "PATH": "/bin"}
+    before = var_hash(BACKEND_CONFIG, env_vars)
+
+    rotated = var_hash(
+        {**BACKEND_CONFIG, "sas_token": "new"},
+        {**env_vars, "ARM_CLIENT_SECRET": "s2", "PATH": "/usr/bin"},
+    )
+    assert rotated == before
+    assert var_hash(BACKEND_CONFIG, {**env_vars, "TF_VAR_sku": "P1"}) != before
+    assert var_hash({**BACKEND_CONFIG, "key": "stg.tfstate"}, env_vars) != before
+
+
+def test_read_state_header(tmpdir):
+    fpath = Path(tmpdir) / "state.json"
+    fpath.write_text(
+        '{\n  "version": 4,\n  "terraform_version": "1.0.11",\n  "serial": 42,\n'
+        '  "lineage": "3c1d-aa", "resources": [' + '{"x": 1},' * 100000 + "{}]}"
+    )
+    assert read_state_header(fpath) == (42, "3c1d-aa")
+
+    fpath.write_text("")
+    assert read_state_header(fpath) == (None, None)
+
+
+def test_manifest_roundtrip(tmpdir):
+    plan_path = Path(tmpdir) / "dev.tfplan"
+    plan_path.write_bytes(b"plan")
+    manifest = PlanManifest("t", "v", 3, "lineage", "1.0.11")
+
+    assert manifest.write(plan_path) == manifest_path(plan_path)
+    saved = PlanManifest.read(plan_path)
+    assert saved.to_dict() == manifest.to_dict()
+    assert saved.plan_hash is not None
+    assert saved.mismatches(manifest) == []
+
+    current = PlanManifest("t", "v", 4, "lineage", "1.3.0")
+    assert saved.mismatches(current) == ["state_serial", "terraform_version"]
+
+
+def _change(address, *actions):
+    return {
+        "address": address,
+        "type": address.split(".")[-2],
+        "change": {"actions": list(actions), "before": {"tags": {"a": "]}"}}},
+    }
+
+
+SHOW_JSON = {
+    "format_version": "1.2",
+    "planned_values": {"root_module": {"resources": [{"values": {"x": '"[{'}}]}},
+    "resource_changes": [
+        _change("azurerm_resource_group.rg", "no-op"),
+        _change("module.net.azurerm_subnet.a[0]", "delete", "create"),
+        _change("azurerm_storage_account.sa", "update"),
+        _change("azurerm_key_vault.kv", "delete"),
+        _change("azurerm_key_vault.new", "create"),
+    ],
+    "prior_state": {"values": {"resource_changes": []}},
+}
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 4096])
+def test_iter_top_level_array(chunk_size):
+    items = iter_top_level_array(
+        io.StringIO(json.dumps(SHOW_JSON, indent=2)), "resource_changes", chunk_size
+    )
+    assert list(items) == SHOW_JSON["resource_changes"]
+
+
+def test_plan_result(tmpdir):
+    fpath = Path(tmpdir) / "plan.json"
+    fpath.write_text(json.dumps(SHOW_JSON))
+    plan = PlanResult.from_file(fpath)
+
+    assert list(plan.resource_changes)[1] == "module.net.azurerm_subnet.a[0]"
+    assert plan.resource_changes["azurerm_key_vault.kv"].action == "delete"
+    assert [c.address for c in plan.changes("replace")] == [
+        "module.net.azurerm_subnet.a[0]"
+    ]
+    assert plan.changes("read") == []
+    assert plan.counts == {
+        "no-op": 1,
+        "replace": 1,
+        "update": 1,
+        "delete": 1,
+        "create": 1,
+    }
+    assert plan.summary() == "Plan: 2 to add, 1 to change, 2 to destroy."
+    assert plan.has_changes
+
+
+def test_plan_result_bounds_memory(tmpdir):
+    fpath = Path(tmpdir) / "plan.json"
+    values = json.dumps({f"attr{i}": "v" * 64 for i in range(40)})
+    with open(fpath, "w") as f:
+        f.write('{"planned_values": {"resources": [')
+        f.write(",".join(f'{{"values": {values}}}' for _ in range(5000)))
+        f.write('], "x": []}, "resource_changes": [')
+        f.write(
+            ",".join(
+                f'{{"address": "x.r{i}", "change": {{"actions": ["update"], "after": {values}}}}}'
+                for i in range(5000)
+            )
+        )
+        f.write('], "prior_state": {"resources": [')
+        f.write(",".join(f'{{"values": {values}}}' for _ in range(5000)))
+        f.write("]}}")
+    assert fpath.stat().st_size > 30 * 1024 * 1024
+
+    tracemalloc.start()
+    try:
+        plan = PlanResult.from_file(fpath, chunk_size=256 * 1024)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert plan.counts == {"update": 5000}
+    assert peak < 8 * 1024 * 1024
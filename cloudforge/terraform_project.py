@@ -0,0 +1,358 @@
+"""
+The terraform_project module provides helpers that inspect Terraform configuration without running Terraform.
+
+The parsing is intentionally shallow: it understands blocks, quoted strings and comments, which is enough
+to pull `required_providers` and `module` sources out of a rendered tree, but it is not a full HCL parser.
+
+Example Usage:
+tokenizer = Tokenizer(proj_dir, "tf")
+tokenizer.read_root()
+tree = tokenizer.tree
+providers = parse_required_providers(tree)
+addresses = provider_addresses(tree)
+modules = parse_module_sources(tree)
+dependencies = project_dependencies(proj_dir, tree)
+"""
+
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Set, Tuple
+
+import hashlib
+import json
+import re
+
+from . import logger
+
+INIT_FINGERPRINT_FILE = ".cloudforge-init"
+LOCK_FILE = ".terraform.lock.hcl"
+DEFAULT_REGISTRY = "registry.terraform.io"
+# where init records the modules it installed, nested ones included
+MODULES_MANIFEST = Path(".terraform") / "modules" / "modules.json"
+
+_REQUIRED_PROVIDERS_RE = re.compile(r"\brequired_providers\s*{")
+_MODULE_RE = re.compile(r'\bmodule\s+"([^"]+)"\s*{')
+_ATTR_RE = re.compile(r'^\s*([\w-]+)\s*=\s*"([^"]*)"', re.MULTILINE)
+_PROVIDER_RE = re.compile(r"^\s*([\w-]+)\s*=\s*{", re.MULTILINE)
+# a `provider "azurerm" {` configuration block, or a provider entry of the dependency lock file
+_PROVIDER_BLOCK_RE = re.compile(r'\bprovider\s+"([^"]+)"\s*{')
+_RESOURCE_RE = re.compile(
+    r'^\s*(?:resource|data)\s+"([^"]+)"\s+"[^"]*"\s*{', re.MULTILINE
+)
+
+
+def _block_end(content: str, start: int) -> int:
+    """
+    Finds the closing brace of a block, skipping quoted strings and comments.
+
+    Args:
+        content (str): The HCL content.
+        start (int): The index right after the opening brace.
+
+    Returns:
+        int: The index of the matching closing brace, or the end of the content.
+    """
+    depth = 1
+    idx = start
+    length = len(content)
+    while idx < length:
+        char = content[idx]
+        if char == '"':
+            idx += 1
+            while idx < length and content[idx] != '"':
+                idx += 2 if content[idx] == "\\" else 1
+        elif char == "#" or content.startswith("//", idx):
+            newline = content.find("\n", idx)
+            idx = length if newline == -1 else newline
+        elif content.startswith("/*", idx):
+            close = content.find("*/", idx + 2)
+            idx = length if close == -1 else close + 1
+        elif char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                return idx
+        idx += 1
+    return length
+
+
+def _iter_blocks(content: str, header: "re.Pattern") -> Iterator[Tuple[re.Match, str]]:
+    for match in header.finditer(content):
+        yield match, content[match.end() : _block_end(content, match.end())]
+
+
+def _top_level_attrs(body: str) -> Dict[str, str]:
+    """Collects `key = "value"` attributes that are not nested in a sub-block."""
+    attrs: Dict[str, str] = {}
+    for match in _ATTR_RE.finditer(body):
+        if body.count("{", 0, match.start()) == body.count("}", 0, match.start()):
+            attrs.setdefault(match.group(1), match.group(2))
+    return attrs
+
+
+def parse_required_providers(tree: Dict[str, str]) -> Dict[str, Dict[str, str]]:
+    """
+    Collects the providers declared in `terraform { required_providers { ... } }` blocks.
+
+    Args:
+        tree (Dict[str, str]): A dictionary of file paths and (rendered) contents.
+
+    Returns:
+        Dict[str, Dict[str, str]]: Provider local names mapped to their `source` and `version`.
+    """
+    providers: Dict[str, Dict[str, str]] = {}
+    for content in tree.values():
+        for _, body in _iter_blocks(content, _REQUIRED_PROVIDERS_RE):
+            for name, provider_body in _iter_blocks(body, _PROVIDER_RE):
+                providers[name.group(1)] = _top_level_attrs(provider_body)
+            # legacy shorthand: `azurerm = "~> 2.0"`
+            for name, version in _top_level_attrs(body).items():
+                providers.setdefault(name, {"version": version})
+    return providers
+
+
+def parse_implicit_providers(tree: Dict[str, str]) -> Set[str]:
+    """
+    Collects the providers a tree uses without declaring them in `required_providers`.
+
+    A provider is used by a `provider "<name>"` block or by a resource or data source whose type
+    starts with `<name>_`; terraform installs an undeclared one from `hashicorp/<name>`.
+
+    Args:
+        tree (Dict[str, str]): A dictionary of file paths and (rendered) contents.
+
+    Returns:
+        Set[str]: The local names of the undeclared providers.
+    """
+    used: Set[str] = set()
+    for content in tree.values():
+        used.update(match.group(1) for match in _PROVIDER_BLOCK_RE.finditer(content))
+        used.update(
+            match.group(1).split("_", 1)[0] for match in _RESOURCE_RE.finditer(content)
+        )
+    return used - set(parse_required_providers(tree))
+
+
+def provider_addresses(tree: Dict[str, str]) -> Set[str]:
+    """
+    Collects the fully qualified addresses of the providers a tree requires, declared or not.
+
+    Args:
+        tree (Dict[str, str]): A dictionary of file paths and (rendered) contents.
+
+    Returns:
+        Set[str]: The addresses, e.g. "registry.terraform.io/hashicorp/azurerm".
+    """
+    sources = {
+        name: attrs.get("source") or f"hashicorp/{name}"
+        for name, attrs in parse_required_providers(tree).items()
+    }
+    for name in parse_implicit_providers(tree):
+        sources[name] = f"hashicorp/{name}"
+
+    addresses: Set[str] = set()
+    for source in sources.values():
+        parts = source.lower().split("/")
+        if len(parts) == 2:
+            parts.insert(0, DEFAULT_REGISTRY)
+        addresses.add("/".join(parts))
+    return addresses
+
+
+def parse_lock_file(workdir: Path) -> Dict[str, str]:
+    """
+    Reads the provider versions pinned by the dependency lock file of a working directory.
+
+    Args:
+        workdir (Path): The working directory.
+
+    Returns:
+        Dict[str, str]: Provider addresses mapped to their version, empty without a lock file.
+    """
+    lock_file = Path(workdir) / LOCK_FILE
+    if not lock_file.is_file():
+        return {}
+    locked: Dict[str, str] = {}
+    content = lock_file.read_text(encoding="utf-8")
+    for match, body in _iter_blocks(content, _PROVIDER_BLOCK_RE):
+        version = _top_level_attrs(body).get("version")
+        if version:
+            locked[match.group(1).lower()] = version
+    return locked
+
+
+def parse_module_sources(tree: Dict[str, str]) -> Dict[str, Dict[str, str]]:
+    """
+    Collects the `source` and `version` of every `module "<name>" { ... }` block.
+
+    Args:
+        tree (Dict[str, str]): A dictionary of file paths and (rendered) contents.
+
+    Returns:
+        Dict[str, Dict[str, str]]: `<file path>:<module name>` mapped to the module `source` and `version`.
+    """
+    return {
+        f"{fpath}:{name}": {
+            k: v for k, v in attrs.items() if k in ("source", "version")
+        }
+        for fpath, name, attrs in _iter_modules(tree)
+    }
+
+
+def _iter_modules(tree: Dict[str, str]) -> Iterator[Tuple[str, str, Dict[str, str]]]:
+    """Yields the file path, name and top level attributes of every module block."""
+    for fpath, content in tree.items():
+        for match, body in _iter_blocks(content, _MODULE_RE):
+            yield fpath, match.group(1), _top_level_attrs(body)
+
+
+def local_module_dirs(tree: Dict[str, str]) -> Set[Path]:
+    """
+    Resolves the directories of the local modules, `source = "./..."` or `"../..."`, used by a tree.
+
+    Args:
+        tree (Dict[str, str]): A dictionary of file paths and contents.
+
+    Returns:
+        Set[Path]: The absolute, resolved module directories.
+    """
+    dirs: Set[Path] = set()
+    for fpath, _, attrs in _iter_modules(tree):
+        source = attrs.get("source", "")
+        if source.startswith(("./", "../")):
+            dirs.add((Path(fpath).parent / source).resolve())
+    return dirs
+
+
+def project_dependencies(proj_dir: Path, tree: Dict[str, str]) -> Set[Path]:
+    """
+    Collects the directories whose content affects a root module.
+
+    That is the project directory itself and, transitively, every local module it uses, wherever
+    it lives in the repository.
+
+    Args:
+        proj_dir (Path): The project directory.
+        tree (Dict[str, str]): The files of the project, as read by the Tokenizer.
+
+    Returns:
+        Set[Path]: The absolute, resolved directories.
+    """
+    return {Path(proj_dir).resolve()} | {d for d, _ in _walk_local_modules(tree)}
+
+
+def _walk_local_modules(tree: Dict[str, str]) -> Iterator[Tuple[Path, Dict[str, str]]]:
+    """Yields the directory and `.tf` files of every local module a tree uses, transitively."""
+    seen: Set[Path] = set()
+    pending = list(local_module_dirs(tree))
+    while pending:
+        module_dir = pending.pop()
+        if module_dir in seen:
+            continue
+        # a module that no longer exists still counts, its removal is a change
+        seen.add(module_dir)
+        module_tree: Dict[str, str] = {}
+        if module_dir.is_dir():
+            module_tree = {
+                str(f): f.read_text(encoding="utf-8") for f in module_dir.glob("*.tf")
+            }
+            pending.extend(local_module_dirs(module_tree) - seen)
+        yield module_dir, module_tree
+
+
+def with_local_modules(tree: Dict[str, str]) -> Dict[str, str]:
+    """
+    Adds the files of the local modules a tree uses, transitively, as read from disk.
+
+    Args:
+        tree (Dict[str, str]): A dictionary of file paths and (rendered) contents.
+
+    Returns:
+        Dict[str, str]: The files of the tree and of its local modules; those of the tree win.
+    """
+    full = dict(tree)
+    for _, module_tree in _walk_local_modules(tree):
+        for fpath, content in module_tree.items():
+            full.setdefault(fpath, content)
+    return full
+
+
+def init_fingerprint(
+    backend_config: Dict[str, str],
+    tree: Dict[str, str],
+    workdir: Path,
+    tf_version: str,
+) -> str:
+    """
+    Computes a fingerprint of everything `terraform init` depends on.
+
+    Covers the backend configuration, the declared and undeclared providers and the module sources
+    of the rendered tree and of the local modules it uses, the dependency lock file, the modules
+    init installed and the Terraform version.
+
+    Args:
+        backend_config (Dict[str, str]): The backend configuration passed to init.
+        tree (Dict[str, str]): A dictionary of file paths and rendered contents.
+        workdir (Path): The working directory init runs in.
+        tf_version (str): The version of the Terraform binary.
+
+    Returns:
+        str: A hex digest.
+    """
+    lock_file = workdir / LOCK_FILE
+    lock_hash = (
+        hashlib.sha256(lock_file.read_bytes()).hexdigest()
+        if lock_file.is_file()
+        else None
+    )
+
+    modules_json = workdir / MODULES_MANIFEST
+    modules_hash = (
+        hashlib.sha256(modules_json.read_bytes()).hexdigest()
+        if modules_json.is_file()
+        else None
+    )
+
+    tree = with_local_modules(tree)
+    payload = {
+        "backend_config": backend_config,
+        "providers": parse_required_providers(tree),
+        "implicit_providers": sorted(parse_implicit_providers(tree)),
+        "modules": parse_module_sources(tree),
+        "lock_file": lock_hash,
+        "modules_manifest": modules_hash,
+        "terraform_version": tf_version,
+    }
+    return hashlib.sha256(
+        json.dumps(payload, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+def read_init_fingerprint(workdir: Path) -> Optional[str]:
+    """
+    Reads the fingerprint recorded by the last successful init in `workdir`.
+
+    The fingerprint lives inside `.terraform/`, so removing that directory invalidates it.
+
+    Args:
+        workdir (Path): The working directory.
+
+    Returns:
+        str: The recorded fingerprint, or `None`.
+    """
+    fpath = workdir / ".terraform" / INIT_FINGERPRINT_FILE
+    return fpath.read_text().strip() if fpath.is_file() else None
+
+
+def write_init_fingerprint(workdir: Path, fingerprint: str) -> None:
+    """
+    Records the fingerprint of a successful init in `workdir`.
+
+    Args:
+        workdir (Path): The working directory.
+        fingerprint (str): The fingerprint, see `init_fingerprint`.
+    """
+    fpath = workdir / ".terraform" / INIT_FINGERPRINT_FILE
+    fpath.parent.mkdir(parents=True, exist_ok=True)
+    fpath.write_text(fingerprint)
+    logger.debug(f"Recorded init fingerprint: [{fpath}]")
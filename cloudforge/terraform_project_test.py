@@ -0,0 +1,236 @@
+import pytest
+from pathlib import Path
+from .terraform_project import (
+    LOCK_FILE,
+    MODULES_MANIFEST,
+    init_fingerprint,
+    parse_implicit_providers,
+    parse_lock_file,
+    parse_module_sources,
+    parse_required_providers,
+    project_dependencies,
+    provider_addresses,
+    read_init_fingerprint,
+    write_init_fingerprint,
+)
+
+MAIN_TF = """
+terraform {
+  backend "azurerm" {}
+
+  required_providers {
+    azurerm = {
+      source  = "hashicorp/azurerm"
+      version = "~> 3.0"
+    }
+    # random = { source = "hashicorp/random" }
+    random = {
+      source = "hashicorp/random"
+    }
+  }
+}
+
+module "network" {
+  source  = "Azure/network/azurerm"
+  version = "5.2.0"
+
+  tags = {
+    source = "not-a-module-source"
+  }
+}
+
+module "storage" {
+  source = "./modules/storage"
+  name   = "{brace in a string}"
+}
+"""
+
+LEGACY_TF = """
+terraform {
+  required_providers {
+    azurerm = "~> 2.0"
+  }
+}
+"""
+
+BACKEND_CONFIG = {"storage_account_name": "sa", "key": "dev.tfstate"}
+
+
+@pytest.fixture
+def tree(tmpdir):
+    return {str(Path(tmpdir) / "main.tf"): MAIN_TF}
+
+
+def test_parse_required_providers(tree):
+    assert parse_required_providers(tree) == {
+        "azurerm": {"source": "hashicorp/azurerm", "version": "~> 3.0"},
+        "random": {"source": "hashicorp/random"},
+    }
+
+
+def test_parse_required_providers_legacy_shorthand():
+    assert parse_required_providers({"versions.tf": LEGACY_TF}) == {
+        "azurerm": {"version": "~> 2.0"}
+    }
+
+
+def test_provider_addresses(tree):
+    tree["legacy.tf"] = LEGACY_TF.replace("azurerm", "null")
+    tree["custom.tf"] = (
+        'terraform { required_providers { x = { source = "Example.com/Acme/X" } } }'
+    )
+    assert provider_addresses(tree) == {
+        "registry.terraform.io/hashicorp/azurerm",
+        "registry.terraform.io/hashicorp/random",
+        "registry.terraform.io/hashicorp/null",
+        "example.com/acme/x",
+    }
+
+
+def test_parse_lock_file(tmpdir):
+    workdir = Path(tmpdir)
+    assert parse_lock_file(workdir) == {}
+    (workdir / LOCK_FILE).write_text("""
+provider "registry.terraform.io/hashicorp/azurerm" {
+  version     = "3.4.0"
+  constraints = "~> 3.0"
+  hashes = [
+    "h1:abc=",
+  ]
+}
+""")
+    assert parse_lock_file(workdir) == {
+        "registry.terraform.io/hashicorp/azurerm": "3.4.0"
+    }
+
+
+def test_parse_implicit_providers():
+    tree = {
+        "main.tf": MAIN_TF
+        + 'provider "azurerm" {\n  features {}\n}\n'
+        + 'provider "google" {}\n'
+        + 'resource "azurerm_resource_group" "rg" {}\n'
+        + 'resource "null_resource" "x" {}\n'
+        + '  data "http" "ip" {\n  url = "https://example.com"\n}\n'
+    }
+    assert parse_implicit_providers(tree) == {"google", "null", "http"}
+    assert provider_addresses(tree) >= {
+        "registry.terraform.io/hashicorp/google",
+        "registry.terraform.io/hashicorp/null",
+        "registry.terraform.io/hashicorp/http",
+    }
+
+
+def test_parse_module_sources(tree):
+    (fpath,) = tree
+    assert parse_module_sources(tree) == {
+        f"{fpath}:network": {"source": "Azure/network/azurerm", "version": "5.2.0"},
+        f"{fpath}:storage": {"source": "./modules/storage"},
+    }
+
+
+def test_init_fingerprint_is_stable(tree, tmpdir):
+    workdir = Path(tmpdir)
+    first = init_fingerprint(BACKEND_CONFIG, tree, workdir, "1.0.11")
+
+    # resource changes do not require a new init
+    (fpath,) = tree
+    edited = {fpath: MAIN_TF + '\nresource "azurerm_resource_group" "x" {}\n'}
+    assert init_fingerprint(BACKEND_CONFIG, edited, workdir, "1.0.11") == first
+
+
+@pytest.mark.parametrize(
+    "change",
+    [
+        "backend",
+        "provider",
+        "implicit_provider",
+        "module",
+        "modules_manifest",
+        "lock_file",
+        "terraform_version",
+    ],
+)
+def test_init_fingerprint_changes(tree, tmpdir, change):
+    workdir = Path(tmpdir)
+    (fpath,) = tree
+    backend_config, tf_version = dict(BACKEND_CONFIG), "1.0.11"
+    before = init_fingerprint(backend_config, tree, workdir, tf_version)
+
+    if change == "backend":
+        backend_config["key"] = "stg.tfstate"
+    elif change == "provider":
+        tree = {fpath: MAIN_TF.replace("~> 3.0", "~> 3.1")}
+    elif change == "implicit_provider":
+        tree = {fpath: MAIN_TF + '\nresource "null_resource" "x" {}\n'}
+    elif change == "module":
+        tree = {fpath: MAIN_TF.replace('"5.2.0"', '"5.3.0"')}
+    elif change == "modules_manifest":
+        (workdir / MODULES_MANIFEST).parent.mkdir(parents=True)
+        (workdir / MODULES_MANIFEST).write_text('{"Modules": []}')
+    elif change == "lock_file":
+        (workdir / LOCK_FILE).write_text('provider "registry.terraform.io/x" {}')
+    elif change == "terraform_version":
+        tf_version = "1.3.0"
+
+    assert init_fingerprint(backend_config, tree, workdir, tf_version) != before
+
+
+def test_init_fingerprint_roundtrip(tmpdir):
+    workdir = Path(tmpdir)
+    assert read_init_fingerprint(workdir) is None
+
+    write_init_fingerprint(workdir, "abc123")
+    assert read_init_fingerprint(workdir) == "abc123"
+    assert (workdir / ".terraform").is_dir()
+
+
+def test_project_dependencies_follow_local_modules(tmpdir):
+    root = Path(tmpdir)
+    proj_dir = root / "envs" / "app"
+    for dpath, content in [
+        (proj_dir, 'module "net" {\n  source = "../../modules/net"\n}\n'),
+        (
+            root / "modules" / "net",
+            'module "subnet" {\n  source = "./subnet"\n}\n'
+            'module "cycle" {\n  source = "../net"\n}\n'
+            'module "vpc" {\n  source = "terraform-aws-modules/vpc/aws"\n}\n',
+        ),
+        (root / "modules" / "net" / "subnet", ""),
+        (root / "modules" / "unused", ""),
+    ]:
+        dpath.mkdir(parents=True)
+        (dpath / "main.tf").write_text(content)
+    tree = {str(proj_dir / "main.tf"): (proj_dir / "main.tf").read_text()}
+
+    assert project_dependencies(proj_dir, tree) == {
+        proj_dir.resolve(),
+        (root / "modules" / "net").resolve(),
+        (root / "modules" / "net" / "subnet").resolve(),
+    }
+
+
+def test_init_fingerprint_follows_local_modules(tmpdir):
+    root = Path(tmpdir)
+    proj_dir, net_dir = root / "envs" / "app", root / "modules" / "net"
+    proj_dir.mkdir(parents=True)
+    net_dir.mkdir(parents=True)
+    (proj_dir / "main.tf").write_text(
+        'module "net" {\n  source = "../../modules/net"\n}\n'
+    )
+    net_tf = (
+        'module "vnet" {\n  source  = "Azure/vnet/azurerm"\n  version = "4.0.0"\n}\n'
+    )
+    (net_dir / "main.tf").write_text(net_tf)
+    tree = {str(proj_dir / "main.tf"): (proj_dir / "main.tf").read_text()}
+    workdir = root / "work"
+    before = init_fingerprint(BACKEND_CONFIG, tree, workdir, "1.0.11")
+
+    # a nested module source changes
+    (net_dir / "main.tf").write_text(net_tf.replace("4.0.0", "4.1.0"))
+    nested = init_fingerprint(BACKEND_CONFIG, tree, workdir, "1.0.11")
+    assert nested != before
+
+    # an undeclared provider is used by a local module
+    (net_dir / "extra.tf").write_text('resource "random_id" "x" {}\n')
+    assert init_fingerprint(BACKEND_CONFIG, tree, workdir, "1.0.11") != nested
@@ -0,0 +1,442 @@
+"""
+The terraform_stream module runs Terraform on asyncio and streams its output line by line.
+
+Output is handed to line callbacks as soon as it is produced instead of being buffered until the
+process exits. A callback takes the stream name ("stdout" or "stderr") and the line without its
+trailing newline. The module ships three: LoggerSink, FileSink and ProgressSink.
+
+The process runs in its own process group, so cancelling the awaiting task terminates Terraform
+together with the provider plugins it spawned.
+
+With `capture_output="spool"` the full output is written to files on disk and only the last
+`tail_bytes` of each stream are kept in memory, so memory stays bounded however verbose Terraform
+is. The paths of the files are exposed on the returned CommandResult.
+
+A line longer than `MAX_LINE_BYTES` is handed to the callbacks in pieces of at most that size; the
+captured output keeps it whole.
+
+Example Usage:
+with FileSink(Path("apply.log")) as log_file, ProgressSink() as progress:
+    ret_code, out, err = await run_streaming(cmds, on_line=[LoggerSink(), log_file, progress])
+
+result = await run_streaming(cmds, capture_output="spool")
+print(result.err, result.err_path)
+"""
+
+from pathlib import Path
+from typing import Callable, Deque, Optional, Sequence, TextIO, Tuple, Union
+
+import asyncio
+import collections
+import io
+import json
+import logging
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import time
+
+from . import TMP_DIR, logger
+
+LineCallback = Callable[[str, str], None]
+
+DEFAULT_KILL_TIMEOUT = 10.0
+DEFAULT_TAIL_BYTES = 64 * 1024
+SPOOL_DIR = TMP_DIR / ".terraform-py-logs"
+_READ_SIZE = 64 * 1024
+MAX_LINE_BYTES = 16 * 1024 * 1024
+
+
+class CommandResult(tuple):
+    """
+    The `(ret_code, out, err)` of a command, with the paths of its spooled output.
+
+    It unpacks and compares like the plain tuple returned before spooling existed.
+
+    Attributes:
+        ret_code (int): The return code.
+        out (str): The captured stdout, only its tail when spooled.
+        err (str): The captured stderr, only its tail when spooled.
+        out_path (Path): The file holding the full stdout, or `None` when not spooled.
+        err_path (Path): The file holding the full stderr, or `None` when not spooled.
+    """
+
+    def __new__(
+        cls,
+        ret_code: Optional[int],
+        out: Optional[str],
+        err: Optional[str],
+        out_path: Optional[Path] = None,
+        err_path: Optional[Path] = None,
+    ) -> "CommandResult":
+        result = super().__new__(cls, (ret_code, out, err))
+        result.out_path = out_path
+        result.err_path = err_path
+        return result
+
+    @property
+    def ret_code(self) -> Optional[int]:
+        return self[0]
+
+    @property
+    def out(self) -> Optional[str]:
+        return self[1]
+
+    @property
+    def err(self) -> Optional[str]:
+        return self[2]
+
+    def remove_spool(self) -> None:
+        """Removes the spooled output files, if any."""
+        for fpath in (self.out_path, self.err_path):
+            if fpath is not None:
+                Path(fpath).unlink(missing_ok=True)
+
+
+class TailBuffer:
+    """
+    Keeps the last `max_chars` characters written to it.
+
+    Args:
+        max_chars (int): The number of characters kept.
+    """
+
+    def __init__(self, max_chars: int = DEFAULT_TAIL_BYTES) -> None:
+        self.max_chars = max_chars
+        self._chunks: Deque[str] = collections.deque()
+        self._size = 0
+
+    def write(self, text: str) -> None:
+        if len(text) >= self.max_chars:
+            self._chunks.clear()
+            text = text[-self.max_chars :]
+            self._size = 0
+        self._chunks.append(text)
+        self._size += len(text)
+        while self._size > self.max_chars:
+            self._size -= len(self._chunks.popleft())
+
+    def getvalue(self) -> str:
+        return "".join(self._chunks)
+
+
+class SpoolCapture:
+    """
+    Writes captured output to a file, keeping only its tail in memory.
+
+    Args:
+        path (Path): The file the output is written to.
+        tail_bytes (int): The size of the tail kept in memory.
+    """
+
+    def __init__(self, path: Path, tail_bytes: int = DEFAULT_TAIL_BYTES) -> None:
+        self.path = Path(path)
+        self._fobj: TextIO = open(self.path, "w", encoding="utf-8")
+        self._tail = TailBuffer(tail_bytes)
+
+    def write(self, text: str) -> None:
+        self._fobj.write(text)
+        self._tail.write(text)
+
+    def getvalue(self) -> str:
+        return self._tail.getvalue()
+
+    def close(self) -> None:
+        self._fobj.close()
+
+
+def spool_paths(
+    spool_dir: Optional[Path] = None, name: str = "terraform"
+) -> Tuple[Path, Path]:
+    """
+    Creates a pair of empty files to spool stdout and stderr of a command to.
+
+    Args:
+        spool_dir (Path, optional): The directory of the files. Defaults to `SPOOL_DIR`.
+        name (str): A prefix identifying the command in the file names.
+
+    Returns:
+        Tuple[Path, Path]: The stdout and stderr file paths.
+    """
+    spool_dir = Path(spool_dir) if spool_dir else SPOOL_DIR
+    spool_dir.mkdir(parents=True, exist_ok=True)
+    fd, out_path = tempfile.mkstemp(
+        prefix=f"{name}-", suffix=".stdout.log", dir=spool_dir
+    )
+    os.close(fd)
+    err_path = Path(out_path[: -len(".stdout.log")] + ".stderr.log")
+    err_path.touch()
+    return Path(out_path), err_path
+
+
+def read_tail(path: Path, tail_bytes: int = DEFAULT_TAIL_BYTES) -> str:
+    """
+    Reads the last `tail_bytes` of a file without loading the rest of it.
+
+    Args:
+        path (Path): The file to read.
+        tail_bytes (int): The number of bytes read from the end of the file.
+
+    Returns:
+        str: The tail, starting at a line boundary when the file was cut.
+    """
+    with open(path, "rb") as f:
+        size = f.seek(0, io.SEEK_END)
+        f.seek(max(0, size - tail_bytes))
+        data = f.read()
+    if size > tail_bytes and b"\n" in data:
+        data = data[data.index(b"\n") + 1 :]
+    return data.decode("utf-8", errors="replace")
+
+
+class LoggerSink:
+    """
+    Logs every line, stderr at warning level.
+
+    Args:
+        level (int): The level stdout lines are logged at.
+        prefix (str): Prepended to every line, e.g. to tell concurrent runs apart.
+        json_messages (bool): Whether lines are JSON events, as printed with `-json`, of which
+            only the human readable "@message" is logged.
+    """
+
+    def __init__(
+        self, level: int = logging.INFO, prefix: str = "", json_messages: bool = False
+    ) -> None:
+        self.level = level
+        self.prefix = prefix
+        self.json_messages = json_messages
+
+    def __call__(self, stream: str, line: str) -> None:
+        level = logging.WARNING if stream == "stderr" else self.level
+        if self.json_messages and line.startswith("{"):
+            try:
+                line = json.loads(line).get("@message", line)
+            except ValueError:
+                pass
+        logger.logger.log(level, "%s%s", self.prefix, line)
+
+
+class FileSink:
+    """
+    Appends every line to a file as it arrives, stderr lines included.
+
+    Args:
+        path (Path): The path of the file. Parent directories are created if needed.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._fobj: TextIO = open(self.path, "a", encoding="utf-8")
+
+    def __call__(self, stream: str, line: str) -> None:
+        self._fobj.write(line + "\n")
+        self._fobj.flush()
+
+    def close(self) -> None:
+        self._fobj.close()
+
+    def __enter__(self) -> "FileSink":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+
+class ProgressSink:
+    """
+    Renders a single status line with the elapsed time, the line count and the latest line.
+
+    Args:
+        stream (TextIO): Where the status line is rendered. Defaults to stderr.
+    """
+
+    def __init__(self, stream: Optional[TextIO] = None) -> None:
+        self.stream = stream or sys.stderr
+        self.lines = 0
+        self._started = time.monotonic()
+
+    def __call__(self, stream: str, line: str) -> None:
+        self.lines += 1
+        line = line.strip()
+        if not line:
+            return
+        elapsed = int(time.monotonic() - self._started)
+        status = f"[{elapsed // 60:02d}:{elapsed % 60:02d}] {self.lines:>6} | "
+        width = shutil.get_terminal_size().columns - 1
+        self.stream.write("\r\x1b[K" + (status + line)[:width])
+        self.stream.flush()
+
+    def close(self) -> None:
+        self.stream.write("\n")
+        self.stream.flush()
+
+    def __enter__(self) -> "ProgressSink":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+
+async def _pump(
+    reader: asyncio.StreamReader,
+    stream: str,
+    on_line: Sequence[LineCallback],
+    captured: Optional[Union[io.StringIO, SpoolCapture]],
+) -> None:
+    """Reads `reader` until EOF, handing every line to the callbacks.
+
+    Only the new chunk is searched for newlines, so a long line costs linear rather than quadratic
+    time, and the unterminated rest is bounded by `MAX_LINE_BYTES`.
+    """
+    pending = bytearray()
+    while True:
+        chunk = await reader.read(_READ_SIZE)
+        if not chunk:
+            break
+        *lines, rest = chunk.split(b"\n")
+        if lines:
+            pending += lines[0]
+            lines[0] = bytes(pending)
+            pending = bytearray()
+        for raw in lines:
+            while len(raw) > MAX_LINE_BYTES:
+                cut = _utf8_boundary(raw, MAX_LINE_BYTES)
+                _emit(raw[:cut], stream, on_line, captured, terminated=False)
+                raw = raw[cut:]
+            _emit(raw, stream, on_line, captured, terminated=True)
+        pending += rest
+        while len(pending) > MAX_LINE_BYTES:
+            cut = _utf8_boundary(pending, MAX_LINE_BYTES)
+            _emit(bytes(pending[:cut]), stream, on_line, captured, terminated=False)
+            del pending[:cut]
+    if pending:
+        _emit(bytes(pending), stream, on_line, captured, terminated=False)
+
+
+def _utf8_boundary(data: Union[bytes, bytearray], limit: int) -> int:
+    """Moves a cut at `limit` back to the start of a character, so none is split in two."""
+    cut = limit
+    while cut > limit - 3 and data[cut] & 0xC0 == 0x80:
+        cut -= 1
+    return cut
+
+
+def _emit(
+    raw: bytes,
+    stream: str,
+    on_line: Sequence[LineCallback],
+    captured: Optional[Union[io.StringIO, SpoolCapture]],
+    terminated: bool,
+) -> None:
+    text = raw.decode("utf-8", errors="replace")
+    if captured is not None:
+        captured.write(text + "\n" if terminated else text)
+    line = text.rstrip("\r")
+    for callback in on_line:
+        callback(stream, line)
+
+
+def _signal_group(proc: asyncio.subprocess.Process, sig: int) -> None:
+    try:
+        if os.name == "posix":
+            os.killpg(proc.pid, sig)
+        elif sig == signal.SIGTERM:
+            proc.terminate()
+        else:
+            proc.kill()
+    except ProcessLookupError:
+        pass
+
+
+async def _terminate(proc: asyncio.subprocess.Process, kill_timeout: float) -> None:
+    """Terminates the process group, killing it if it does not exit within `kill_timeout` seconds."""
+    if proc.returncode is not None:
+        return
+    logger.warning(f"Terminating terraform process group: {proc.pid}")
+    _signal_group(proc, signal.SIGTERM)
+    try:
+        await asyncio.wait_for(proc.wait(), kill_timeout)
+    except asyncio.TimeoutError:
+        logger.warning(f"Killing terraform process group: {proc.pid}")
+        _signal_group(proc, getattr(signal, "SIGKILL", signal.SIGTERM))
+        await proc.wait()
+
+
+async def run_streaming(
+    cmds: Sequence[str],
+    cwd: Optional[str] = None,
+    env: Optional[dict] = None,
+    on_line: Sequence[LineCallback] = (),
+    capture_output: Union[bool, str] = True,
+    kill_timeout: float = DEFAULT_KILL_TIMEOUT,
+    spool_dir: Optional[Path] = None,
+    spool_name: Optional[str] = None,
+    tail_bytes: int = DEFAULT_TAIL_BYTES,
+) -> CommandResult:
+    """
+    Runs a command, streaming its output to `on_line` callbacks as it is produced.
+
+    If the awaiting task is cancelled, or a callback raises, the process group is sent SIGTERM
+    and, after `kill_timeout` seconds, SIGKILL before the error propagates.
+
+    Args:
+        cmds (Sequence[str]): The command and its arguments.
+        cwd (str, optional): The working directory of the command.
+        env (dict, optional): The environment of the command. Defaults to the current environment.
+        on_line (Sequence[LineCallback]): Called with the stream name and each line of output.
+        capture_output (Union[bool, str]): True returns the output, False returns `None` instead and
+            "spool" writes it to files, returning only the last `tail_bytes` of each stream.
+        kill_timeout (float): Seconds to wait after SIGTERM before killing the process group.
+        spool_dir (Path, optional): Where output is spooled to. Defaults to `SPOOL_DIR`.
+        spool_name (str, optional): A prefix for the spool file names. Defaults to the executable name.
+        tail_bytes (int): The size of the tail kept in memory when spooling.
+
+    Returns:
+        CommandResult: The return code, stdout and stderr.
+    """
+    if capture_output == "spool":
+        out_path, err_path = spool_paths(spool_dir, spool_name or Path(cmds[0]).name)
+        out = SpoolCapture(out_path, tail_bytes)
+        err = SpoolCapture(err_path, tail_bytes)
+    elif capture_output:
+        out_path = err_path = None
+        out, err = io.StringIO(), io.StringIO()
+    else:
+        out_path = err_path = None
+        out = err = None
+
+    proc = await asyncio.create_subprocess_exec(
+        *cmds,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        cwd=cwd,
+        env=env,
+        start_new_session=os.name == "posix",
+    )
+
+    readers = [
+        asyncio.ensure_future(_pump(proc.stdout, "stdout", on_line, out)),
+        asyncio.ensure_future(_pump(proc.stderr, "stderr", on_line, err)),
+    ]
+    try:
+        await asyncio.gather(*readers)
+        ret_code = await proc.wait()
+    except BaseException:
+        for reader in readers:
+            reader.cancel()
+        await _terminate(proc, kill_timeout)
+        raise
+    finally:
+        if isinstance(out, SpoolCapture):
+            out.close()
+            err.close()
+
+    if out is None:
+        return CommandResult(ret_code, None, None)
+    return CommandResult(
+        ret_code, out.getvalue(), err.getvalue(), out_path=out_path, err_path=err_path
+    )
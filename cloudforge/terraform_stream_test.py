@@ -0,0 +1,248 @@
+import asyncio
+import io
+import os
+import pytest
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from . import terraform_stream
+from .terraform_exec import Terraform, TerraformCommandError
+from .terraform_stream import (
+    FileSink,
+    ProgressSink,
+    TailBuffer,
+    read_tail,
+    run_streaming,
+)
+
+STUB_TERRAFORM = """#!/bin/sh
+# stand-in for terraform: `apply` streams progress, `hang` waits forever
+case "$1" in
+  apply)
+    for i in 1 2 3; do
+      echo "module.app: Still creating... [${i}0s elapsed]"
+      sleep 0.1
+    done
+    echo "provider warning" >&2
+    echo "Apply complete! Resources: 3 added, 0 changed, 0 destroyed."
+    ;;
+  fail)
+    echo "Error: invalid configuration" >&2
+    exit 2
+    ;;
+  flood)
+    # ~20MB of plan-like output, then fail
+    yes "  # azurerm_resource.x will be updated in-place" | head -c 20000000
+    echo "Error: quota exceeded" >&2
+    exit 1
+    ;;
+  hang)
+    sleep 300 &
+    echo "$!" > "$2"
+    echo "started"
+    wait
+    ;;
+esac
+"""
+
+
+@pytest.fixture
+def stub_tf(tmpdir):
+    fpath = Path(tmpdir) / "terraform"
+    fpath.write_text(STUB_TERRAFORM)
+    fpath.chmod(0o755)
+    yield Terraform(
+        terraform_bin_path=str(fpath),
+        working_dir=str(tmpdir),
+        spool_dir=str(Path(tmpdir) / "spool"),
+        tail_bytes=1024,
+    )
+
+
+class Recorder:
+    def __init__(self):
+        self.lines = []
+
+    def __call__(self, stream, line):
+        self.lines.append((time.monotonic(), stream, line))
+
+
+def test_lines_are_streamed_while_running(stub_tf):
+    recorder = Recorder()
+    ret_code, out, err = asyncio.run(stub_tf.cmd_async("apply", on_line=[recorder]))
+
+    assert ret_code == 0
+    assert out.startswith("module.app: Still creating... [10s elapsed]\n")
+    assert out.endswith("Apply complete! Resources: 3 added, 0 changed, 0 destroyed.\n")
+    assert err == "provider warning\n"
+
+    stdout = [(t, line) for t, stream, line in recorder.lines if stream == "stdout"]
+    assert [line for _, line in stdout][-1].startswith("Apply complete!")
+    assert ("stderr", "provider warning") in [(s, l) for _, s, l in recorder.lines]
+    # the first line arrived well before the process exited
+    assert stdout[-1][0] - stdout[0][0] >= 0.2
+
+
+def test_sync_cmd_streams_through_callbacks(stub_tf, tmpdir):
+    log_path = Path(tmpdir) / "logs" / "apply.log"
+    progress = io.StringIO()
+    with FileSink(log_path) as log_file, ProgressSink(progress) as bar:
+        ret_code, out, _ = stub_tf.cmd("apply", on_line=[log_file, bar])
+
+    assert ret_code == 0
+    # stdout and stderr interleave in arrival order
+    assert sorted(log_path.read_text().splitlines()) == sorted(
+        out.splitlines() + ["provider warning"]
+    )
+    assert bar.lines == 5
+    assert "Apply complete!" in progress.getvalue()
+
+
+def test_same_return_shape_as_cmd(stub_tf):
+    assert asyncio.run(stub_tf.cmd_async("fail", raise_on_error=False)) == stub_tf.cmd(
+        "fail", raise_on_error=False
+    )
+    assert asyncio.run(stub_tf.cmd_async("apply", capture_output=False)) == (
+        0,
+        None,
+        None,
+    )
+
+    with pytest.raises(TerraformCommandError):
+        asyncio.run(stub_tf.cmd_async("fail"))
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    # an orphan nobody reaped yet is dead as well
+    stat = Path(f"/proc/{pid}/stat")
+    return not (stat.exists() and stat.read_text().split()[2] == "Z")
+
+
+def test_cancel_terminates_process_group(stub_tf, tmpdir):
+    pid_file = Path(tmpdir) / "child.pid"
+
+    async def run_and_cancel():
+        started = asyncio.Event()
+        task = asyncio.ensure_future(
+            stub_tf.cmd_async(
+                "hang",
+                str(pid_file),
+                on_line=[lambda stream, line: started.set()],
+                kill_timeout=2,
+            )
+        )
+        await asyncio.wait_for(started.wait(), 10)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run_and_cancel())
+
+    # the grandchild terraform spawned (think provider plugins) is gone too
+    child_pid = int(pid_file.read_text())
+    for _ in range(50):
+        if not _alive(child_pid):
+            break
+        time.sleep(0.05)
+    else:
+        pytest.fail(f"child process {child_pid} survived cancellation")
+
+
+def test_callback_error_terminates_process(tmpdir):
+    def explode(stream, line):
+        raise RuntimeError("sink failed")
+
+    started = time.monotonic()
+    with pytest.raises(RuntimeError):
+        asyncio.run(run_streaming(["sh", "-c", "echo hi; sleep 30"], on_line=[explode]))
+    assert time.monotonic() - started < 10
+
+
+def test_tail_buffer_keeps_last_chars():
+    tail = TailBuffer(10)
+    for chunk in ("abc\n", "defg\n", "hij\n"):
+        tail.write(chunk)
+    assert tail.getvalue() == "defg\nhij\n"
+
+    tail.write("x" * 25)
+    assert tail.getvalue() == "x" * 10
+
+
+def test_read_tail_starts_at_line_boundary(tmpdir):
+    fpath = Path(tmpdir) / "out.log"
+    fpath.write_text("".join(f"line {i}\n" for i in range(1000)))
+
+    tail = read_tail(fpath, 64)
+    assert tail.endswith("line 999\n")
+    assert tail.startswith("line ")
+    assert len(tail) <= 64
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_spool_bounds_memory(stub_tf, streaming):
+    on_line = [lambda stream, line: None] if streaming else []
+
+    tracemalloc.start()
+    try:
+        result = stub_tf.cmd(
+            "flood", capture_output="spool", raise_on_error=False, on_line=on_line
+        )
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    ret_code, out, err = result
+    assert ret_code == 1
+    assert err == "Error: quota exceeded\n"
+    assert len(out) <= 1024
+    assert out and result.out_path.read_text().endswith(out)
+
+    # the full output is on disk, only its tail was kept in memory
+    assert result.out_path.stat().st_size == 20000000
+    assert result.err_path.read_text() == err
+    assert peak < 4 * 1024 * 1024
+
+    result.remove_spool()
+    assert not result.out_path.exists()
+
+
+def test_long_lines_are_split_for_callbacks(monkeypatch):
+    monkeypatch.setattr(terraform_stream, "MAX_LINE_BYTES", 1000)
+    output = "a" + "\u00e9" * 5000 + "\nshort\n" + "b" * 2500
+    script = f"import sys; sys.stdout.buffer.write({output.encode()!r})"
+    lines = []
+
+    ret_code, out, _ = asyncio.run(
+        run_streaming(
+            [sys.executable, "-c", script],
+            on_line=[lambda stream, line: lines.append(line)],
+        )
+    )
+
+    assert ret_code == 0
+    assert out == output
+    assert "short" in lines
+    assert "".join(lines) == output.replace("\n", "")
+    assert max(len(line.encode()) for line in lines) <= 1000
+
+
+def test_long_line_is_read_in_linear_time():
+    async def pump():
+        reader = asyncio.StreamReader()
+        reader.feed_data(b"x" * (64 * 1024 * 1024) + b"\n")
+        reader.feed_eof()
+        lines = []
+        await terraform_stream._pump(
+            reader, "stdout", [lambda stream, line: lines.append(len(line))], None
+        )
+        return lines
+
+    started = time.monotonic()
+    lines = asyncio.run(pump())
+    assert time.monotonic() - started < 2
+    assert sum(lines) == 64 * 1024 * 1024
@@ -1,5 +1,23 @@
+import functools
+import hashlib
+import json
+import os
+import platform
 import pytest
-from .terraform_install import TerraformInstaller
+import semantic_version
+import subprocess
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+from .terraform_cache import TerraformBinaryCache
+from .terraform_install import (
+    ReleaseIndex,
+    TerraformChecksumError,
+    TerraformInstaller,
+    probe_terraform_version,
+)
 from pathlib import Path
 
 
@@ -19,3 +37,338 @@ def test_invalid_version():
     with pytest.raises(IndexError):
         with TerraformInstaller(version="0.12.999") as tf:
             pass
+
+
+class _ReleasesHandler(SimpleHTTPRequestHandler):
+    requests: List[str] = []
+    statuses: List[int] = []
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        byte_range = self.headers.get("Range")
+        if not byte_range:
+            return super().do_GET()
+
+        # minimal `Range: bytes=<start>-` support for resumable downloads
+        content = Path(self.translate_path(self.path)).read_bytes()
+        start = int(byte_range.split("=")[1].rstrip("-"))
+        if start >= len(content):
+            self.send_response(416)
+            self.end_headers()
+            return
+        self.send_response(206)
+        self.send_header("Content-Length", str(len(content) - start))
+        self.end_headers()
+        self.wfile.write(content[start:])
+
+    def send_response(self, code, message=None):
+        self.statuses.append(code)
+        super().send_response(code, message)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _publish_release(root: Path, base_url: str, version: str) -> None:
+    pyos = platform.system().lower()
+    arch = platform.machine().lower()
+    arch = "amd64" if arch == "x86_64" else arch
+
+    filename = f"terraform_{version}_{pyos}_{arch}.zip"
+    (root / version).mkdir(parents=True, exist_ok=True)
+    with zipfile.ZipFile(root / version / filename, "w") as zf:
+        zf.writestr("terraform", f"#!/bin/sh\necho 'Terraform v{version}'\n")
+        zf.writestr("LICENSE.txt", "not extracted")
+    digest = hashlib.sha256((root / version / filename).read_bytes()).hexdigest()
+    (root / version / f"terraform_{version}_SHA256SUMS").write_text(
+        f"{'0' * 64}  terraform_{version}_windows_386.zip\n{digest}  {filename}\n"
+    )
+
+    entry = {
+        "name": "terraform",
+        "version": version,
+        "shasums": f"terraform_{version}_SHA256SUMS",
+        "builds": [
+            {
+                "name": "terraform",
+                "version": version,
+                "os": pyos,
+                "arch": arch,
+                "filename": filename,
+                "url": f"{base_url}/{version}/{filename}",
+            }
+        ],
+    }
+    (root / version / "index.json").write_text(json.dumps(entry))
+
+    index_file = root / "index.json"
+    index = json.loads(index_file.read_text()) if index_file.is_file() else {}
+    index.setdefault("versions", {})[version] = entry
+    index_file.write_text(json.dumps(index))
+
+
+@pytest.fixture
+def releases(tmp_path):
+    root = tmp_path / "releases"
+    root.mkdir()
+    handler = functools.partial(_ReleasesHandler, directory=str(root))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    for version in ("1.0.11", "1.3.0"):
+        _publish_release(root, base_url, version)
+
+    _ReleasesHandler.requests = []
+    _ReleasesHandler.statuses = []
+    yield base_url, _ReleasesHandler.requests
+    server.shutdown()
+
+
+def test_cached_install_makes_no_network_calls(releases, tmp_path):
+    base_url, requests_seen = releases
+    cache = TerraformBinaryCache(tmp_path / "cache")
+
+    with TerraformInstaller(version="1.0.11", cache=cache, releases_url=base_url) as tf:
+        cold_bin = tf.bin_path
+    assert len(requests_seen) == 3
+    assert Path(cold_bin).is_file()
+    assert not (Path(cold_bin).parent / "LICENSE.txt").exists()
+
+    requests_seen.clear()
+    with TerraformInstaller(version="1.0.11", cache=cache, releases_url=base_url) as tf:
+        assert tf.bin_path == cold_bin
+    assert requests_seen == []
+    assert Path(cold_bin).is_file()
+
+
+def test_cached_install_latest_version(releases, tmp_path):
+    base_url, requests_seen = releases
+    cache = TerraformBinaryCache(tmp_path / "cache")
+    with TerraformInstaller(cache=cache, releases_url=base_url) as tf:
+        assert "1.3.0" in subprocess.check_output([tf.bin_path]).decode()
+
+
+def test_concurrent_installs_download_once(releases, tmp_path):
+    base_url, requests_seen = releases
+    cache_dir = tmp_path / "cache"
+
+    def install(_):
+        installer = TerraformInstaller(
+            version="1.0.11",
+            cache=TerraformBinaryCache(cache_dir),
+            releases_url=base_url,
+        )
+        installer.install()
+        return installer.bin_path
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        paths = set(pool.map(install, range(8)))
+
+    assert len(paths) == 1
+    assert sum(path.endswith(".zip") for path in requests_seen) == 1
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = TerraformBinaryCache(tmp_path / "cache", max_bytes=25)
+
+    def fake_binary(content: str) -> Path:
+        binary = tmp_path / "terraform"
+        binary.write_text(content)
+        return binary
+
+    old = cache.put("1.0.0_linux_amd64", fake_binary("a" * 10))
+    os.utime(old.parent, (0, 0))
+    cache.release()
+    cache.put("1.1.0_linux_amd64", fake_binary("b" * 10))
+    cache.release()
+    cache.put("1.2.0_linux_amd64", fake_binary("c" * 10))
+
+    assert cache.get("1.0.0_linux_amd64") is None
+    assert cache.get("1.1.0_linux_amd64") is not None
+    assert cache.get("1.2.0_linux_amd64") is not None
+
+
+def test_cache_does_not_evict_binaries_in_use(tmp_path):
+    cache_dir = tmp_path / "cache"
+    writer = TerraformBinaryCache(cache_dir, max_bytes=15)
+    reader = TerraformBinaryCache(cache_dir, max_bytes=15)
+
+    def fake_binary(content: str) -> Path:
+        binary = tmp_path / "terraform"
+        binary.write_text(content)
+        return binary
+
+    writer.put("1.0.0_linux_amd64", fake_binary("a" * 10))
+    os.utime(writer.get("1.0.0_linux_amd64").parent, (0, 0))
+    writer.release()
+
+    # the reader got the least recently used binary and is about to run it
+    in_use = reader.get("1.0.0_linux_amd64")
+    os.utime(in_use.parent, (0, 0))
+    writer.put("1.1.0_linux_amd64", fake_binary("b" * 10))
+    assert in_use.is_file()
+    writer.release()
+
+    reader.release()
+    writer.put("1.2.0_linux_amd64", fake_binary("c" * 10))
+    assert not in_use.exists()
+    assert writer.get("1.0.0_linux_amd64") is None
+
+
+def _fake_terraform(dirpath: Path, version: str) -> Path:
+    dirpath.mkdir(parents=True, exist_ok=True)
+    tfbin = dirpath / "terraform"
+    tfbin.write_text(
+        "#!/bin/sh\n"
+        f'echo \'{{"terraform_version": "{version}", "platform": "linux_amd64"}}\'\n'
+    )
+    tfbin.chmod(0o755)
+    return tfbin
+
+
+def test_probe_terraform_version(tmp_path):
+    tfbin = _fake_terraform(tmp_path / "bin", "1.0.11")
+    assert str(probe_terraform_version(tfbin)) == "1.0.11"
+    assert probe_terraform_version(tmp_path / "missing") is None
+
+
+def test_resolve_from_path_skips_download(releases, tmp_path, monkeypatch):
+    base_url, requests_seen = releases
+    tfbin = _fake_terraform(tmp_path / "bin", "1.0.11")
+    monkeypatch.setenv("PATH", str(tfbin.parent), prepend=os.pathsep)
+
+    with TerraformInstaller(
+        version="1.0.11",
+        cache=TerraformBinaryCache(tmp_path / "cache"),
+        releases_url=base_url,
+        search_path=True,
+    ) as tf:
+        assert tf.bin_path == str(tfbin)
+        assert tf.source == "path"
+    assert requests_seen == []
+    assert tfbin.is_file()
+
+
+def test_resolve_explicit_mismatch_falls_through(releases, tmp_path):
+    base_url, requests_seen = releases
+    tfbin = _fake_terraform(tmp_path / "bin", "0.12.31")
+
+    with TerraformInstaller(
+        version="1.0.11",
+        cache=TerraformBinaryCache(tmp_path / "cache"),
+        releases_url=base_url,
+        bin_path=str(tfbin),
+    ) as tf:
+        assert tf.source == "download"
+        assert tf.bin_path != str(tfbin)
+
+
+def test_resolve_version_range(releases, tmp_path):
+    base_url, requests_seen = releases
+    cache = TerraformBinaryCache(tmp_path / "cache")
+
+    with TerraformInstaller(
+        version=">=1.0.0,<2.0.0", cache=cache, releases_url=base_url
+    ) as tf:
+        assert tf.source == "download"
+        assert str(tf._version) == "1.3.0"
+
+    requests_seen.clear()
+    with TerraformInstaller(
+        version=">=1.0.0,<2.0.0", cache=cache, releases_url=base_url
+    ) as tf:
+        assert tf.source == "cache"
+        assert str(tf._version) == "1.3.0"
+    assert requests_seen == []
+
+
+def test_exact_version_uses_per_version_index(releases, tmp_path):
+    base_url, requests_seen = releases
+    cache = TerraformBinaryCache(tmp_path / "cache")
+    with TerraformInstaller(version="1.0.11", cache=cache, releases_url=base_url):
+        pass
+    assert "/index.json" not in requests_seen
+    assert "/1.0.11/index.json" in requests_seen
+
+    with pytest.raises(IndexError):
+        TerraformInstaller(
+            version="0.12.999", cache=cache, releases_url=base_url
+        ).install()
+
+
+def test_release_index_ttl_and_revalidation(releases, tmp_path):
+    base_url, requests_seen = releases
+
+    index = ReleaseIndex(base_url, cache_dir=tmp_path / "index")
+    assert max(index.versions()) == semantic_version.Version("1.3.0")
+    assert index.get(semantic_version.Version("1.0.11"))["builds"]
+    assert requests_seen == ["/index.json"]
+
+    # fresh cache: no request at all
+    requests_seen.clear()
+    ReleaseIndex(base_url, cache_dir=tmp_path / "index").versions()
+    assert requests_seen == []
+
+    # expired cache: conditional request answered with 304 Not Modified
+    stale = ReleaseIndex(base_url, cache_dir=tmp_path / "index", ttl=0)
+    assert len(stale.versions()) == 2
+    assert requests_seen == ["/index.json"]
+    assert _ReleasesHandler.statuses[-1] == 304
+
+
+def test_corrupt_download_is_never_cached(releases, tmp_path):
+    base_url, requests_seen = releases
+    sums = Path(tmp_path / "releases" / "1.0.11" / "terraform_1.0.11_SHA256SUMS")
+    lines = sums.read_text().splitlines()
+    lines[1] = "f" * 64 + lines[1][64:]
+    sums.write_text("\n".join(lines))
+
+    cache = TerraformBinaryCache(tmp_path / "cache")
+    installer = TerraformInstaller(version="1.0.11", cache=cache, releases_url=base_url)
+    with pytest.raises(TerraformChecksumError):
+        installer.install()
+
+    assert cache.get(cache.key("1.0.11", installer._pyos, installer._arch)) is None
+    assert list((cache.root / "downloads").glob("*.part")) == []
+
+
+def test_corrupt_download_without_checksums_is_not_resumed(releases, tmp_path):
+    base_url, requests_seen = releases
+    release_dir = tmp_path / "releases" / "1.0.11"
+    entry = json.loads((release_dir / "index.json").read_text())
+    del entry["shasums"]
+    (release_dir / "index.json").write_text(json.dumps(entry))
+    archive_file = release_dir / entry["builds"][0]["filename"]
+    archive = archive_file.read_bytes()
+    archive_file.write_bytes(b"not a zip file")
+
+    cache = TerraformBinaryCache(tmp_path / "cache")
+    installer = TerraformInstaller(version="1.0.11", cache=cache, releases_url=base_url)
+    with pytest.raises(zipfile.BadZipFile):
+        installer.install()
+    assert list((cache.root / "downloads").glob("*.part")) == []
+
+    # the next attempt downloads the archive again rather than resuming the corrupt one
+    archive_file.write_bytes(archive)
+    installer.install()
+    assert "Terraform v1.0.11" in subprocess.check_output([installer.bin_path]).decode()
+    assert 206 not in _ReleasesHandler.statuses
+
+
+def test_partial_download_is_resumed(releases, tmp_path):
+    base_url, requests_seen = releases
+    cache = TerraformBinaryCache(tmp_path / "cache")
+    installer = TerraformInstaller(version="1.0.11", cache=cache, releases_url=base_url)
+    filename = installer._get_binary_metadata(installer._version)["filename"]
+
+    archive = (tmp_path / "releases" / "1.0.11" / filename).read_bytes()
+    part_file = cache.root / "downloads" / f".{filename}.part"
+    part_file.parent.mkdir(parents=True)
+    part_file.write_bytes(archive[:100])
+
+    installer.install()
+    assert "Terraform v1.0.11" in subprocess.check_output([installer.bin_path]).decode()
+    assert _ReleasesHandler.statuses[-1] == 206
+    assert not part_file.exists()
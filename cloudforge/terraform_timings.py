@@ -0,0 +1,333 @@
+"""
+The terraform_timings module reports where the time of a Terraform plan or apply goes, resource by resource.
+
+With `-json`, `terraform plan` and `terraform apply` print one JSON event per line, such as
+`refresh_start`, `apply_start` and `apply_complete`, each with a timestamp and the address of the
+resource it is about. A TimingsCollector consumes these events while the command runs, as an
+`on_line` callback of `Terraform.cmd`, or afterwards from a recorded file. A TimingsReport then
+derives from them:
+
+- the duration of every resource operation,
+- the critical path: working back from the last operation to finish, the operation each one most
+  likely waited for, i.e. the one that finished last before it started,
+- the concurrency timeline, the number of operations in flight over time, and how much of the
+  `-parallelism` it used.
+
+Example Usage:
+collector = TimingsCollector()
+tf.apply(json=IsFlagged, on_line=[collector])
+report = collector.report()
+print(report.format_top(10))
+report.write(Path("timings.json"))
+
+report = TimingsCollector.from_file(Path("apply.jsonl")).report()
+"""
+
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import bisect
+import json
+import re
+
+# terraform's default -parallelism
+DEFAULT_PARALLELISM = 10
+
+# event type -> (phase, edge)
+_EVENTS = {
+    "refresh_start": ("refresh", "start"),
+    "refresh_complete": ("refresh", "complete"),
+    "apply_start": ("apply", "start"),
+    "apply_complete": ("apply", "complete"),
+    "apply_errored": ("apply", "errored"),
+    "provision_start": ("provision", "start"),
+    "provision_complete": ("provision", "complete"),
+    "provision_errored": ("provision", "errored"),
+}
+
+_FRACTION_RE = re.compile(r"\.(\d{6})\d+")
+
+
+def _parse_timestamp(value: str) -> float:
+    """Parses an event timestamp, e.g. "2023-05-09T10:11:12.123456Z", into seconds since the epoch."""
+    # fromisoformat takes neither "Z" nor more than microseconds before python 3.11
+    value = _FRACTION_RE.sub(r".\1", value.replace("Z", "+00:00"))
+    return datetime.fromisoformat(value).timestamp()
+
+
+class ResourceTiming:
+    """
+    The timing of one operation, refresh, apply or provision, on one resource instance.
+
+    Args:
+        address (str): The address of the resource instance.
+        phase (str): "refresh", "apply" or "provision".
+        action (str, optional): The planned action of an apply, e.g. "create" or "update".
+        start (float): When the operation started, in seconds since the epoch.
+
+    Attributes:
+        end (float): When the operation completed or errored, `None` while it is running.
+        status (str): "running", "complete" or "errored".
+    """
+
+    def __init__(
+        self, address: str, phase: str, action: Optional[str], start: float
+    ) -> None:
+        self.address = address
+        self.phase = phase
+        self.action = action
+        self.start = start
+        self.end: Optional[float] = None
+        self.status = "running"
+
+    @property
+    def duration(self) -> float:
+        """The seconds the operation took, 0 while it is running."""
+        return self.end - self.start if self.end is not None else 0.0
+
+    def __repr__(self) -> str:
+        return f"ResourceTiming({self.address!r}, {self.phase!r}, {self.duration:.1f}s)"
+
+
+class TimingsCollector:
+    """
+    Collects resource timings from the JSON event stream of `terraform plan -json` or `terraform apply -json`.
+
+    An instance is a line callback, see `Terraform.cmd`; lines that are not JSON events are ignored.
+
+    Attributes:
+        timings (Dict[Tuple[str, str], ResourceTiming]): The timings keyed by address and phase, in start order.
+    """
+
+    def __init__(self) -> None:
+        self.timings: Dict[Tuple[str, str], ResourceTiming] = {}
+
+    def __call__(self, stream: str, line: str) -> None:
+        if stream != "stdout" or not line.startswith("{"):
+            return
+        try:
+            event = json.loads(line)
+        except ValueError:
+            return
+        self.feed(event)
+
+    def feed(self, event: Dict[str, Any]) -> None:
+        """
+        Records a decoded event.
+
+        Args:
+            event (Dict[str, Any]): The event.
+        """
+        phase, edge = _EVENTS.get(event.get("type"), (None, None))
+        hook = event.get("hook") or {}
+        address = (hook.get("resource") or {}).get("addr")
+        if phase is None or address is None or "@timestamp" not in event:
+            return
+
+        at = _parse_timestamp(event["@timestamp"])
+        key = (address, phase)
+        if edge == "start":
+            self.timings[key] = ResourceTiming(address, phase, hook.get("action"), at)
+        elif key in self.timings:
+            self.timings[key].end = at
+            self.timings[key].status = edge
+
+    @classmethod
+    def from_lines(cls, lines: Iterable[str]) -> "TimingsCollector":
+        """
+        Collects the timings of recorded events.
+
+        Args:
+            lines (Iterable[str]): The output of a `-json` run, one event per line.
+
+        Returns:
+            TimingsCollector: The collector.
+        """
+        collector = cls()
+        for line in lines:
+            collector("stdout", line.strip())
+        return collector
+
+    @classmethod
+    def from_file(cls, fpath: Path) -> "TimingsCollector":
+        """
+        Collects the timings of events recorded to a file, e.g. `terraform apply -json > apply.jsonl`.
+
+        Args:
+            fpath (Path): The file.
+
+        Returns:
+            TimingsCollector: The collector.
+        """
+        with open(fpath, "r", encoding="utf-8") as f:
+            return cls.from_lines(f)
+
+    def report(self, parallelism: int = DEFAULT_PARALLELISM) -> "TimingsReport":
+        """
+        Builds the report of the operations that finished.
+
+        Args:
+            parallelism (int): The `-parallelism` Terraform ran with.
+
+        Returns:
+            TimingsReport: The report.
+        """
+        return TimingsReport(
+            [t for t in self.timings.values() if t.end is not None], parallelism
+        )
+
+
+class TimingsReport:
+    """
+    Per-resource durations, critical path and concurrency of a Terraform run.
+
+    Args:
+        timings (List[ResourceTiming]): The finished operations.
+        parallelism (int): The `-parallelism` Terraform ran with.
+
+    Attributes:
+        started (float): When the first operation started, in seconds since the epoch.
+        wall_time (float): Seconds from the first operation starting to the last one finishing.
+        critical_path (List[ResourceTiming]): The chain of operations that bounded the wall time.
+        timeline (List[Tuple[float, int]]): Seconds since `started` at which the number of
+            operations in flight changed, with the new number.
+    """
+
+    def __init__(
+        self, timings: List[ResourceTiming], parallelism: int = DEFAULT_PARALLELISM
+    ) -> None:
+        self.timings = sorted(timings, key=lambda t: t.start)
+        self.parallelism = parallelism
+        self.started = self.timings[0].start if self.timings else 0.0
+        finished = max((t.end for t in self.timings), default=self.started)
+        self.wall_time = finished - self.started
+        self.critical_path = self._critical_path()
+        self.timeline = self._timeline()
+
+    def _critical_path(self) -> List[ResourceTiming]:
+        by_end = sorted(self.timings, key=lambda t: t.end)
+        ends = [t.end for t in by_end]
+        path: List[ResourceTiming] = []
+        i = len(by_end)
+        while i:
+            current = by_end[i - 1]
+            path.append(current)
+            # the operation that finished last before this one started is what it waited for
+            i = bisect.bisect_right(ends, current.start, 0, i - 1)
+        return path[::-1]
+
+    def _timeline(self) -> List[Tuple[float, int]]:
+        # at equal times, finishing operations are counted before starting ones
+        edges = sorted(
+            [(t.start, 1) for t in self.timings] + [(t.end, -1) for t in self.timings]
+        )
+        timeline: List[Tuple[float, int]] = []
+        in_flight = 0
+        for at, delta in edges:
+            in_flight += delta
+            offset = round(at - self.started, 3)
+            if timeline and timeline[-1][0] == offset:
+                timeline[-1] = (offset, in_flight)
+            else:
+                timeline.append((offset, in_flight))
+        return timeline
+
+    @property
+    def critical_path_time(self) -> float:
+        """The seconds spent in operations on the critical path, the rest of the wall time went to waiting."""
+        return sum(t.duration for t in self.critical_path)
+
+    @property
+    def peak_concurrency(self) -> int:
+        """The largest number of operations in flight at once."""
+        return max((n for _, n in self.timeline), default=0)
+
+    @property
+    def utilization(self) -> float:
+        """The share of the `-parallelism` slots that were busy over the wall time."""
+        if not self.wall_time:
+            return 0.0
+        busy = sum(t.duration for t in self.timings)
+        return busy / (self.wall_time * self.parallelism)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Returns the report as a JSON serializable dictionary, durations in seconds."""
+        on_path = {id(t) for t in self.critical_path}
+        return {
+            "wall_time": round(self.wall_time, 3),
+            "critical_path_time": round(self.critical_path_time, 3),
+            "critical_path": [t.address for t in self.critical_path],
+            "parallelism": self.parallelism,
+            "peak_concurrency": self.peak_concurrency,
+            "utilization": round(self.utilization, 3),
+            "resources": [
+                {
+                    "address": t.address,
+                    "phase": t.phase,
+                    "action": t.action,
+                    "status": t.status,
+                    "start": round(t.start - self.started, 3),
+                    "duration": round(t.duration, 3),
+                    "critical": id(t) in on_path,
+                }
+                for t in self.timings
+            ],
+            "timeline": [list(point) for point in self.timeline],
+        }
+
+    def write(self, fpath: Path) -> Path:
+        """
+        Writes the report as JSON.
+
+        Args:
+            fpath (Path): The path of the report. Parent directories are created if needed.
+
+        Returns:
+            Path: The path of the report.
+        """
+        fpath = Path(fpath)
+        fpath.parent.mkdir(parents=True, exist_ok=True)
+        fpath.write_text(json.dumps(self.to_dict(), indent=2))
+        return fpath
+
+    def format_top(self, n: int = 10) -> str:
+        """
+        Renders the slowest operations as a table, followed by the totals.
+
+        Args:
+            n (int): The number of operations listed.
+
+        Returns:
+            str: The table.
+        """
+        on_path = {id(t) for t in self.critical_path}
+        slowest = sorted(self.timings, key=lambda t: t.duration, reverse=True)[:n]
+
+        header = ["RESOURCE", "PHASE", "ACTION", "START", "DURATION", "CRITICAL"]
+        rows = [header]
+        for t in slowest:
+            rows.append(
+                [
+                    t.address,
+                    t.phase,
+                    t.action or "-",
+                    f"+{t.start - self.started:.1f}s",
+                    f"{t.duration:.1f}s"
+                    + (" (errored)" if t.status == "errored" else ""),
+                    "*" if id(t) in on_path else "",
+                ]
+            )
+
+        widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+        lines = [
+            "  ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip()
+            for row in rows
+        ]
+        lines.append("")
+        lines.append(
+            f"Wall time {self.wall_time:.1f}s, critical path {self.critical_path_time:.1f}s "
+            f"over {len(self.critical_path)} operation(s), peak concurrency "
+            f"{self.peak_concurrency}/{self.parallelism}, utilization {self.utilization:.0%}"
+        )
+        return "\n".join(lines)
@@ -0,0 +1,123 @@
+import json
+import pytest
+from pathlib import Path
+from .terraform_exec import IsFlagged, Terraform
+from .terraform_timings import TimingsCollector, TimingsReport
+
+TESTDATA = Path(__file__).parent / "testdata"
+APPLY_EVENTS = TESTDATA / "terraform_apply_events.jsonl"
+PLAN_EVENTS = TESTDATA / "terraform_plan_events.jsonl"
+
+
+@pytest.fixture
+def apply_report():
+    yield TimingsCollector.from_file(APPLY_EVENTS).report()
+
+
+def test_resource_durations(apply_report):
+    durations = {t.address: round(t.duration, 2) for t in apply_report.timings}
+    assert durations == {
+        "azurerm_resource_group.rg": 2.5,
+        "module.network.azurerm_virtual_network.vnet": 10.0,
+        "azurerm_storage_account.sa": 28.0,
+        "azurerm_key_vault.kv": 2.47,
+        'module.network.azurerm_subnet.subnet["aks"]': 4.0,
+        "azurerm_kubernetes_cluster.aks": 60.0,
+    }
+    statuses = {t.address: t.status for t in apply_report.timings}
+    assert statuses["azurerm_key_vault.kv"] == "errored"
+    assert {t.action for t in apply_report.timings} == {"create"}
+
+
+def test_critical_path(apply_report):
+    # the storage account ran longest but in parallel with the chain that bounded the apply
+    assert [t.address for t in apply_report.critical_path] == [
+        "azurerm_resource_group.rg",
+        "module.network.azurerm_virtual_network.vnet",
+        'module.network.azurerm_subnet.subnet["aks"]',
+        "azurerm_kubernetes_cluster.aks",
+    ]
+    assert apply_report.wall_time == pytest.approx(76.53)
+    assert apply_report.critical_path_time == pytest.approx(76.5)
+
+
+def test_concurrency_timeline(apply_report):
+    assert apply_report.timeline == [
+        (0.0, 1),
+        (2.5, 0),
+        (2.51, 1),
+        (2.52, 2),
+        (2.53, 3),
+        (5.0, 2),
+        (12.51, 1),
+        (12.52, 2),
+        (16.52, 1),
+        (16.53, 2),
+        (30.52, 1),
+        (76.53, 0),
+    ]
+    assert apply_report.peak_concurrency == 3
+    assert apply_report.utilization == pytest.approx(106.97 / (76.53 * 10))
+
+
+def test_report_outputs(apply_report, tmpdir):
+    report = json.loads(apply_report.write(Path(tmpdir) / "t.json").read_text())
+    assert report["critical_path"][-1] == "azurerm_kubernetes_cluster.aks"
+    assert report["resources"][0] == {
+        "address": "azurerm_resource_group.rg",
+        "phase": "apply",
+        "action": "create",
+        "status": "complete",
+        "start": 0.0,
+        "duration": 2.5,
+        "critical": True,
+    }
+
+    table = apply_report.format_top(2).splitlines()
+    assert table[0].split() == [
+        "RESOURCE",
+        "PHASE",
+        "ACTION",
+        "START",
+        "DURATION",
+        "CRITICAL",
+    ]
+    assert table[1].split() == [
+        "azurerm_kubernetes_cluster.aks",
+        "apply",
+        "create",
+        "+16.5s",
+        "60.0s",
+        "*",
+    ]
+    assert table[2].split()[0] == "azurerm_storage_account.sa"
+    assert table[-1].startswith("Wall time 76.5s, critical path 76.5s over 4")
+
+
+def test_refresh_timings_and_unfinished_operations():
+    lines = PLAN_EVENTS.read_text().splitlines()
+    collector = TimingsCollector.from_lines(lines[:-2])
+    # the last refresh has not completed yet
+    assert len(collector.report().timings) == 2
+
+    report = TimingsCollector.from_lines(lines).report()
+    assert {t.phase for t in report.timings} == {"refresh"}
+    assert report.critical_path[-1].address == "azurerm_storage_account.sa"
+    assert TimingsReport([]).wall_time == 0.0
+
+
+def test_collects_while_terraform_runs(tmpdir):
+    tf_bin = Path(tmpdir) / "terraform"
+    # replays recorded events, with -json only
+    tf_bin.write_text(
+        '#!/bin/sh\ncase "$*" in *-json*) cat "%s" ;; *) echo "Apply complete!" ;; esac\n'
+        % APPLY_EVENTS
+    )
+    tf_bin.chmod(0o755)
+    tf = Terraform(terraform_bin_path=str(tf_bin), working_dir=str(tmpdir))
+
+    collector = TimingsCollector()
+    ret_code, _, _ = tf.apply(json=IsFlagged, on_line=[collector])
+
+    assert ret_code == 0
+    assert len(collector.report().timings) == 6
@@ -25,6 +25,12 @@ Classes:
         read_root(self) -> None:
             Reads the root directory and builds a tree of file paths and contents.
             
+        collect_tokens(self) -> Set[str]:
+            Returns the set of token names referenced across the tree.
+            
+        _render(self, tokens: Dict[str, str]) -> Tuple[Dict[str, str], Set[str]]:
+            Substitutes all tokens in a single pass per file and reports the ones that could not be resolved.
+            
         replace_tokens(self, tokens: Dict[str, str]) -> Dict[str, str]:
             Replaces all the specified tokens in the parsed content and returns a dictionary with updated contents.
             
@@ -36,6 +42,9 @@ Classes:
             
         dump_to(self, tree: Dict[str, str], dirpath: Path, unique: bool) -> Path:
             Dumps the parsed content into a directory and returns the path of the dumped directory.
+            
+        sync_to(self, tree: Dict[str, str], dirpath: Path) -> Path:
+            Rewrites only the changed files of a long-lived directory, keeping anything it did not render.
         
         Note:
             When calling the `replace_tokens`, `validate_tokens`, or `replace_and_validate_tokens` methods, the `tree` attribute of the `Tokenizer` instance must first be populated with content by calling the `read_root` method.
@@ -47,7 +56,7 @@ Constants:
     _TOKEN_RE: A regular expression object used to parse tokens from the content.
 """
 from . import logger
-from typing import Dict, Set
+from typing import Dict, Match, Set, Tuple
 from pathlib import Path
 
 import re
@@ -56,6 +65,7 @@ import shutil
 
 
 _TOKEN_RE = re.compile(r"{{__([^\n\r\t, ]*?)__}}")
+_RENDERED_MANIFEST = ".cloudforge-rendered"
 
 
 class UnparsedTokensError(Exception):
@@ -84,10 +94,13 @@ class Tokenizer:
 
     Methods:
         read_root(): Traverses the root directory and reads the content of the files.
+        collect_tokens() -> Set[str]: Collects the names of all tokens referenced in the tree.
+        substitute(content: str, tokens: Dict[str, str]) -> str: Replaces tokens in a single string.
         replace_tokens(tokens: Dict[str, str]) -> Dict[str, str]: Replaces tokens in the parsed content with their corresponding values.
         validate_tokens(parsed_tree: Dict[str, str]) -> Set[str]: Validates whether all the tokens in the parsed content are used.
         replace_and_validate_tokens(tokens: Dict[str, str]) -> Dict[str, str]: Replaces tokens in the parsed content and validates whether all the tokens are used.
         dump_to(tree: Dict[str, str], dirpath: Path, unique: bool) -> Path: Dumps the parsed content of files to a new directory.
+        sync_to(tree: Dict[str, str], dirpath: Path) -> Path: Rewrites only the changed files of a long-lived directory.
 
     Constants:
         _TOKEN_RE: A regular expression object used to parse tokens from the content.
@@ -132,6 +145,66 @@ class Tokenizer:
         self._traverse_directory(self.root_dir, self.ext)
         return self
 
+    def collect_tokens(self) -> Set[str]:
+        """Collects the names of all tokens referenced in the tree.
+
+        Returns:
+            Set[str]: A set of token names, without the surrounding `{{__` and `__}}`.
+        """
+        names: Set[str] = set()
+        for fcontent in self.tree.values():
+            names.update(_TOKEN_RE.findall(fcontent))
+        return names
+
+    @staticmethod
+    def substitute(content: str, tokens: Dict[str, str]) -> str:
+        """Replaces tokens in a single string, e.g. a file outside of the tree.
+
+        Args:
+            content (str): The content holding the tokens.
+            tokens (Dict[str, str]): A dictionary of token-value pairs to replace.
+
+        Returns:
+            str: The content, tokens without a value left untouched.
+        """
+
+        def _substitute(match: Match) -> str:
+            value = tokens.get(match.group(1))
+            return match.group(0) if value is None else value
+
+        return _TOKEN_RE.sub(_substitute, content)
+
+    def _render(self, tokens: Dict[str, str]) -> Tuple[Dict[str, str], Set[str]]:
+        """Substitutes tokens in a single pass over each file.
+
+        Every `{{__NAME__}}` occurrence is matched once and looked up in `tokens`,
+        so the cost is proportional to the size of the tree rather than to the
+        number of tokens supplied. Occurrences without a matching token are left
+        untouched and reported back.
+
+        Args:
+            tokens (Dict[str, str]): A dictionary of token-value pairs to replace.
+
+        Returns:
+            Tuple[Dict[str, str], Set[str]]: The parsed tree and the set of token names that could not be resolved.
+        """
+        tree_parsed: Dict[str, str] = {}
+        missing: Set[str] = set()
+
+        def _substitute(match: Match) -> str:
+            name = match.group(1)
+            value = tokens.get(name)
+            if value is None:
+                missing.add(name)
+                return match.group(0)
+            return value
+
+        for fpath, fcontent in self.tree.items():
+            tree_parsed[fpath] = _TOKEN_RE.sub(_substitute, fcontent)
+
+        logger.debug(f"Unresolved tokens: {missing}")
+        return tree_parsed, missing
+
     def replace_tokens(self, tokens: Dict[str, str]) -> Dict[str, str]:
         """Replaces tokens in the parsed content with their corresponding values.
 
@@ -141,16 +214,7 @@ class Tokenizer:
         Returns:
             Dict[str, str]: A dictionary of file paths and parsed content.
         """
-        tree_parsed: Dict[str, str] = {}
-        for fpath, fcontent in self.tree.items():
-            parsed_content = fcontent[:]  # create a copy of content to mutate
-            for token, value in tokens.items():
-                pattern = "{{__" + token + "__}}"
-                if pattern in fcontent:
-                    logger.debug(f"Replacing token: {pattern}")
-                    parsed_content = parsed_content.replace(pattern, value, -1)
-
-            tree_parsed[fpath] = parsed_content
+        tree_parsed, _ = self._render(tokens)
         return tree_parsed
 
     def validate_tokens(self, parsed_tree: Dict[str, str]) -> Set[str]:
@@ -171,6 +235,9 @@ class Tokenizer:
     def replace_and_validate_tokens(self, tokens: Dict[str, str]) -> Dict[str, str]:
         """Replaces tokens in the parsed content and validates whether all the tokens are used.
 
+        Unresolved tokens are collected during substitution, so the parsed tree
+        does not need to be scanned a second time.
+
         Args:
             tokens (Dict[str, str]): A dictionary of token-value pairs to replace.
 
@@ -180,8 +247,7 @@ class Tokenizer:
         Returns:
             Dict[str, str]: A dictionary of file paths and parsed content.
         """
-        parsed_tree = self.replace_tokens(tokens)
-        errors = self.validate_tokens(parsed_tree)
+        parsed_tree, errors = self._render(tokens)
         if errors:
             raise UnparsedTokensError("Unused tokens: %s" % errors)
         return parsed_tree
@@ -222,6 +288,51 @@ class Tokenizer:
             new_path_obj.write_text(fcontent)
         return dirpath
 
+    def sync_to(self, tree: Dict[str, str], dirpath: Path) -> Path:
+        """Synchronizes the parsed content of files into a long-lived directory.
+
+        Unlike `dump_to`, the directory is not wiped: only files whose content
+        changed are rewritten, and files rendered by a previous sync that are no
+        longer part of the tree are removed. Anything else in the directory,
+        e.g. `.terraform/` or `.terraform.lock.hcl`, is left untouched.
+
+        Args:
+            tree (Dict[str,str]): A dictionary of file paths and parsed content.
+            dirpath (pathlib.Path): The path of the directory to synchronize the parsed content to.
+
+        Returns:
+            pathlib.Path: The path of the synchronized directory.
+        """
+        dirpath.mkdir(parents=True, exist_ok=True)
+        manifest = dirpath / _RENDERED_MANIFEST
+
+        previous: Set[str] = set()
+        if manifest.is_file():
+            previous = set(manifest.read_text(encoding="utf-8").splitlines())
+
+        root_dir = self.root_dir.absolute()
+        rendered: Set[str] = set()
+        for fpath, fcontent in tree.items():
+            relpath = Path(fpath).relative_to(root_dir).as_posix()
+            rendered.add(relpath)
+            new_path_obj = dirpath / relpath
+
+            if new_path_obj.is_file() and (
+                new_path_obj.read_text(encoding="utf-8") == fcontent
+            ):
+                continue
+
+            logger.info(f"[{fpath}]-->[{new_path_obj}]")
+            new_path_obj.parent.mkdir(parents=True, exist_ok=True)
+            new_path_obj.write_text(fcontent, encoding="utf-8")
+
+        for relpath in previous - rendered:
+            logger.info(f"Removing stale file: [{dirpath / relpath}]")
+            (dirpath / relpath).unlink(missing_ok=True)
+
+        manifest.write_text("\n".join(sorted(rendered)), encoding="utf-8")
+        return dirpath
+
 
 if __name__ == "__main__":
     t = Tokenizer(root_dir=Path(__file__).parent.parent / ".tftest", ext="tf")
@@ -64,3 +64,55 @@ def test_tokenizer_dump_to(test_files):
         assert (target_dir / "test1.txt").read_text() == "Hello, Alice!"
         assert (target_dir / "test2.txt").read_text() == "Alice, how are you?"
         assert (target_dir / "subdir/test3.txt").read_text() == "Alice"
+
+
+def test_tokenizer_reports_missing_tokens(test_files):
+    root_dir, files = test_files
+    (root_dir / "test4.txt").write_text("{{__name__}} lives in {{__city__}}")
+    tokenizer = Tokenizer(root_dir=root_dir, ext="txt")
+    tokenizer.read_root()
+    parsed_tree, missing = tokenizer._render({"name": "Alice", "unused": "x"})
+    assert parsed_tree[str(root_dir / "test4.txt")] == "Alice lives in {{__city__}}"
+    assert missing == {"city"}
+    with pytest.raises(UnparsedTokensError, match="city"):
+        tokenizer.replace_and_validate_tokens({"name": "Alice"})
+
+
+def test_tokenizer_does_not_expand_token_values(test_files):
+    root_dir, files = test_files
+    tokenizer = Tokenizer(root_dir=root_dir, ext="txt")
+    tokenizer.read_root()
+    parsed_tree = tokenizer.replace_tokens({"name": "{{__other__}}", "other": "Bob"})
+    assert parsed_tree[str(root_dir / "test1.txt")] == "Hello, {{__other__}}!"
+
+
+def test_tokenizer_collect_tokens(test_files):
+    root_dir, files = test_files
+    (root_dir / "test4.txt").write_text("{{__name__}} lives in {{__city__}}")
+    tokenizer = Tokenizer(root_dir=root_dir, ext="txt")
+    tokenizer.read_root()
+    assert tokenizer.collect_tokens() == {"name", "city"}
+
+
+def test_tokenizer_sync_to_keeps_unrendered_files(test_files, tmp_path):
+    root_dir, files = test_files
+    tokenizer = Tokenizer(root_dir=root_dir, ext="txt")
+    tokenizer.read_root()
+
+    workdir = tmp_path / "workdir"
+    tokenizer.sync_to(tokenizer.replace_tokens({"name": "Alice"}), workdir)
+    (workdir / ".terraform").mkdir()
+    (workdir / ".terraform" / "plugin.txt").write_text("provider")
+    (workdir / ".terraform.lock.hcl").write_text("lock")
+    unchanged_mtime = (workdir / "test2.txt").stat().st_mtime_ns
+
+    (root_dir / "test1.txt").unlink()
+    (root_dir / "test2.txt").write_text("{{__name__}}, how are you?")
+    tokenizer.read_root()
+    tokenizer.sync_to(tokenizer.replace_tokens({"name": "Alice"}), workdir)
+
+    assert not (workdir / "test1.txt").exists()
+    assert (workdir / "test2.txt").stat().st_mtime_ns == unchanged_mtime
+    assert (workdir / "subdir/test3.txt").read_text() == "Alice"
+    assert (workdir / ".terraform" / "plugin.txt").read_text() == "provider"
+    assert (workdir / ".terraform.lock.hcl").read_text() == "lock"
@@ -1,5 +1,6 @@
 """
-The utils module provides the EnvConfiguration class, which represents a configuration object for environment variables.
+The utils module provides the EnvConfiguration class, which represents a configuration object for environment variables,
+and the FileLock class, an advisory lock used to share on-disk caches between concurrent processes.
 
 The EnvConfiguration class provides methods to read and parse a configuration file or use environment variables, and to retrieve a dictionary of key-value pairs that have keys containing the substring "ARM_".
 
@@ -7,6 +8,9 @@ Example Usage:
 ec = EnvConfiguration("config.env")
 ec.read_and_parse()
 arms = ec.get_arms()
+
+with FileLock(Path("/tmp/cache.lock")):
+    ...
 """
 
 from . import logger
@@ -16,6 +20,110 @@ from pathlib import Path
 from copy import deepcopy
 
 import os
+import time
+
+try:
+    import fcntl
+except ImportError:  # windows
+    fcntl = None
+    import msvcrt
+
+
+class LockTimeoutError(Exception):
+    """
+    Exception raised when a FileLock could not be acquired in time.
+    """
+
+    pass
+
+
+class FileLock:
+    """
+    Advisory, inter-process lock backed by a lock file.
+
+    Args:
+        path (Path): The path of the lock file. Parent directories are created if needed.
+        timeout (float, optional): Seconds to wait for the lock. If `None`, waits forever.
+        shared (bool): Take a shared lock, held alongside other shared ones but not alongside an
+            exclusive one.
+
+    Raises:
+        LockTimeoutError: If the lock could not be acquired within `timeout` seconds.
+    """
+
+    _POLL_INTERVAL = 0.05
+    # windows has no shared locks: a shared lock holds one byte of this range, an exclusive lock all
+    _SHARED_SLOTS = 64
+
+    def __init__(
+        self, path: Path, timeout: Optional[float] = None, shared: bool = False
+    ) -> None:
+        self.path: Path = Path(path)
+        self.timeout: Optional[float] = timeout
+        self.shared: bool = shared
+        self._fd: Optional[int] = None
+        # the (offset, length) of the bytes locked on windows
+        self._region = (0, 1)
+
+    def _try_lock(self, fd: int) -> bool:
+        if fcntl is not None:
+            mode = fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX
+            try:
+                fcntl.flock(fd, mode | fcntl.LOCK_NB)
+            except OSError:
+                return False
+            return True
+
+        if self.shared:
+            regions = [(slot, 1) for slot in range(1, self._SHARED_SLOTS + 1)]
+        else:
+            regions = [(0, self._SHARED_SLOTS + 1)]
+        for offset, length in regions:
+            os.lseek(fd, offset, os.SEEK_SET)
+            try:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, length)
+            except OSError:
+                continue
+            self._region = (offset, length)
+            return True
+        return False
+
+    def acquire(self) -> "FileLock":
+        """Blocks until the lock is held by this instance."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        while not self._try_lock(fd):
+            if deadline is not None and time.monotonic() >= deadline:
+                os.close(fd)
+                raise LockTimeoutError("Timed out waiting for lock: %s" % self.path)
+            time.sleep(self._POLL_INTERVAL)
+
+        logger.debug(f"Acquired lock: [{self.path}]")
+        self._fd = fd
+        return self
+
+    def release(self) -> None:
+        """Releases the lock if it is held."""
+        if self._fd is None:
+            return
+
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        else:
+            offset, length = self._region
+            os.lseek(self._fd, offset, os.SEEK_SET)
+            msvcrt.locking(self._fd, msvcrt.LK_UNLCK, length)
+        os.close(self._fd)
+        self._fd = None
+        logger.debug(f"Released lock: [{self.path}]")
+
+    def __enter__(self) -> "FileLock":
+        return self.acquire()
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.release()
 
 
 class EnvConfiguration:
@@ -4,7 +4,7 @@ import pytest
 from tempfile import NamedTemporaryFile
 from unittest.mock import MagicMock
 
-from .utils import EnvConfiguration
+from .utils import EnvConfiguration, FileLock, LockTimeoutError
 
 
 def test_read_and_parse_no_file(monkeypatch):
@@ -102,3 +102,29 @@ def test_load_env_with_dir_missing_env(mock_config_file):
     config_dir.mkdir()
     with pytest.raises(ValueError):
         EnvConfiguration.load_env(target_dir_or_file=config_dir, env=None)
+
+
+def test_file_lock_serializes_holders(tmp_path):
+    lock_path = tmp_path / "locks" / "workdir.lock"
+    holder = FileLock(lock_path).acquire()
+
+    with pytest.raises(LockTimeoutError):
+        FileLock(lock_path, timeout=0.1).acquire()
+
+    holder.release()
+    with FileLock(lock_path, timeout=0.1):
+        pass
+
+
+def test_shared_file_locks_exclude_exclusive_holders(tmp_path):
+    lock_path = tmp_path / "blob.lock"
+    readers = [FileLock(lock_path, shared=True).acquire() for _ in range(2)]
+
+    with pytest.raises(LockTimeoutError):
+        FileLock(lock_path, timeout=0).acquire()
+
+    for reader in readers:
+        reader.release()
+    with FileLock(lock_path, timeout=0):
+        with pytest.raises(LockTimeoutError):
+            FileLock(lock_path, timeout=0.1, shared=True).acquire()